@@ -0,0 +1,282 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import pandas as pd
+from column_options import StackHandler
+from compiled_plan import CompiledPlan
+from io_backends import IOBackends
+from output_writer import OutputWriter
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+# compiled once per worker process by `_init_worker`
+_PLAN = None
+
+
+def _init_worker(config: dict):
+    global _PLAN
+    _PLAN = CompiledPlan.compile(config)
+
+
+def _render_file(input_file: str, output_file: str, output_format: str, options: dict, write_options: dict = None) -> dict:
+    """
+    Worker: reads, renders and writes one input file, returns its row count and timings.
+    The output goes through an `OutputWriter` with `write_options` (compression, partition_by),
+    so every output has the same columns whichever options are set.
+    """
+    start = time.perf_counter()
+    handler = StackHandler(input_file, **options)
+    read = time.perf_counter()
+    handler.load(_PLAN)
+    rendered = time.perf_counter()
+    if output_format == "pickle":
+        handler.output_df.to_pickle(output_file)
+    else:
+        # the pool already renders one file per process
+        handler.render_to_file(output_file, output_format, workers=1, **(write_options or {}))
+    return {
+        "rows": len(handler.df),
+        "read": read - start,
+        "render": rendered - read,
+        "write": time.perf_counter() - rendered,
+    }
+
+
+class BatchRenderer:
+    """
+    Renders many input files with one config in a bounded pool of worker processes.
+    The config is compiled once in every worker, so Python, pandas and the config
+    are paid for once per worker instead of once per file.
+    Reading, rendering and writing of different files overlap: every worker reads, renders and
+    writes its own file, and at most `2 * workers` files are in flight.
+    Outputs are written one per input into `output_dir`, or appended in input order to one
+    `combined` file by a writer thread while the next files render. Outputs can be `compression`
+    compressed and partitioned by a column (`partition_by`), see `OutputWriter`.
+    A failing file is reported in the results and does not stop the batch.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        inputs: list,
+        output_dir: str = None,
+        combined: str = None,
+        workers: int = None,
+        output_format: str = None,
+        source_column: str = None,
+        compression: str = None,
+        partition_by: str = None,
+        **options,
+    ):
+        if (output_dir is None) == (combined is None):
+            raise ValueError("Give either an `output_dir` (one output per input) or a `combined` output file")
+        # config errors are reported before any worker starts
+        CompiledPlan.compile(config)
+        self.config = config
+        self.inputs = self.expand(inputs)
+        self.output_dir = output_dir
+        self.combined = combined
+        self.workers = workers or os.cpu_count() or 1
+        self.output_format = output_format
+        self.source_column = source_column
+        self.write_options = {
+            k: v for k, v in (("compression", compression), ("partition_by", partition_by)) if v is not None
+        }
+        self.options = options
+        self.results = []
+
+    @staticmethod
+    def expand(inputs: list) -> list:
+        """Input files from file names, glob patterns and directories (all files with a known extension)"""
+        files = []
+        for pattern in inputs:
+            if os.path.isdir(pattern):
+                found = [
+                    os.path.join(pattern, x)
+                    for x in os.listdir(pattern)
+                    if os.path.splitext(x)[1].lower() in IOBackends.EXTENSIONS
+                ]
+            else:
+                found = glob.glob(pattern)
+            if not found:
+                raise ValueError(f"No input files found for `{pattern}`")
+            files += sorted(found)
+        return list(dict.fromkeys(files))
+
+    def output_files(self) -> dict:
+        """Output file per input file, named after the input in `output_dir`"""
+        extension = {v: k for k, v in reversed(list(IOBackends.EXTENSIONS.items()))}
+        outputs = {}
+        for input_file in self.inputs:
+            stem, input_extension = os.path.splitext(os.path.basename(input_file))
+            suffix = extension[self.output_format] if self.output_format else input_extension
+            if self.write_options.get("compression") and suffix == ".csv":
+                suffix += OutputWriter.EXTENSIONS[self.write_options["compression"]]
+            outputs[input_file] = os.path.join(self.output_dir, stem + suffix)
+        seen = {}
+        for input_file, output_file in outputs.items():
+            if output_file in seen:
+                raise ValueError(
+                    f"Inputs `{seen[output_file]}` and `{input_file}` would both be written to `{output_file}`"
+                )
+            seen[output_file] = input_file
+        return outputs
+
+    def run(self) -> list:
+        """Renders all inputs, returns a result per input with its `error` (None if it succeeded)"""
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if self.combined is None:
+                os.makedirs(self.output_dir, exist_ok=True)
+                outputs, output_format = self.output_files(), self.output_format
+            else:
+                outputs = {x: os.path.join(tmp_dir, f"{n}.pkl") for n, x in enumerate(self.inputs)}
+                output_format = "pickle"
+            self.results = [
+                {"input_file": x, "output_file": outputs[x], "error": None, "rows": 0} for x in self.inputs
+            ]
+            with ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.config,)
+            ) as pool, ThreadPoolExecutor(max_workers=1) as writer:
+                self._run(pool, writer, outputs, output_format)
+        self.seconds = time.perf_counter() - start
+        return self.results
+
+    def _run(self, pool, writer, outputs: dict, output_format: str):
+        pending = {}
+        todo = list(enumerate(self.inputs))
+        combine = _CombinedOutput(self.combined, self.output_format, self.source_column, self.write_options)
+        while todo or pending:
+            while todo and len(pending) < 2 * self.workers:
+                n, input_file = todo.pop(0)
+                future = pool.submit(
+                    _render_file, input_file, outputs[input_file], output_format, self.options, self.write_options
+                )
+                pending[future] = n
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                n = pending.pop(future)
+                result = self.results[n]
+                try:
+                    result.update(future.result())
+                    logger.info(f"  -> Rendered `{result['input_file']}`: {result['rows']} rows")
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                    logger.warning(f"  -> Failed `{result['input_file']}`: {result['error']}")
+                if self.combined is not None:
+                    combine.done(n, result)
+                    # outputs are appended in input order, as soon as all earlier files are finished
+                    writer.submit(combine.flush, self.results)
+        if self.combined is not None:
+            writer.submit(combine.close).result()
+            if combine.error is not None:
+                raise combine.error
+
+    def summary(self) -> str:
+        ok = [x for x in self.results if x["error"] is None]
+        rows = sum(x["rows"] for x in ok)
+        size = sum(os.path.getsize(x["input_file"]) for x in ok)
+        lines = [
+            f"{len(ok)} of {len(self.results)} files rendered in {self.seconds:.2f}s "
+            f"with {self.workers} workers: {rows:,} rows, {rows / self.seconds:,.0f} rows/s, "
+            f"{size / 1e6 / self.seconds:,.1f} MB/s read"
+        ]
+        for stage in ("read", "render", "write"):
+            seconds = sum(x.get(stage, 0) for x in ok)
+            lines.append(f"  {stage:<7} {seconds:>9.2f}s summed over workers")
+        for result in self.results:
+            if result["error"] is not None:
+                lines.append(f"FAILED {result['input_file']}: {result['error']}")
+        return "\n".join(lines)
+
+
+class _CombinedOutput:
+    """Appends rendered files to one output in input order through an `OutputWriter`, as they finish"""
+
+    def __init__(self, path: str, output_format: str, source_column: str, write_options: dict):
+        self.path = path
+        self.writer = OutputWriter(path, output_format, **write_options) if path is not None else None
+        self.source_column = source_column
+        self.finished = set()
+        self.next = 0
+        self.error = None
+
+    def done(self, n: int, result: dict):
+        self.finished.add(n)
+
+    def flush(self, results: list):
+        try:
+            while self.next in self.finished:
+                result = results[self.next]
+                self.next += 1
+                if result["error"] is not None:
+                    continue
+                df = pd.read_pickle(result["output_file"])
+                os.remove(result["output_file"])
+                if self.source_column:
+                    df[self.source_column] = result["input_file"]
+                self.writer.write(df.reset_index(drop=True))
+                result["output_file"] = self.path
+        except Exception as e:
+            self.error = e
+            raise
+
+    def close(self):
+        if self.writer is None:
+            return
+        if self.error is not None:
+            self.writer.abort()
+        else:
+            self.writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render many input files with one config")
+    parser.add_argument("config", help="json file with the stack configuration")
+    parser.add_argument("inputs", nargs="+", help="input files, glob patterns or directories")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--output-dir", help="write one output per input into this directory")
+    output.add_argument("--combined", help="append all outputs to this file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, by default one per CPU")
+    parser.add_argument("--input-format", choices=list(IOBackends.FORMATS))
+    parser.add_argument("--output-format", choices=list(IOBackends.FORMATS))
+    parser.add_argument("--source-column", help="with --combined, name of a column holding the input file")
+    parser.add_argument("--prune", action="store_true", help="only read the columns the config needs")
+    parser.add_argument("--compression", choices=list(OutputWriter.COMPRESSIONS))
+    parser.add_argument("--partition-by", help="write one output file per value of this (e.g. binned) column")
+    args = parser.parse_args(argv)
+
+    with open(args.config, "r") as config_file:
+        config = json.load(config_file)
+    options = {"prune": args.prune}
+    if args.input_format:
+        options["input_format"] = args.input_format
+    batch = BatchRenderer(
+        config,
+        args.inputs,
+        output_dir=args.output_dir,
+        combined=args.combined,
+        workers=args.workers,
+        output_format=args.output_format,
+        source_column=args.source_column,
+        compression=args.compression,
+        partition_by=args.partition_by,
+        **options,
+    )
+    batch.run()
+    print(batch.summary())
+    return 1 if any(x["error"] is not None for x in batch.results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
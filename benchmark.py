@@ -0,0 +1,205 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import pandas as pd
+from binner import Binner
+from col_creation_library import FunctionsCollection
+from column_options import StackHandler
+from date_parser import DateParser
+from dtype_converter import DtypeConverter
+from profiler import RenderProfiler
+from synthetic_data import SyntheticADT
+
+
+CONFIG = {
+    "nameSpace": {"pid": "pat_id"},
+    "columnOptions": [
+        {"name": "pat_id", "dtype": "str"},
+        {"name": "country", "dtype": "cat", "filters": {"__ne__": "es"}},
+        {
+            "name": "location_code",
+            "dtype": "int",
+            "bins": {"low": "[1..1000000)", "mid": "[1000000..5000000)", "high": "[5000000..]"},
+        },
+        {"name": "dob", "dtype": "date"},
+        {"name": "lot1", "dtype": "date"},
+        {"name": "aspirin", "dtype": "bool"},
+        {"name": "lot", "dtype": "int"},
+        {
+            "name": "age_at_lot1",
+            "dtype": "float",
+            "create_func": "get_age_float",
+            "create_args": ["lot1", "dob"],
+            "bins": {"<40": "(..40)", "40+": "[40..]"},
+            "bin_include": {"other": True, "null": True},
+        },
+        {"name": "next_lot1", "create_func": "next_lot_date", "create_args": ["lot", "lot1", "pid"]},
+        {
+            "name": "first_lot1",
+            "create_func": "col_for_lot",
+            "create_args": ["lot", "lot1", "pid"],
+            "create_kwargs": {"keep_key": 1},
+        },
+    ],
+}
+
+
+class Benchmark:
+    """
+    Throughput (rows per second) of every render stage and of the `FunctionsCollection`,
+    `Binner` and `DtypeConverter` functions on a synthetic extract of `rows` rows.
+    Every timing is the best of `repeat` runs, each starting with empty date parser caches.
+    """
+
+    # faster results are mostly timer noise and are not compared
+    MIN_SECONDS = 0.001
+
+    def __init__(self, rows: int, seed: int = 0, repeat: int = 3):
+        self.rows = rows
+        self.seed = seed
+        self.repeat = repeat
+
+    def _best(self, func) -> float:
+        best = float("inf")
+        for _ in range(self.repeat):
+            DateParser.clear_shared()
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def stages(self, input_file: str) -> dict:
+        """Seconds and rows in per stage of a full render, best of `repeat` renders"""
+        results = {}
+        for _ in range(self.repeat):
+            DateParser.clear_shared()
+            sh = StackHandler(input_file)
+            profiler = sh.profile(RenderProfiler(trace_memory=False))
+            sh.load(copy.deepcopy(CONFIG))
+            for stage in profiler.stages():
+                name = f"stage.{stage['stage']}"
+                if name not in results or stage["seconds"] < results[name]["seconds"]:
+                    results[name] = {"seconds": stage["seconds"], "rows": stage["rows_in"]}
+        return results
+
+    def functions(self, df: pd.DataFrame) -> dict:
+        """Seconds per function on typed columns of the synthetic extract"""
+        dob = DtypeConverter.convert(df["dob"], "date")
+        lot1 = DtypeConverter.convert(df["lot1"], "date")
+        location = DtypeConverter.convert(df["location_code"], "int")
+        age = FunctionsCollection.get_age_float(lot1, dob)
+        country = DtypeConverter.convert(df["country"], "cat")
+
+        def bins(series, dtype, bins):
+            return lambda: Binner().apply_bins(
+                series=series, dtype=dtype, bins=bins, bin_options={"other": True, "null": True}
+            )
+
+        cases = {
+            "convert.int": lambda: DtypeConverter.convert(df["location_code"], "int"),
+            "convert.bool": lambda: DtypeConverter.convert(df["aspirin"], "bool"),
+            "convert.date": lambda: DtypeConverter.convert(df["lot1"], "date"),
+            "convert.cat": lambda: DtypeConverter.convert(df["country"], "cat"),
+            "convert.str": lambda: DtypeConverter.convert(df["location_code"], "str"),
+            "functions.id": lambda: FunctionsCollection.id(df["pat_id"]),
+            "functions.copy_col": lambda: FunctionsCollection.copy_col(df["pat_id"]),
+            "functions.to_date_str": lambda: FunctionsCollection.to_date_str(
+                df["lot1"], input_format="%Y-%m-%d", output_format="%d.%m.%Y"
+            ),
+            "functions.get_age_float": lambda: FunctionsCollection.get_age_float(lot1, dob),
+            "functions.get_age_delta": lambda: FunctionsCollection.get_age_delta(lot1, dob),
+            "functions.next_lot_date": lambda: FunctionsCollection.next_lot_date(
+                df["lot"], lot1, df["pat_id"]
+            ),
+            "functions.col_for_lot": lambda: FunctionsCollection.col_for_lot(
+                df["lot"], lot1, df["pat_id"], 1
+            ),
+            "binner.int": bins(location, "int", CONFIG["columnOptions"][2]["bins"]),
+            "binner.float": bins(
+                age, "float", {"<40": "(..40)", "40..60": "[40..60)", "60+": "[60..]"}
+            ),
+            "binner.date": bins(lot1, "date", {"old": "(..2000-01-01)", "new": "[2000-01-01..]"}),
+            "binner.list": bins(country, "cat", {"uk": "[gb]", "central": "[fr,de]"}),
+        }
+        return {name: {"seconds": self._best(func), "rows": len(df)} for name, func in cases.items()}
+
+    def run(self) -> dict:
+        data = SyntheticADT(self.rows, seed=self.seed)
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory, "input.csv")
+            data.write_csv(input_file)
+            results = self.stages(input_file)
+        results.update(self.functions(data.frame()))
+        for result in results.values():
+            result["rows_per_second"] = result["rows"] / result["seconds"] if result["seconds"] else None
+        return {
+            "rows": self.rows,
+            "seed": self.seed,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "results": results,
+        }
+
+    @staticmethod
+    def compare(current: dict, baseline: dict, threshold: float = 0.2) -> list:
+        """
+        Benchmarks whose throughput dropped more than `threshold` (a fraction) below the baseline,
+        among those that took at least `MIN_SECONDS` in the baseline.
+        Returns `(name, baseline rows/s, current rows/s)` for every regression.
+        """
+        if current["rows"] != baseline["rows"]:
+            raise ValueError(
+                f"Baseline was run on {baseline['rows']} rows and this run on {current['rows']}, "
+                f"throughput is only comparable on the same number of rows"
+            )
+        regressions = []
+        for name, result in baseline["results"].items():
+            now = current["results"].get(name)
+            if now is None or not result["rows_per_second"] or not now["rows_per_second"]:
+                continue
+            if result["seconds"] < Benchmark.MIN_SECONDS:
+                continue
+            if now["rows_per_second"] < result["rows_per_second"] * (1 - threshold):
+                regressions.append((name, result["rows_per_second"], now["rows_per_second"]))
+        return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark render stages and column functions")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write the results as a baseline to this file")
+    parser.add_argument("--compare", help="baseline file to compare the results to")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed drop in throughput, as a fraction"
+    )
+    args = parser.parse_args(argv)
+
+    current = Benchmark(args.rows, seed=args.seed, repeat=args.repeat).run()
+    print(f"{'benchmark':<28} {'seconds':>9} {'rows/s':>14}")
+    for name, result in sorted(current["results"].items()):
+        print(f"{name:<28} {result['seconds']:>9.4f} {result['rows_per_second'] or 0:>14,.0f}")
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(current, baseline_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = Benchmark.compare(current, baseline, threshold=args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:,.0f} -> {after:,.0f} rows/s")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
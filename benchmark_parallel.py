@@ -0,0 +1,50 @@
+import argparse
+import os
+import tempfile
+import time
+from parallel import ParallelRenderer
+from synthetic_data import SyntheticADT
+
+
+CONFIG = {
+    "nameSpace": {"pid": "pat_id"},
+    "columnOptions": [
+        {"name": "pat_id", "dtype": "str"},
+        {"name": "country", "dtype": "cat", "filters": {"__ne__": "fr"}},
+        {"name": "dob", "dtype": "date"},
+        {"name": "lot1", "dtype": "date"},
+        {"name": "lot", "dtype": "int"},
+        {
+            "name": "age_at_lot1",
+            "dtype": "float",
+            "create_func": "get_age_float",
+            "create_args": ["lot1", "dob"],
+            "bins": {"<40": "(..40)", "40+": "[40..]"},
+        },
+        {"name": "next_lot1", "create_func": "next_lot_date", "create_args": ["lot", "lot1", "pid"]},
+    ],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times the partitioned render on 1..N workers")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = os.path.join(directory, "input.csv")
+        SyntheticADT(args.rows).write_csv(input_file)
+
+        print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+        single = None
+        for workers in range(1, args.max_workers + 1):
+            start = time.perf_counter()
+            ParallelRenderer(input_file, CONFIG, workers=workers).render()
+            elapsed = time.perf_counter() - start
+            single = single or elapsed
+            print(f"{workers:>8} {elapsed:>9.2f} {single / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
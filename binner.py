@@ -19,6 +19,261 @@ logger.addHandler(logging.StreamHandler())
 DTYPE_MAP = TypeInfo.DTYPE_MAP
 
 
+class CompiledBins:
+    """
+    Bin specs compiled once into sorted interval edges with open/closed flags
+    and a hash map for the values of list bins.
+    Bins are declared as intervals `[3..76)` (either end may be left empty) or lists `[3,7]`.
+    Overlapping bins raise a ValueError here, instead of the last bin silently winning.
+    """
+
+    INTERVAL_SEP = ".."
+    LIST_SEP = ","
+
+    def __init__(self, bins: dict, dtype: str):
+        self.dtype = dtype
+        self.labels = list(bins)
+
+        intervals = []
+        self.values = {}
+        for code, (label, obj) in enumerate(bins.items()):
+            obj = obj.strip()
+            if self.INTERVAL_SEP in obj:
+                intervals.append(self._parse_interval(label, obj) + (code,))
+            else:
+                for x in obj[1:-1].split(self.LIST_SEP):
+                    value = DTYPE_MAP[dtype](x)
+                    if value in self.values:
+                        raise ValueError(
+                            f"Bins `{self.labels[self.values[value]]}` and `{label}` overlap on `{x}`"
+                        )
+                    self.values[value] = code
+
+        # sorted by left edge, a closed left edge before an open one
+        intervals.sort(key=lambda x: (x[0], not x[2]))
+        self.lefts = [x[0] for x in intervals]
+        self.rights = [x[1] for x in intervals]
+        self.left_closed = np.array([x[2] for x in intervals], dtype=bool)
+        self.right_closed = np.array([x[3] for x in intervals], dtype=bool)
+        self.interval_codes = np.array([x[4] for x in intervals], dtype=int)
+        self._keys = {}
+        self._check_overlaps()
+
+    def _parse_interval(self, label: str, obj: str) -> tuple:
+        left_brace, right_brace = obj[0], obj[-1]
+        if left_brace not in "[(" or right_brace not in "])":
+            raise ValueError(f"Bin `{label}`: `{obj}` is not a valid interval")
+
+        left, right = obj[1:-1].split(self.INTERVAL_SEP)
+        try:
+            left_val = DTYPE_MAP[self.dtype](left) if left else TypeInfo.MIN_VALS[self.dtype]
+            right_val = DTYPE_MAP[self.dtype](right) if right else TypeInfo.MAX_VALS[self.dtype]
+        except KeyError:
+            raise ValueError(f"Bin `{label}`: open-ended intervals are not supported for `{self.dtype}`")
+
+        left_closed, right_closed = left_brace == "[", right_brace == "]"
+        if left_val > right_val or (
+            left_val == right_val and not (left_closed and right_closed)
+        ):
+            raise ValueError(f"Bin `{label}`: interval `{obj}` is empty")
+        return left_val, right_val, left_closed, right_closed
+
+    def _check_overlaps(self):
+        for i in range(1, len(self.lefts)):
+            touching = self.rights[i - 1] == self.lefts[i]
+            if self.rights[i - 1] > self.lefts[i] or (
+                touching and self.right_closed[i - 1] and self.left_closed[i]
+            ):
+                prev, cur = self.interval_codes[i - 1], self.interval_codes[i]
+                raise ValueError(f"Bins `{self.labels[prev]}` and `{self.labels[cur]}` overlap")
+
+        if self.values and self.lefts:
+            values = pd.Series(list(self.values))
+            mode = self._mode(values)
+            codes = self._interval_codes(self._as_keys(values, mode), mode)
+            if (codes >= 0).any():
+                value = values[codes >= 0].iloc[0]
+                raise ValueError(
+                    f"Bins `{self.labels[self.values[value]]}` and "
+                    f"`{self.labels[codes[codes >= 0][0]]}` overlap on `{value}`"
+                )
+
+    def _mode(self, series: pd.Series) -> str:
+        """
+        How values are compared: int64 nanoseconds, int64, float64 or Python objects.
+        Integers are compared as floats when an edge or a list value is not an integer (e.g. bins
+        `[0..2.5)` over a created int column, or the infinite ends of open `float` bins).
+        """
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return "date"
+        if pd.api.types.is_integer_dtype(series) and not series.hasnans:
+            return "int" if self._integral() else "float"
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            return "float"
+        return "object"
+
+    def _integral(self) -> bool:
+        """Whether every edge and list value is an integer that fits in int64"""
+        if "integral" not in self._keys:
+            edges = self.lefts + self.rights + list(self.values)
+            self._keys["integral"] = all(
+                isinstance(x, (int, np.integer))
+                or (isinstance(x, (float, np.floating)) and np.isfinite(x) and float(x).is_integer())
+                for x in edges
+            ) and all(-(2 ** 63) <= x < 2 ** 63 for x in edges)
+        return self._keys["integral"]
+
+    @staticmethod
+    def _as_keys(series: pd.Series, mode: str) -> np.ndarray:
+        if mode == "date":
+            return series.to_numpy(dtype="datetime64[ns]").view("i8")
+        if mode == "int":
+            return series.to_numpy(dtype="int64")
+        if mode == "float":
+            return series.to_numpy(dtype="float64", na_value=np.nan)
+        return series.to_numpy(dtype=object)
+
+    def _edges(self, mode: str) -> tuple:
+        """Interval edges and list values converted once per comparison mode"""
+        if mode not in self._keys:
+            convert = {
+                "date": lambda x: pd.Timestamp(x).value,
+                "int": int,
+                "float": float,
+                "object": lambda x: x,
+            }[mode]
+            dtype = {"date": "int64", "int": "int64", "float": "float64"}.get(mode, object)
+            self._keys[mode] = (
+                np.array([convert(x) for x in self.lefts], dtype=dtype),
+                np.array([convert(x) for x in self.rights], dtype=dtype),
+                pd.Index(np.array([convert(x) for x in self.values], dtype=dtype)),
+            )
+        return self._keys[mode]
+
+    def _interval_codes(self, keys: np.ndarray, mode: str) -> np.ndarray:
+        lefts, rights, _ = self._edges(mode)
+        codes = np.full(len(keys), -1)
+        if not len(lefts):
+            return codes
+
+        # only the last interval starting at or before a value, or the one before it
+        # (when the value sits on an open left edge), can contain it
+        last = np.searchsorted(lefts, keys, side="right") - 1
+        for cand in (last, last - 1):
+            valid = cand >= 0
+            cand = np.where(valid, cand, 0)
+            left, right = lefts[cand], rights[cand]
+            inside = (
+                valid
+                & ((keys > left) | ((keys == left) & self.left_closed[cand]))
+                & ((keys < right) | ((keys == right) & self.right_closed[cand]))
+            )
+            codes = np.where(inside & (codes < 0), self.interval_codes[cand], codes)
+        return codes
+
+    def codes(self, series: pd.Series) -> np.ndarray:
+        """Bin code for every value of the series in one pass, -1 for nulls and unbinned values"""
+        null = series.isnull().to_numpy()
+        codes = np.full(len(series), -1)
+        mode = self._mode(series)
+        keys = self._as_keys(series[~null], mode)
+
+        found = self._interval_codes(keys, mode)
+        if self.values:
+            value_codes = np.array(list(self.values.values()), dtype=int)
+            at = self._edges(mode)[2].get_indexer(keys)
+            found = np.where(at >= 0, value_codes[at], found)
+
+        codes[~null] = found
+        return codes
+
+    def apply(self, series: pd.Series, bin_options: dict) -> pd.Series:
+        """Returns the binned series as a Categorical with the bin names as categories"""
+        codes = self.codes(series)
+        labels = list(self.labels)
+
+        if bin_options.get("other"):
+            labels.append(Binner.OTHER_BIN_NAME)
+            codes[(codes < 0) & series.notnull().to_numpy()] = len(labels) - 1
+
+        if bin_options.get("null"):
+            labels.append(Binner.NULL_BIN_NAME)
+            codes[series.isnull().to_numpy()] = len(labels) - 1
+
+        return pd.Series(
+            pd.Categorical.from_codes(codes, categories=labels), index=series.index
+        )
+
+
+class BinIndex:
+    """
+    Bin -> row positions index of a binned series, built in one pass (factorize and a stable argsort).
+    The positions of all rows are stored once, grouped by bin, as one compact integer array;
+    `positions(bin)` is a view into it. Bin counts and cross-tab counts with another index over the
+    same rows come from the bin codes without touching the series again.
+    Nulls are kept as their own bin, reported under NaN when asked for.
+    """
+
+    def __init__(self, series: pd.Series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            self.labels = list(series.cat.categories)
+        else:
+            codes, uniques = pd.factorize(series)
+            self.labels = list(uniques)
+        self.rows = len(series)
+        self.index = series.index
+        dtype = np.int32 if self.rows < 2 ** 31 else np.int64
+        nulls = len(self.labels)
+        self.codes = np.where(codes < 0, nulls, codes).astype(dtype)
+        # a stable sort of codes of 16 bits or less is a linear-time radix sort
+        narrow = np.uint8 if nulls < 2 ** 8 else np.uint16 if nulls < 2 ** 16 else dtype
+        self.order = np.argsort(self.codes.astype(narrow), kind="stable").astype(dtype)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.codes, minlength=nulls + 1))])
+        self._codes = {label: n for n, label in enumerate(self.labels)}
+
+    def _code(self, label) -> int:
+        if pd.isnull(label):
+            return len(self.labels)
+        if label not in self._codes:
+            raise KeyError(f"Bin `{label}` is not known! Options are: {self.labels}")
+        return self._codes[label]
+
+    def positions(self, label) -> np.ndarray:
+        """Row positions of the bin, in row order"""
+        code = self._code(label)
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
+
+    def rows_of(self, label) -> pd.Index:
+        """Index labels of the rows of the bin"""
+        return self.index[self.positions(label)]
+
+    def _labels(self, dropna: bool) -> list:
+        return self.labels if dropna else self.labels + [np.nan]
+
+    def counts(self, dropna: bool = True) -> pd.Series:
+        """Rows per bin, empty bins included"""
+        labels = self._labels(dropna)
+        return pd.Series(np.diff(self.offsets)[: len(labels)], index=labels)
+
+    def crosstab(self, other: "BinIndex", dropna: bool = True) -> pd.DataFrame:
+        """Rows per pair of bins, with the bins of this index as rows and those of `other` as columns"""
+        if self.rows != other.rows or not self.index.equals(other.index):
+            raise ValueError("Cross-tab counts need two bin indexes over the same rows")
+        width = len(other.labels) + 1
+        pairs = self.codes.astype(np.int64) * width + other.codes
+        counts = np.bincount(pairs, minlength=(len(self.labels) + 1) * width).reshape(-1, width)
+        rows, columns = self._labels(dropna), other._labels(dropna)
+        return pd.DataFrame(counts[: len(rows), : len(columns)], index=rows, columns=columns)
+
+    def as_dict(self, remove_nan: bool = True, positions: bool = False) -> dict:
+        """Bin -> row index labels (or row positions) of every bin holding rows"""
+        labels = [x for x in self._labels(remove_nan) if len(self.positions(x))]
+        if positions:
+            return {label: self.positions(label) for label in labels}
+        return {label: self.rows_of(label) for label in labels}
+
+
 class Binner:
     BINNED_SUFFIX = "_binned"
     OTHER_BIN_NAME = "other"
@@ -93,28 +348,13 @@ class Binner:
             pd.Series, col.dtype, col.bins, col.bin_options
         )
 
-    def apply_bins(self, series: pd.Series, dtype, bins, bin_options) -> pd.Series:
-
-        # get indices
-        bin_index = self.get_bin_index_explicit(series, dtype, bins, bin_options)
-        binned_series = pd.Series(index=series.index)
-        # create the thingy
-        for key, idx in bin_index.items():
-            binned_series.loc[idx] = key
-
-        return binned_series
+    def compile_bins(self, bins: Dict, dtype) -> CompiledBins:
+        return CompiledBins(bins, dtype)
 
-    # so stuff to do ...
-    def unpack_bins(self, series: pd.Series, remove_nan=True) -> Dict:
-
-        if remove_nan:
-            bins = [x for x in series.unique() if not pd.isnull(x)]
-
-        else:
-            bins = series.unique()
-
-        bin_indexes = {}
-        for bin in bins:
-            bin_indexes[bin] = series[series == bin].index
+    def apply_bins(self, series: pd.Series, dtype, bins, bin_options) -> pd.Series:
+        """Assigns every value to its bin in a single pass, returns a Categorical series"""
+        return self.compile_bins(bins, dtype).apply(series, bin_options)
 
-        return bin_indexes
+    def unpack_bins(self, series: pd.Series, remove_nan=True, positions=False) -> Dict:
+        """Rows of every bin of a binned series, as index labels or (with `positions`) row positions"""
+        return BinIndex(series).as_dict(remove_nan=remove_nan, positions=positions)
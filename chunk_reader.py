@@ -0,0 +1,81 @@
+import logging
+import numpy as np
+import pandas as pd
+from io_backends import IOBackends
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class GroupedChunkReader:
+    """
+    Reads an input file (CSV, Parquet or Feather) in row chunks.
+    If a `group_key` is given, the rows of a group are never split across two chunks:
+    the trailing group of each chunk is held back and prepended to the next one.
+    This requires the rows of a group to be contiguous in the file (e.g. an extract sorted by patient).
+    """
+
+    def __init__(
+        self,
+        input_file: str,
+        chunksize: int,
+        group_key: str = None,
+        check_contiguous: bool = True,
+        input_format: str = None,
+        **read_kwargs,
+    ):
+        if not chunksize or chunksize < 1:
+            raise ValueError(f"Chunk size must be a positive integer, got `{chunksize}`")
+        self.input_file = input_file
+        self.chunksize = chunksize
+        self.group_key = group_key
+        self.check_contiguous = check_contiguous
+        self.reader = IOBackends.get(input_file, input_format)
+        self.read_kwargs = read_kwargs
+        self._seen_keys = set()
+
+    def _read(self):
+        return self.reader.iter_chunks(self.input_file, self.chunksize, **self.read_kwargs)
+
+    def _check(self, chunk: pd.DataFrame):
+        """Raises if a group already emitted in a previous chunk shows up again"""
+        keys = set(chunk[self.group_key].dropna().unique())
+        repeated = keys & self._seen_keys
+        if repeated:
+            raise ValueError(
+                f"Rows of group(s) {sorted(repeated)[:5]} are not contiguous in "
+                f"`{self.input_file}`, sort the input by `{self.group_key}` first"
+            )
+        self._seen_keys |= keys
+
+    def _emit(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        if self.group_key and self.check_contiguous:
+            self._check(chunk)
+        return chunk
+
+    def __iter__(self):
+        self._seen_keys = set()
+        carry = None
+
+        for chunk in self._read():
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+                carry = None
+
+            if self.group_key:
+                keys = chunk[self.group_key]
+                tail = keys.eq(keys.iloc[-1]) if pd.notnull(keys.iloc[-1]) else keys.isnull()
+                # the trailing run of the last key may continue in the next chunk
+                boundary = len(chunk) - np.logical_and.accumulate(tail.values[::-1]).sum()
+                carry = chunk.iloc[boundary:]
+                chunk = chunk.iloc[:boundary]
+
+            if len(chunk):
+                logger.info(f"  -> Read chunk of {len(chunk)} rows")
+                yield self._emit(chunk)
+
+        if carry is not None and len(carry):
+            logger.info(f"  -> Read chunk of {len(carry)} rows")
+            yield self._emit(carry)
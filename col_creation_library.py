@@ -1,22 +1,95 @@
+import dataclasses
+import functools
 import pandas as pd
 import datetime
 import numpy as np
+from date_parser import DateParser
+from dtype_converter import DtypeConverter
+
+
+@dataclasses.dataclass(frozen=True)
+class FunctionInfo:
+    """
+    What the render engine may assume about a parse or create function.
+    `kind`: "vectorized" functions take and return whole series; "elementwise" functions take and
+    return single values and are run once per distinct combination of argument values;
+    "group" functions need all rows of a group at once, the group key is argument `group_arg`.
+    `inputs` holds the dtype expected for every series argument (None for any dtype) and `output`
+    the dtype of the result. A `row_local` function computes every row from that row alone,
+    so its input can be filtered, chunked and partitioned freely.
+    `table_arg` names the keyword argument holding a secondary table of the stack (`ColumnStack.tables`):
+    the config gives the table name, the function gets the table's `TableIndex`.
+    """
+
+    name: str
+    kind: str = "vectorized"
+    inputs: tuple = ()
+    output: str = None
+    row_local: bool = True
+    group_arg: int = None
+    table_arg: str = None
+
+    KINDS = ("vectorized", "elementwise", "group")
+
+    def __post_init__(self):
+        if self.kind not in self.KINDS:
+            raise ValueError(f"Function kind `{self.kind}` is not known! Options are: {list(self.KINDS)}")
+        if self.kind == "group" and (self.group_arg is None or self.row_local):
+            raise ValueError(f"Group-wise function `{self.name}` needs a `group_arg` and is not row-local")
+
+
+def describe(
+    kind: str = "vectorized",
+    inputs: tuple = (),
+    output: str = None,
+    row_local: bool = None,
+    group_arg: int = None,
+    table_arg: str = None,
+):
+    """Declares the metadata of a function of the collection, see `FunctionInfo`"""
+
+    def decorator(func):
+        func.info = FunctionInfo(
+            name=func.__name__,
+            kind=kind,
+            inputs=tuple(inputs),
+            output=output,
+            row_local=kind != "group" if row_local is None else row_local,
+            group_arg=group_arg,
+            table_arg=table_arg,
+        )
+        return func
+
+    return decorator
 
 
 class FunctionsCollection:
     """
     A class holding generic aggregation functions.
+    Parse and create functions are looked up by name in `REGISTRY` with the `FunctionInfo`
+    declared by `describe`; functions from outside the collection are added with `register`.
     """
 
+    # name -> FunctionInfo of every parse and create function, filled by `_collect`
+    REGISTRY = {}
+
+    # create functions that need all the rows of a group at once,
+    # mapped to the position of the argument holding the group key
+    GROUP_FUNCS = {}
+
     @staticmethod
+    @describe(inputs=(None,))
     def id(col: pd.Series) -> pd.Series:
         return col
 
     # parsign functions -- all must start with pd.series.
     @staticmethod
+    @describe(inputs=("str",), output="str")
     def to_date_str(
         data: pd.Series, input_format: str, output_format: str
     ) -> pd.Series:
+        """Re-formats date strings, strings not in `input_format` and nulls become `nan`"""
+
         def convert(x):
             try:
                 date = datetime.datetime.strptime(x, input_format)
@@ -24,19 +97,30 @@ class FunctionsCollection:
             except ValueError:
                 return "nan"
 
-        return data.apply(convert)
+        # each distinct string is parsed once, strings the vectorized parse rejects keep `convert`
+        codes, uniques = DateParser.factorize(data)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        values, parsed = DateParser.shared([input_format]).parse_unique(uniques, counts=counts)
+        converted = pd.Series(values).dt.strftime(output_format).astype(object)
+        converted[~parsed] = [convert(x) for x in uniques[~parsed]]
+
+        converted = np.append(converted.to_numpy(), "nan")
+        return pd.Series(converted[codes], index=data.index)
 
     # non parsing functions
     @staticmethod
+    @describe(inputs=(None,))
     def copy_col(series: pd.Series) -> pd.Series:
         return series
 
     @staticmethod
+    @describe(inputs=("date", "date"), output="float")
     def get_age_float(date_: pd.Series, dob: pd.Series) -> pd.Series:
-        ds = date_.__sub__(dob)
-        return ds.apply(lambda x: float(x.days / 365.25))
+        """Age in years of 365.25 days, counting whole days"""
+        return (date_ - dob).dt.days / 365.25
 
     @staticmethod
+    @describe(inputs=("date", "date"), output="delta")
     def get_age_delta(date_: pd.Series, dob: pd.Series) -> pd.Series:
         return date_.__sub__(dob)
 
@@ -44,41 +128,123 @@ class FunctionsCollection:
 
         # 3.  creates a new columns for each treatment specifying the value of a patient col at that treatmentr
 
+    # group-wise functions: build a positional frame, sort it once (stable) and use
+    # groupby shift/transform, then put the results back in row order with `sort_index`.
+    # never loop over the groups in Python.
+    @staticmethod
+    def _positional(**columns: pd.Series) -> pd.DataFrame:
+        """Builds a frame on a RangeIndex from aligned series"""
+        return pd.DataFrame({name: col.to_numpy() for name, col in columns.items()})
+
     # replace_val_with_keep_key_val_in_each_group
     @staticmethod
+    @describe(kind="group", inputs=("int", "date", None), output="date", group_arg=2)
     def next_lot_date(
         lots: pd.Series, date: pd.Series, patient_id: pd.Series
     ) -> pd.Series:
+        """For every row, the date of the patient's next line of therapy (NaT for the last one)"""
+        df = FunctionsCollection._positional(lot=lots, date=date, pid=patient_id)
+        df = df.sort_values(by="lot", kind="mergesort")
 
-        df = pd.concat([lots, date, patient_id], axis=1)
-        df.columns = ["lot", "date", "pid"]
-        groups = df.groupby(patient_id)
+        new_date = df.groupby("pid", sort=False)["date"].shift(-1).sort_index()
+        new_date.index = lots.index
+        return DtypeConverter.convert(new_date, "date")
 
-        for group_at_idx in groups:
-            df_at_idx = group_at_idx[1]
-            sorted = df_at_idx.sort_values(by="lot")
+    @staticmethod
+    @describe(kind="group", inputs=(None, None, None), group_arg=2)
+    def col_for_lot(
+        keys: pd.Series, vals: pd.Series, idx: pd.Series, keep_key: int
+    ) -> pd.Series:
+        """For every row, the value of `vals` at the group's (last) row where `keys` equals `keep_key`"""
+        df = FunctionsCollection._positional(key=keys, idx=idx)
+        df["pos"] = np.where(df["key"] == keep_key, df.index, -1)
+        df = df[df["idx"].notnull()]
 
-            shifted_dates = list(sorted["date"])[1:] + [pd.NaT]
-            df.loc[sorted.index, "new_date"] = shifted_dates
+        picked = np.full(len(idx), -1)
+        picked[df.index] = df.groupby("idx", sort=False)["pos"].transform("max")
 
-        res_series = df["new_date"].apply(lambda x: pd.to_datetime(x))
+        res_series = vals.reset_index(drop=True).reindex(picked)
+        res_series.index = idx.index
         return res_series
 
+    # join functions: `table` is the `TableIndex` of a secondary input, probed with the keys of every row
     @staticmethod
-    def col_for_lot(
-        keys: pd.Series, vals: pd.Series, idx: pd.Series, keep_key: int
+    @describe(inputs=(None,), table_arg="table")
+    def lookup(keys: pd.Series, table, column: str, pick: str = "last") -> pd.Series:
+        """For every row, `column` of the table row with the same key (the last or first one), null if none"""
+        return table.take(column, table.positions(keys, pick=pick), keys.index)
+
+    @staticmethod
+    @describe(inputs=(None,), table_arg="table")
+    def value_at_key(
+        keys: pd.Series, table, column: str, match_column: str, match_value, pick: str = "last"
     ) -> pd.Series:
+        """
+        For every row, `column` of the table row with the same key where `match_column` equals
+        `match_value` (the last or first one), null if none; `col_for_lot` across tables
+        """
+        positions = table.positions(keys, pick=pick, where=(match_column, match_value))
+        return table.take(column, positions, keys.index)
+
+    @classmethod
+    def register(cls, func, name: str = None, **info):
+        """
+        Adds a function to the collection under `name` (by default its own name),
+        `info` is passed on to `describe`. Returns the function, so it can be used as a decorator.
+        """
+        name = name or func.__name__
+        # any attribute of the collection, e.g. `register` or `resolve`, is taken
+        taken = hasattr(cls, name) and not (name in cls.REGISTRY and getattr(cls, name) is func)
+        if name.startswith("_") or taken:
+            raise ValueError(f"Function name `{name}` is private or already taken")
+        described = describe(**info)(func)
+        described.info = dataclasses.replace(described.info, name=name)
+        setattr(cls, name, staticmethod(described))
+        cls._add(name, described.info)
+        return func
+
+    @classmethod
+    def _add(cls, name: str, info: FunctionInfo):
+        cls.REGISTRY[name] = info
+        if info.group_arg is not None:
+            cls.GROUP_FUNCS[name] = info.group_arg
+
+    @classmethod
+    def _collect(cls):
+        for name, member in vars(cls).items():
+            func = getattr(member, "__func__", None)
+            if isinstance(member, staticmethod) and hasattr(func, "info"):
+                cls._add(name, func.info)
+
+    @classmethod
+    def info(cls, name: str) -> FunctionInfo:
+        if name not in cls.REGISTRY:
+            raise KeyError(f"Function `{name}` is not known! Options are: {sorted(cls.REGISTRY)}")
+        return cls.REGISTRY[name]
+
+    @classmethod
+    def resolve(cls, name: str):
+        """The function to call with series arguments, elementwise functions are batched"""
+        func = getattr(cls, name)
+        if cls.info(name).kind == "elementwise":
+            return cls._batched(func)
+        return func
 
-        df = pd.concat([keys, vals], axis=1)
-        df.columns = ["key", "val"]
-        res_series = pd.Series([np.nan for x in idx], index=idx.index)
-        groups = df.groupby(idx)
+    @staticmethod
+    def _batched(func):
+        """Runs an elementwise function once per distinct combination of argument values"""
 
-        for group_at_idx in groups:
-            df_at_idx = group_at_idx[1]
+        @functools.wraps(func)
+        def batched(*series: pd.Series, **kwargs) -> pd.Series:
+            frame = pd.DataFrame({n: x.to_numpy() for n, x in enumerate(series)})
+            codes = frame.groupby(list(frame.columns), dropna=False, sort=False).ngroup().to_numpy()
+            first = np.unique(codes, return_index=True)[1]
+            values = [func(*row, **kwargs) for row in frame.to_numpy(dtype=object)[first]]
+            result = np.empty(len(values), dtype=object)
+            result[:] = values
+            return pd.Series(result[codes], index=series[0].index).infer_objects()
 
-            for (_, row) in df_at_idx.iterrows():
-                if row["key"] == keep_key:
-                    res_series[df_at_idx.index] = row["val"]
+        return batched
 
-        return res_series
+
+FunctionsCollection._collect()
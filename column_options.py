@@ -1,18 +1,33 @@
+import copy
 import logging
 import datetime
+import time
 from col_creation_library import FunctionsCollection
 import dateutil.parser
 
 import numpy as np
-from marshmallow_dataclass import dataclass, Dict, List, Any
+from marshmallow_dataclass import add_schema, dataclass, Dict, List, Any
 from marshmallow import post_dump
+import dataclasses
 from dataclasses import field
 from type_info import TypeInfo
 import functools
 from distutils.util import strtobool
 
 # import sys
-from binner import Binner
+from binner import BinIndex, Binner, CompiledBins
+from chunk_reader import GroupedChunkReader
+from deferred_frame import DeferredFrame
+from dtype_converter import DtypeConverter
+from dtype_inference import DtypeInference
+from io_backends import IOBackends
+from output_writer import OutputWriter
+from planner import ExecutionPlan
+from profiler import NO_SPAN, RenderProfiler
+from sampling import GroupSample
+from spill import HashPartitioner
+from stage_cache import StageCache
+from table_index import TableIndex
 import pandas as pd
 
 
@@ -22,10 +37,27 @@ logger.addHandler(logging.StreamHandler())
 DTYPE_MAP = TypeInfo.DTYPE_MAP
 
 
+def profiled(stage: str):
+    """Records a span for a render stage when the handler has a profiler"""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.profiler is None:
+                return method(self, *args, **kwargs)
+            with self._span(stage):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
 # age at applied to itself
 
 
-@dataclass
+@add_schema
+@dataclasses.dataclass(slots=True)
 class Column:
     name: str
     dtype: str = None
@@ -40,13 +72,47 @@ class Column:
     create_args: List[str] = field(default_factory=list)
     create_kwargs: Dict[str, Any] = field(default_factory=dict)
 
+    # render state, not part of the config
+    idx: int = field(default=None, init=False, repr=False, compare=False)
+    renamed: bool = field(default=False, init=False, repr=False, compare=False)
+    parsed: bool = field(default=False, init=False, repr=False, compare=False)
+    binned: bool = field(default=False, init=False, repr=False, compare=False)
+    filtered: bool = field(default=False, init=False, repr=False, compare=False)
+    dtype_normalized: bool = field(default=False, init=False, repr=False, compare=False)
+    created: bool = field(default=False, init=False, repr=False, compare=False)
+    stack: "ColumnStack" = field(default=None, init=False, repr=False, compare=False)
+    # bin -> rows index of the rendered bins, dropped whenever the column is (re-)binned
+    bin_index: BinIndex = field(default=None, init=False, repr=False, compare=False)
+
     SKIP_VALUES = [None, "", [], {}]
 
-    def __post_init__(self):
-        self.idx = None
+    # attributes that decide whether a column has work left in a render stage
+    TRACKED = frozenset(
+        (
+            "parse_funcs",
+            "parsed",
+            "create_func",
+            "created",
+            "dtype",
+            "dtype_normalized",
+            "bins",
+            "binned",
+            "filters",
+            "filtered",
+        )
+    )
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name == "binned":
+            object.__setattr__(self, "bin_index", None)
+        if name in Column.TRACKED and getattr(self, "stack", None) is not None:
+            self.stack.track(self)
+
+    def reset_state(self):
+        """Marks the column as not processed by any of the render stages"""
         self.parsed = False
         self.binned = False
-        self.renamed = False
         self.filtered = False
         self.dtype_normalized = False
         self.created = False
@@ -55,7 +121,7 @@ class Column:
     def remove_empty(self, data, **kwargs):
         """Removes empty values from the dumped dict"""
         return {
-            key: value for key, value in data.items() if value not in self.SKIP_VALUES
+            key: value for key, value in data.items() if value not in Column.SKIP_VALUES
         }
 
     def set_dtype(self, dtype: str):
@@ -75,56 +141,160 @@ class Column:
 class ColumnStack:
     nameSpace: Dict[str, str] = field(default_factory=dict)
     columnOptions: List[Column] = field(default_factory=list)
+    outputColumns: List[str] = field(default_factory=list)
+    # secondary inputs for join functions: name -> `TableIndex` options (`input_file`, `key`, ...)
+    tables: Dict[str, Dict[str, Any]] = field(default_factory=dict)
 
     def __post_init__(self):
         """
-        Post-init makes sure the `self.columnOptions` only contains Column objects
+        Post-init makes sure the `self.columnOptions` only contains Column objects,
+        and indexes them by name and by the render stages they still have to go through.
         """
 
         self.nameSpaced: bool = False
+        self.index = {}
+        self.positions = {}
+        self.pending = {stage: {} for stage in self.STAGES}
+        self.unsorted = set()
         for n, col in enumerate(self.columnOptions):
             if not isinstance(col, Column):
                 self.columnOptions[n] = Column(col)
+            self._add(self.columnOptions[n], n)
+
+    # render stages a column can have pending work in, with the check for it
+    STAGES = {
+        "unparsed": lambda x: bool(x.parse_funcs) and not x.parsed,
+        "uncreated": lambda x: bool(x.create_func) and not x.created,
+        "untyped": lambda x: bool(x.dtype) and not x.dtype_normalized,
+        "unbinned": lambda x: bool(x.bins) and not x.binned,
+        "unfiltered": lambda x: bool(x.filters) and not x.filtered,
+    }
+
+    def _add(self, col: Column, position: int):
+        # a repeated name replaces the earlier column, as it did in `as_dict`
+        previous = self.index.get(col.name)
+        if previous is not None and previous is not col:
+            previous.stack = None
+            for pending in self.pending.values():
+                pending.pop(col.name, None)
+        self.index[col.name] = col
+        self.positions[col.name] = position
+        col.stack = self
+        self.track(col)
+
+    def track(self, col: Column):
+        """Updates the stages the column has pending work in, called when a tracked attribute changes"""
+        if self.index.get(col.name) is not col:
+            return
+        for stage, pending in self.STAGES.items():
+            columns = self.pending[stage]
+            if not pending(col):
+                columns.pop(col.name, None)
+            elif col.name not in columns:
+                if columns and self.positions[next(reversed(columns))] > self.positions[col.name]:
+                    self.unsorted.add(stage)
+                columns[col.name] = col
+
+    def _pending(self, stage: str) -> list:
+        """The columns with work left in a stage, in stack order"""
+        if stage in self.unsorted:
+            columns = sorted(self.pending[stage].values(), key=lambda x: self.positions[x.name])
+            self.pending[stage] = {x.name: x for x in columns}
+            self.unsorted.discard(stage)
+        return list(self.pending[stage].values())
+
+    def reset_state(self):
+        """Marks the stack and all its columns as not rendered"""
+        self.nameSpaced = False
+        for col in self.columnOptions:
+            col.reset_state()
+
+    # config fields whose change alters a column's values, its filters or its bins
+    VALUE_FIELDS = ("dtype", "parse_funcs", "parse_kwargs", "create_func", "create_args", "create_kwargs")
+    FILTER_FIELDS = ("filters",)
+    BIN_FIELDS = ("bins", "bin_include")
+
+    def diff(self, other: "ColumnStack") -> dict:
+        """Returns the names of the columns that were added, removed or changed in `other`"""
+        old, new = self.as_dict, other.as_dict
+        changes = {
+            "added": set(new) - set(old),
+            "removed": set(old) - set(new),
+            "values": set(),
+            "filters": set(),
+            "bins": set(),
+            "namespace": {
+                x
+                for x in set(self.nameSpace) | set(other.nameSpace)
+                if self.nameSpace.get(x) != other.nameSpace.get(x)
+            },
+        }
+        tables = {x for x in set(self.tables) | set(other.tables) if self.tables.get(x) != other.tables.get(x)}
+        for name in set(old) & set(new):
+            if tables and self.table_of(old[name]) in tables:
+                changes["values"].add(name)
+            for key, fields in (
+                ("values", self.VALUE_FIELDS),
+                ("filters", self.FILTER_FIELDS),
+                ("bins", self.BIN_FIELDS),
+            ):
+                if any(getattr(old[name], x) != getattr(new[name], x) for x in fields):
+                    changes[key].add(name)
+        return changes
+
+    @staticmethod
+    def table_of(col: Column) -> str:
+        """The secondary table a column is created from, None if any"""
+        info = FunctionsCollection.REGISTRY.get(col.create_func)
+        if info is None or info.table_arg is None:
+            return None
+        return col.create_kwargs.get(info.table_arg)
 
     def get_full_list(self) -> list:
         """Returns a list of column names in the Stack"""
         return [x.name for x in self.columnOptions]
 
     def get_unparsed(self) -> List:
-        condition = lambda x: all([x.parse_funcs, not x.parsed])
-        return [x for x in self.columnOptions if condition(x)]
+        return self._pending("unparsed")
 
     def get_aggr_objs(self) -> list:
         """Returns a list of columns that need aggregating"""
-        condition = lambda x: all([x.create_func, not x.created])
-        return [x for x in self.columnOptions if condition(x)]
+        return self._pending("uncreated")
 
     def get_non_aggr_objs(self) -> list:
         """Returns a list of columns that need aggregating"""
         condition = lambda x: all([x.create_func])
         return [x for x in self.columnOptions if not condition(x)]
 
+    def get_untyped(self, created: bool = False) -> list:
+        """Returns the columns whose data type is not applied yet, either created or read ones"""
+        return [x for x in self._pending("untyped") if bool(x.create_func) == created]
+
     def get_unbinned_objs(self) -> list:
-        condition = lambda x: all([x.bins, not x.binned])
-        return [x for x in self.columnOptions if condition(x)]
+        return self._pending("unbinned")
+
+    def get_unfiltered(self) -> list:
+        return self._pending("unfiltered")
 
     def add_column(self, name: str) -> Column:
         """Adds a new column to the Stack"""
-        self.columnOptions.append(Column(name))
-        logger.info(f"  -> New column added to Stack: `{name}`")
+        self.append_column(Column(name))
         return self[name]
 
     def get_columns(self, col_names):
-        return [x for x in self.columnOptions if x.name in col_names]
+        names = [x for x in set(col_names) if x in self.index]
+        return [self.index[x] for x in sorted(names, key=self.positions.get)]
 
     def append_column(self, col: Column) -> Column:
         """Adds a new column to the Stack"""
         self.columnOptions.append(col)
+        self._add(col, len(self.columnOptions) - 1)
         logger.info(f"  -> New column added to Stack: `{col.name}`")
 
     @property
     def as_dict(self) -> dict:
-        return {x.name: x for x in self.columnOptions}
+        """The columns by name, kept up to date by the stack: do not modify"""
+        return self.index
 
     def __getitem__(self, args):
         if isinstance(args, slice):
@@ -132,7 +302,7 @@ class ColumnStack:
         elif isinstance(args, int):
             return self.columnOptions[args]
         elif isinstance(args, str):
-            return self.as_dict[args]
+            return self.index[args]
         else:
             raise NotImplementedError(f"{args} is not implemented!")
 
@@ -142,6 +312,21 @@ class StackHandler:
     input_file: str
 
     stack: ColumnStack = None
+    chunksize: int = None
+    group_key: str = None
+    dtype_errors: str = "raise"
+    prune: bool = False
+    keep_base: bool = False
+    cache_dir: str = None
+    input_format: str = None
+    compact: bool = False
+    float32: bool = False
+    memory_budget: int = None
+    spill_dir: str = None
+    lazy: bool = False
+    infer_dtypes: bool = False
+    dtype_hints: dict = None
+    date_formats: list = None
 
     # BINNED_SUFFIX = '_binned'
     # OTHER_BIN_NAME = 'other'
@@ -149,106 +334,726 @@ class StackHandler:
 
     def __post_init__(self):
         self.namespaced = False
-        """Reads a dataframe and initializes a stack with the column names"""
-        self.df = pd.read_csv(self.input_file, sep=",", header=0)
+        """
+        Reads a dataframe and initializes a stack with the column names.
+        In streaming mode (`chunksize` is set) only the header is read here,
+        rows are read chunk by chunk in `iter_render`.
+        With `prune` the rows are read on the first render, and only the columns the config needs.
+        With a `cache_dir` rendered columns are cached on disk per stage; cached values are
+        unfiltered, so caching implies `keep_base`. Entries hold whole input columns, so renders of
+        chunks and spill partitions neither read nor write the cache.
+        The input is read by the backend of its `input_format` (csv, parquet or feather),
+        by default picked from the file extension.
+        With `compact` typed integer columns are stored as the narrowest nullable integer type,
+        and with `float32` typed float columns as float32.
+        With a `memory_budget` (bytes) group-wise create functions can be streamed without a `group_key`,
+        see `iter_render`; spill files go to `spill_dir`, by default the system temp directory.
+        With `lazy` the config is only ingested by `load`, columns are computed when they are
+        accessed through `frame` (a `DeferredFrame`), and only the input columns they need are read.
+        With `dtype_hints` (the proposals of `DtypeInference`, inferred from a sample of the input
+        with `infer_dtypes`) the input is read once the config is known, and the columns whose config
+        dtype matches their proposal are typed while they are read: `cat` columns by the CSV reader and
+        `date` columns with their detected formats, so `apply_dtypes` finds them converted.
+        `date_formats` replaces the formats date strings are parsed with (`TypeInfo.DATE_FORMATS`),
+        tried in order, e.g. to read ambiguous day/month strings day first.
+        """
+        if self.infer_dtypes and self.dtype_hints is None and self.input_file is not None:
+            self.dtype_hints = DtypeInference().infer_file(self.input_file, self.input_format)
+        self.loaded = not (self.chunksize or self.prune or self.lazy or self.dtype_hints)
+        if self.input_file is None:
+            # the dataframe is set by `from_frame`
+            self.reader = None
+            self.df = pd.DataFrame()
+            self.loaded = True
+        else:
+            self.reader = IOBackends.get(self.input_file, self.input_format)
+            if self.loaded:
+                self.df = self.reader.read(self.input_file)
+            else:
+                self.df = pd.DataFrame(columns=self.reader.columns(self.input_file))
 
-        logger.info(f"  -> Ingested CSV file, columns: {list(self.df.columns)}")
-        self.stack = ColumnStack(list(self.df.columns))
+        self.source_columns = list(self.df.columns)
+        logger.info(f"  -> Ingested input file, columns: {self.source_columns}")
+        self.stack = ColumnStack(columnOptions=list(self.df.columns))
+        self.execution_plan = None
+        self.compiled = None
+        self._frame = None
+        self.base_df = None
+        self.binned_cols = {}
+        self.profiler = None
+        self.table_indexes = {}
+        self.streaming = False
+        # rows passing each filter predicate per column, counted while filtering when set to a dict
+        self.filter_counts = None
 
+        if self.cache_dir and self.input_file is None:
+            raise ValueError("The stage cache is keyed by the input file, a `cache_dir` needs an `input_file`")
+        self.stage_cache = StageCache(self.cache_dir) if self.cache_dir else None
+        self.cache_keys = {}
+        if self.stage_cache is not None and not self.chunksize:
+            self.keep_base = True
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **kwargs) -> "StackHandler":
+        """Builds a handler around a dataframe that is already in memory"""
+        handler = cls(input_file=None, **kwargs)
+        handler.df = df
+        handler.source_columns = list(df.columns)
+        handler.stack = ColumnStack(columnOptions=list(df.columns))
+        return handler
+
+    def profile(self, profiler: RenderProfiler = None) -> RenderProfiler:
+        """Turns on per-stage and per-column profiling, returns the profiler collecting the records"""
+        self.profiler = profiler or RenderProfiler()
+        self.profiler.start()
+        return self.profiler
+
+    def _span(self, stage: str, column: str = None):
+        if self.profiler is None:
+            return NO_SPAN
+        return self.profiler.span(stage, column=column, rows=lambda: len(self.df))
+
+    def plan(self) -> ExecutionPlan:
+        """Returns the execution plan of the current stack configuration"""
+        if self.compiled is not None:
+            return self.compiled.execution_plan(self.stack, self.source_columns)
+        return ExecutionPlan(self.stack, self.source_columns)
+
+    def explain(self) -> str:
+        return self.plan().explain()
+
+    @property
+    def output_df(self) -> pd.DataFrame:
+        """The rendered dataframe restricted to the output columns of the stack"""
+        if self.lazy:
+            return self.frame.to_pandas()
+        return self._output(self.df)
+
+    def _output(self, df: pd.DataFrame) -> pd.DataFrame:
+        """`df` restricted to the output columns of the stack"""
+        if not self.stack.outputColumns:
+            return df
+        return df[self.plan().output]
+
+    def _planned(self, cols: list) -> list:
+        """Drops the columns the execution plan does not need"""
+        if self.execution_plan is None:
+            return cols
+        return [col for col in cols if col.name in self.execution_plan.needed]
+
+    def _read_planned(self):
+        """Reads the input columns needed by the plan, when they are not in the dataframe yet"""
+        cached = self._cached_sources()
+        usecols = self.execution_plan.read if self.prune else self.source_columns
+        usecols = [x for x in usecols if x not in cached]
+        if self.loaded and all(x in self.df.columns for x in usecols):
+            return
+        logger.info(f"  -> Reading {len(usecols)} of {len(self.source_columns)} columns")
+        if usecols:
+            # unfiltered rows are kept for the base frame, so filters only skip row groups without it
+            filters = [] if self.keep_base else self._planned(self.stack.columnOptions)
+            filters = [col for col in filters if col.name in self.execution_plan.pushdown]
+            self.df = self._read(columns=usecols, filters=filters)
+        else:
+            # every needed column is cached, only the row index is needed
+            self.df = pd.DataFrame(index=next(iter(cached.values())).index)
+        self.stack.reset_state()
+        self.loaded = True
+        for name, series in cached.items():
+            self.df[name] = series
+            self.stack[name].parsed = self.stack[name].dtype_normalized = True
+
+    def _ingest_hints(self, columns: list, stack: ColumnStack = None) -> dict:
+        """The dtype hints of the input `columns` that are read as they are and typed as proposed"""
+        if not self.dtype_hints:
+            return {}
+        stack = stack or self.stack
+        sources = set((stack.nameSpace or {}).values())
+        hints = {}
+        for name in columns:
+            col = stack.as_dict.get(name)
+            hint = self.dtype_hints.get(name)
+            if col is None or hint is None or name in sources:
+                continue
+            if col.dtype == hint["dtype"] and not col.parse_funcs and not col.create_func:
+                hints[name] = hint
+        return hints
+
+    def _read(self, columns: list = None, filters: list = None, stack: ColumnStack = None) -> pd.DataFrame:
+        """Reads input `columns` (by default all), typing the ones with a matching dtype hint"""
+        hints = self._ingest_hints(self.source_columns if columns is None else columns, stack)
+        if not hints:
+            return self.reader.read(self.input_file, columns=columns, filters=filters)
+        logger.info(f"  -> Typing {list(hints)} while reading")
+        read_kwargs = DtypeInference.read_kwargs(self.reader, hints)
+        df = self.reader.read(self.input_file, columns=columns, filters=filters, **read_kwargs)
+        return DtypeInference.apply(df, hints)
+
+    def _refresh_cache_keys(self):
+        if self.streaming:
+            self.cache_keys = {}
+        elif self.stage_cache is not None:
+            self.cache_keys = self.stage_cache.column_keys(
+                self.dump(),
+                self.input_file,
+                dtype_errors=self.dtype_errors,
+                compact=self.compact,
+                float32=self.float32,
+                date_formats=self.date_formats,
+            )
+
+    def _from_cache(self, col: Column, stage: str):
+        if self.stage_cache is None or (col.name, stage) not in self.cache_keys:
+            return None
+        return self.stage_cache.get(self.cache_keys[(col.name, stage)])
+
+    def _to_cache(self, col: Column, stage: str, series: pd.Series = None):
+        if self.stage_cache is None or (col.name, stage) not in self.cache_keys:
+            return
+        series = self.df[col.name] if series is None else series
+        self.stage_cache.put(self.cache_keys[(col.name, stage)], series, col.name, stage)
+
+    def _cached_stages(self, col: Column) -> list:
+        """The stages a column can be loaded at, latest first, with the flags a cache hit sets"""
+        if col.create_func:
+            return [("created", ("created", "dtype_normalized"))]
+        stages = []
+        if col.dtype:
+            stages.append(("typed", ("parsed", "dtype_normalized")))
+        if col.parse_funcs:
+            stages.append(("parsed", ("parsed",)))
+        return stages
+
+    def _cached_sources(self) -> dict:
+        """Input columns whose final value is cached and that are not needed raw"""
+        if self.stage_cache is None:
+            return {}
+        raw = set(self.execution_plan.namespace.values())
+        cached = {}
+        for col in self._planned(self.stack.columnOptions):
+            stages = self._cached_stages(col)
+            if col.name in raw or col.create_func or not stages or stages[0][0] != "typed":
+                continue
+            series = self._from_cache(col, "typed")
+            if series is not None:
+                cached[col.name] = series
+        return cached
+
+    @profiled("load_cached")
+    def load_cached(self):
+        """Loads the latest cached stage of every planned column and skips the stages before it"""
+        if self.stage_cache is None:
+            return
+        for col in self._planned(self.stack.columnOptions):
+            for stage, flags in self._cached_stages(col):
+                if all(getattr(col, x) for x in flags):
+                    break
+                series = self._from_cache(col, stage)
+                if series is not None:
+                    self.df[col.name] = series
+                    for flag in flags:
+                        setattr(col, flag, True)
+                    break
+
+    @profiled("apply_namespace")
     def apply_namespace(self):
         if not self.stack.nameSpaced:
-            for new_col, old_col in self.stack.nameSpace.items():
+            for new_col, old_col in self._planned_namespace().items():
                 self.df[new_col] = self.df[old_col]
             self.stack.nameSpaced = True
 
+    def _planned_namespace(self) -> dict:
+        if self.execution_plan is None:
+            return self.stack.nameSpace
+        return self.execution_plan.namespace
+
     def dump(self, **kwargs) -> dict:
         """Returns a dictionary with the stack configuration"""
         return self.stack.Schema().dump(self.stack, **kwargs)
 
-    def load(self, data: dict, **kwargs):
-        """Ingests a stack configuration and runs all instructions in the config"""
-        self.stack = self.stack.Schema().load(data, **kwargs)
-        self.render()
+    def load(self, data, **kwargs):
+        """
+        Ingests a stack configuration and runs all instructions in the config.
+        `data` is a config dictionary or a `CompiledPlan`; a compiled plan is not validated again
+        and brings its resolved functions, compiled bins and typed filter values.
+        In streaming mode the config is only ingested, use `iter_render` or `render_to_csv` to run it.
+        A handler that kept a base frame (`keep_base`) starts again from the input: the base frame holds
+        the columns parsed and created for the previous config.
+        """
+        self._set_stack(data, **kwargs)
+        if self.base_df is not None:
+            self.base_df = None
+            self.loaded = False
+            if not (self.prune or self.dtype_hints):
+                self.df = self._read()
+                self.loaded = True
+        if self.lazy:
+            self._reset_lazy()
+        elif not self.chunksize:
+            self.render()
+
+    @property
+    def frame(self) -> DeferredFrame:
+        """The deferred frame of a lazy handler, columns are computed on access"""
+        if not self.lazy:
+            raise ValueError("The deferred frame is only available with `lazy=True`, use `df`")
+        if self._frame is None:
+            self._frame = DeferredFrame(self)
+        return self._frame
+
+    def _reset_lazy(self):
+        """Drops everything computed for the previous config, the input is read again on access"""
+        self._frame = None
+        self.binned_cols = {}
+        self.execution_plan = None
+        self.loaded = self.input_file is None
+        if not self.loaded:
+            self.df = pd.DataFrame(columns=self.source_columns)
+        self.stack.reset_state()
+
+    def _set_stack(self, data, **kwargs):
+        if isinstance(data, dict):
+            self.compiled = None
+            self.stack = self.stack.Schema().load(data, **kwargs)
+        else:
+            self.compiled = data
+            self.stack = data.new_stack()
+
+    PREVIEW_CHUNKSIZE = 100_000
+
+    def preview(self, data, fraction: float = 0.01, key: str = None, seed: int = 0) -> dict:
+        """
+        Renders config `data` on a deterministic sample of the input and extrapolates to the full input.
+        Whole groups of `key` are sampled (by default the group key of the group-wise create functions,
+        without one single rows are), see `GroupSample`. The input is streamed once to count its rows and
+        keep the sample; only the columns the config needs are read.
+        Returns the sampled and estimated full-input numbers: rows out, rows passing each filter
+        predicate (among the rows it is applied to: filters that are not pushed down only see the rows
+        the pushed-down filters kept), rows per bin (after the filters), and time and memory allocated
+        per stage, plus the rendered `sample` itself.
+        Times are measured on a first render; memory and predicate counts on a second, traced render
+        of the same sample. Both run the same stages as `render`, so pushed-down filters, filters and
+        bins are measured under their own names.
+        The handler itself is not changed.
+        """
+        stack = ColumnStack.Schema().load(copy.deepcopy(data)) if isinstance(data, dict) else data.new_stack()
+        plan = ExecutionPlan(stack, self.source_columns)
+        key = key or plan.group_key()
+
+        sampler = GroupSample(fraction, key=key, seed=seed)
+        start = time.perf_counter()
+        if self.input_file is None:
+            chunks = [self.df]
+        else:
+            columns = plan.read + ([key] if key and key not in plan.read else [])
+            chunksize = self.chunksize or self.PREVIEW_CHUNKSIZE
+            chunks = self.reader.iter_chunks(self.input_file, chunksize, columns=columns)
+        sample = sampler.sample(chunks)
+        read_seconds = time.perf_counter() - start
+        if not len(sample):
+            raise ValueError(f"The sample of the {sampler.rows} input rows is empty, use a larger `fraction`")
+        scale = sampler.rows / len(sample)
+
+        options = dict(
+            dtype_errors=self.dtype_errors, compact=self.compact, float32=self.float32, date_formats=self.date_formats
+        )
+        timed = StackHandler.from_frame(sample.copy(), **options)
+        profiler = timed.profile(RenderProfiler(trace_memory=False))
+        timed.load(copy.deepcopy(data) if isinstance(data, dict) else data)
+        traced = StackHandler.from_frame(sample.copy(), **options)
+        traced.filter_counts = {}
+        memory = traced.profile(RenderProfiler(trace_memory=True))
+        try:
+            traced.load(copy.deepcopy(data) if isinstance(data, dict) else data)
+        finally:
+            memory.stop()
+
+        allocated = {}
+        for record in memory.records:
+            if record["column"] is None:
+                stage = record["stage"]
+                allocated[stage] = max(allocated.get(stage, 0), record["bytes_allocated"] or 0)
+        stages = [
+            {
+                "stage": x["stage"],
+                "seconds": x["seconds"] * scale,
+                "rows_in": round(x["rows_in"] * scale),
+                "bytes_allocated": round(allocated.get(x["stage"], 0) * scale),
+            }
+            for x in profiler.stages()
+        ]
+
+        filters = {
+            name: {predicate: round(count * scale) for predicate, count in counts.items()}
+            for name, counts in traced.filter_counts.items()
+        }
+        bins = {
+            name: {label: round(count * scale) for label, count in timed.bin_counts(name).items()}
+            for name in timed.execution_plan.bin
+        }
+
+        def size(df):
+            return int(df.memory_usage(deep=True).sum() * scale)
+
+        return {
+            "rows": sampler.rows,
+            "sample_rows": len(sample),
+            "key": key,
+            "scale": scale,
+            "rows_out": round(len(timed.df) * scale),
+            "read_seconds": read_seconds,
+            "seconds": sum(x["seconds"] for x in stages),
+            "input_bytes": size(sample),
+            "output_bytes": size(timed.df),
+            "stages": stages,
+            "filters": filters,
+            "bins": bins,
+            "sample": timed.df,
+        }
 
     def render(self):
         """Runs the chain of functions for the executing configuration instructions"""
+        self.execution_plan = self.plan()
+        self._refresh_cache_keys()
+        if self.keep_base and self.base_df is not None:
+            self.df = self.base_df
+        if (self.prune or self.dtype_hints) and not self.chunksize:
+            self._read_planned()
+        # deep memory usage scans every string, so it is only measured when it is logged
+        before = self.memory_per_row(self.df) if logger.isEnabledFor(logging.INFO) else None
 
         self.apply_namespace()
+        self.load_cached()
+        if not self.keep_base:
+            self.apply_filters(pushdown=True)
         self.apply_parse()
         self.apply_dtypes(on_created_cols=False)
         self.create_cols()
         self.apply_dtypes(on_created_cols=True)
-        self.apply_filters()
-        self.apply_bins()
+
+        if self.keep_base:
+            self.base_df = self.df
+            self.materialize()
+        else:
+            self.apply_filters()
+            self.apply_bins()
+        if self.stage_cache is not None:
+            self.stage_cache.flush()
+        if before is not None:
+            after = self.memory_per_row(self.df)
+            logger.info(f"  -> Memory per row: {before['total']} bytes read, {after['total']} bytes rendered")
+
+    @staticmethod
+    def memory_per_row(df: pd.DataFrame) -> dict:
+        """Bytes per row of every column of a dataframe, and their `total`"""
+        usage = df.memory_usage(deep=True, index=False) / max(len(df), 1)
+        return {**usage.round(1).to_dict(), "total": round(float(usage.sum()), 1)}
+
+    @profiled("materialize")
+    def materialize(self):
+        """
+        Builds `self.df` from the unfiltered base frame (`keep_base` mode).
+        Bins are computed on the base frame and kept in `binned_cols`, so a filter change
+        only re-evaluates the filter predicates and a bin change only re-bins that column.
+        """
+        for col in self._planned(self.stack.get_unbinned_objs()):
+            with self._span("apply_bins", col.name):
+                binned = self._from_cache(col, "binned")
+                if binned is None:
+                    binned = self._bins(col).apply(self.base_df[col.name], col.bin_include)
+                    self._to_cache(col, "binned", binned)
+                self.binned_cols[col.name] = binned
+                col.binned = True
+        for name in list(self.binned_cols):
+            if name not in self.stack.as_dict or not self.stack[name].bins:
+                del self.binned_cols[name]
+
+        cols = [col for col in self._planned(self.stack.columnOptions) if col.filters]
+        selection = self._filter_selection(self.base_df, cols)
+        self.df = self.base_df[selection] if not selection.all() else self.base_df.copy()
+        for name, binned in self.binned_cols.items():
+            self.df[name] = binned[selection]
+            # the filter selection may have changed without a re-bin
+            self.stack[name].bin_index = None
+
+    def update(self, data: dict, **kwargs) -> dict:
+        """
+        Applies a new stack configuration, recomputing only the columns that changed and their dependents.
+        Filters and bins are re-applied from the unfiltered base frame, so loosening a filter
+        does not re-read the input; changed input columns are re-read on their own.
+        Returns the changes found between the current and the new configuration.
+        """
+        if self.chunksize:
+            raise ValueError("Incremental updates are not available in streaming mode")
+
+        if self.base_df is None:
+            # first update: a full render that keeps the base frame
+            self.keep_base = True
+            self.loaded = False
+            self._set_stack(data, **kwargs)
+            if not self.prune:
+                self.df = self._read()
+                self.loaded = True
+            self.render()
+            return {}
+
+        self.compiled = None
+        new_stack = self.stack.Schema().load(data, **kwargs)
+        changes = self.stack.diff(new_stack)
+        plan = ExecutionPlan(new_stack, self.source_columns)
+
+        dirty = changes["added"] | changes["removed"] | changes["values"] | changes["namespace"]
+        dirty |= {x for x in plan.needed if x not in self.base_df.columns}
+        dependents = {}
+        for name, deps in plan.deps.items():
+            for dep in deps:
+                dependents.setdefault(dep, set()).add(name)
+        todo = list(dirty)
+        while todo:
+            for name in dependents.get(todo.pop(), ()):
+                if name not in dirty:
+                    dirty.add(name)
+                    todo.append(name)
+        logger.info(f"  -> Recomputing columns: {sorted(dirty)}")
+
+        base = self.base_df
+        drop = [x for x in base.columns if x not in self.source_columns and x not in plan.needed]
+        base = base.drop(columns=drop)
+
+        sources = [x for x in dirty if x in self.source_columns and x not in plan.deps]
+        renamed = {x: plan.namespace[x] for x in dirty if x in plan.namespace}
+        usecols = list(dict.fromkeys(sources + list(renamed.values())))
+        if usecols:
+            raw = self._read(columns=usecols, stack=new_stack)
+            for name in sources:
+                base[name] = raw[name]
+            for new_col, old_col in renamed.items():
+                base[new_col] = raw[old_col]
+
+        for col in new_stack.columnOptions:
+            done = col.name not in dirty
+            col.parsed = col.dtype_normalized = col.created = done
+            col.binned = (
+                done and col.name not in changes["bins"] and col.name in self.binned_cols
+            )
+        new_stack.nameSpaced = True
+
+        self.stack = new_stack
+        self.execution_plan = plan
+        self._refresh_cache_keys()
+        self.df = base
+        self.apply_parse()
+        self.apply_dtypes(on_created_cols=False)
+        self.create_cols()
+        self.apply_dtypes(on_created_cols=True)
+        self.base_df = self.df
+        self.materialize()
+        return changes
+
+    def iter_render(self, chunksize: int = None, group_key: str = None):
+        """
+        Streams the input file in row chunks and runs the render chain on each chunk.
+        Yields every rendered chunk, restricted to the output columns of the stack,
+        so peak memory depends on the chunk size and not on the file size.
+        `group_key` is the input column that group-wise create functions group by;
+        all rows of a group are kept in one chunk, which requires them to be contiguous in the file.
+        Without a `group_key` but with a `memory_budget`, the input is rendered in memory while it fits
+        the budget, else hash-partitioned by the group key into spill files that are rendered one by one;
+        chunks are yielded in the original row order either way.
+        Only the yielded frames are the rendered rows: `df` and `output_df` hold the last rendered chunk,
+        and none once the input has spilled, since its partitions are rendered before they are merged.
+        """
+        chunksize = chunksize or self.chunksize
+        group_key = group_key or self.group_key
+
+        plan = self.plan()
+        if plan.whole_input:
+            raise ValueError(
+                f"Columns {plan.whole_input} are computed by functions that are not row-local "
+                f"and need every row of the input, they cannot be rendered in chunks"
+            )
+        group_funcs = [
+            col.name
+            for col in self.stack.columnOptions
+            if col.create_func in FunctionsCollection.GROUP_FUNCS
+        ]
+        spill_key = None
+        if group_funcs and not group_key:
+            if not self.memory_budget:
+                raise ValueError(
+                    f"Columns {group_funcs} are created group-wise, "
+                    f"a `group_key` or a `memory_budget` is needed to render them in chunks"
+                )
+            spill_key = plan.group_key()
+
+        read_kwargs = {}
+        if self.prune:
+            usecols = plan.read
+            for key in (group_key, spill_key):
+                if key and key not in usecols:
+                    usecols = usecols + [key]
+            read_kwargs["columns"] = usecols
+        hints = self._ingest_hints(read_kwargs.get("columns", self.source_columns))
+        read_kwargs.update(DtypeInference.read_kwargs(self.reader, hints))
+
+        if spill_key is not None:
+            # groups may be spread over the file: hash-partition them to disk past the memory budget
+            chunks = self.reader.iter_chunks(self.input_file, chunksize, **read_kwargs)
+            partitioner = HashPartitioner(self.memory_budget, tmp_dir=self.spill_dir)
+            for chunk in partitioner.render(chunks, spill_key, self._render_frame, chunksize):
+                yield self._output(chunk)
+            if partitioner.spilled:
+                # the last rendered partition is no chunk of the output, only its columns are kept
+                self.df = self.df.iloc[:0]
+            return
+
+        reader = GroupedChunkReader(
+            self.input_file, chunksize, group_key=group_key, input_format=self.input_format, **read_kwargs
+        )
+        for chunk in reader:
+            yield self._output(self._render_frame(chunk))
+
+    def _render_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        self.df = DtypeInference.apply(df, self._ingest_hints(list(df.columns))) if self.dtype_hints else df
+        self.base_df = None
+        self.stack.reset_state()
+        # a chunk is not the whole input: its columns must not be cached under the input's keys
+        self.streaming = True
+        try:
+            self.render()
+        finally:
+            self.streaming = False
+        return self.df
+
+    def render_to_csv(
+        self, output_file: str, chunksize: int = None, group_key: str = None, **kwargs
+    ):
+        """Renders the input chunk by chunk and appends every finished chunk to `output_file`"""
+        # chunks keep their input row labels, which are not an output column
+        kwargs.setdefault("index", False)
+        header = True
+        for chunk in self.iter_render(chunksize=chunksize, group_key=group_key):
+            chunk.to_csv(output_file, mode="w" if header else "a", header=header, **kwargs)
+            header = False
+
+    def render_to_file(
+        self, output_file: str, output_format: str = None, chunksize: int = None, group_key: str = None, **kwargs
+    ) -> list:
+        """
+        Writes the output columns through an `OutputWriter`: formatted and compressed by worker threads,
+        optionally partitioned by a column, and renamed into place once complete; `kwargs` go to the writer.
+        In streaming mode every chunk is written while the next one renders. Returns the written files.
+        """
+        with OutputWriter(output_file, output_format, **kwargs) as writer:
+            if chunksize or self.chunksize:
+                for chunk in self.iter_render(chunksize=chunksize, group_key=group_key):
+                    writer.write(chunk)
+            else:
+                writer.write(self.output_df)
+        return writer.paths
+
+    def to_file(self, output_file: str, output_format: str = None, **kwargs):
+        """Writes the output columns as csv, parquet or feather, by default picked from the file extension"""
+        IOBackends.get(output_file, output_format).write(self.output_df, output_file, **kwargs)
 
     def append_column(self, data: dict, **kwargs):
         schema = self.dump()
         # merge dictionaries
         schema["columnOptions"] = schema["columnOptions"] + data["columnOptions"]
-        self.stack = self.stack.Schema().load(schema, **kwargs)
+        if self.base_df is not None:
+            self.update(schema, **kwargs)
+            return
+        self._set_stack(schema, **kwargs)
         self.render()
 
+    @profiled("apply_parse")
     def apply_parse(self):
-        for col in self.stack.get_unparsed():
-            self.df[col.name] = self.df[col.name].apply(DTYPE_MAP["str"])
-            for parse_func, parse_kwargs in zip(col.parse_funcs, col.parse_kwargs):
-                logger.info(f"  -> Parsing data for: `{col.name}` with `{parse_func}`")
-                agg_func = getattr(FunctionsCollection, parse_func)
-                self.df[col.name] = agg_func(self.df[col.name], **parse_kwargs)
-                col.parsed = True
+        for col in self._planned(self.stack.get_unparsed()):
+            with self._span("apply_parse", col.name):
+                self.df[col.name] = DtypeConverter.convert(self.df[col.name], "str")
+                for parse_func, parse_kwargs in zip(self._parse_funcs(col), col.parse_kwargs):
+                    logger.info(f"  -> Parsing data for: `{col.name}` with `{parse_func.__name__}`")
+                    self.df[col.name] = parse_func(self.df[col.name], **parse_kwargs)
+                    col.parsed = True
+                self._to_cache(col, "parsed")
 
+    @profiled("apply_dtypes")
     def apply_dtypes(self, on_created_cols=False):
         """
-        Applies the data type as specified in the config, uses DTYPE_MAP for apply functions.
+        Applies the data type as specified in the config.
+        Columns are converted as a whole by `DtypeConverter`, values it rejects go through DTYPE_MAP
+        one by one; values that cannot be converted at all follow the `dtype_errors` policy.
         """
-        if on_created_cols:
-            cols = [
-                col
-                for col in self.stack.get_aggr_objs()
-                if col.dtype and not col.dtype_normalized
-            ]
-        else:
-            cols = [
-                col
-                for col in self.stack.get_non_aggr_objs()
-                if col.dtype and not col.dtype_normalized
-            ]
+        for col in self._planned(self.stack.get_untyped(created=on_created_cols)):
+            self._convert_dtype(col)
 
-        for col in cols:
-            logger.info(f"  -> Converting data type for: `{col.name}` as `{col.dtype}`")
-            col.dtype_normalized = True
-            self.df[col.name] = self.df[col.name].apply(DTYPE_MAP[col.dtype])
+    def _convert_dtype(self, col: Column):
+        logger.info(f"  -> Converting data type for: `{col.name}` as `{col.dtype}`")
+        col.dtype_normalized = True
+        with self._span("apply_dtypes", col.name):
+            self.df[col.name] = DtypeConverter.convert(
+                self.df[col.name], col.dtype, errors=self.dtype_errors, date_formats=self.date_formats
+            )
+            if self.compact or self.float32:
+                self.df[col.name] = DtypeConverter.compact(
+                    self.df[col.name], col.dtype, integers=self.compact, float32=self.float32
+                )
+            if not col.create_func:
+                self._to_cache(col, "typed")
 
+    @profiled("create_cols")
     def create_cols(self):
         """
         Creates any new columns not present in the dataframe.
         Column key `create_func` is mandatory to specify which function is used to create the column
         `create_args` and `create_kwargs` are used to pass args and kwargs to the function.
         """
-        for col in self.stack.get_aggr_objs():
+        cols = self._planned(self.stack.get_aggr_objs())
+        if self.execution_plan is not None:
+            # create functions run in dependency order
+            order = {x: n for n, x in enumerate(self.execution_plan.create)}
+            cols = sorted(cols, key=lambda col: order[col.name])
+
+        for col in cols:
             logger.info(f"  -> Creating new column: `{col.name}` as `{col.dtype}`")
-            agg_func = getattr(FunctionsCollection, col.create_func)
-            agg_args = [self.df[x] for x in col.create_args]
-            self.df[col.name] = agg_func(*agg_args, **col.create_kwargs)
-            col.dtype_normalized = True
-            col.created = True
+            with self._span("create_cols", col.name):
+                agg_func = self._create_func(col)
+                agg_args = [self.df[x] for x in col.create_args]
+                self.df[col.name] = agg_func(*agg_args, **self._create_kwargs(col))
+                col.dtype_normalized = True
+                col.created = True
+                self._to_cache(col, "created")
 
     # applies and also returns the result? ?
+    @profiled("apply_bins")
     def apply_bins(self):
         """
             Runs binning, and creates new columns with the binned results.
             """
         # bin_index = []
-        for col in self.stack.get_unbinned_objs():
-            self.df[col.name] = Binner().apply_bins(
-                series=self.df[col.name],
-                bin_options=col.bin_include,
-                dtype=col.dtype,
-                bins=col.bins,
-            )
-            col.binned = True
+        for col in self._planned(self.stack.get_unbinned_objs()):
+            with self._span("apply_bins", col.name):
+                self.df[col.name] = self._bins(col).apply(self.df[col.name], col.bin_include)
+                col.binned = True
 
-    def apply_filters(self):
+    def bin_index(self, name: str) -> BinIndex:
+        """The bin -> rows index of a binned column of the rendered dataframe, built once per render"""
+        col = self.stack[name]
+        if not col.binned:
+            raise ValueError(f"Column `{name}` is not binned")
+        if col.bin_index is None or col.bin_index.rows != len(self.df):
+            col.bin_index = BinIndex(self.df[name])
+        return col.bin_index
+
+    def bin_counts(self, name: str, dropna: bool = True) -> pd.Series:
+        return self.bin_index(name).counts(dropna=dropna)
+
+    def bin_crosstab(self, rows: str, columns: str, dropna: bool = True) -> pd.DataFrame:
+        """Rows per pair of bins of two binned columns"""
+        return self.bin_index(rows).crosstab(self.bin_index(columns), dropna=dropna)
+
+    @profiled("apply_filters")
+    def apply_filters(self, pushdown: bool = False):
         """
         Applies filters on the dataframe, as specified per column.
         Filters dictionary may have more that one filter specified.
@@ -258,20 +1063,75 @@ class StackHandler:
         __eq__ = Equals
         __ne__ = Not equals
         The filter value is a normalized dtype as specified by the column config.
+        All predicates are combined into one row selection, and the dataframe is copied once.
+        With `pushdown` only the filters the execution plan can run before parsing are applied,
+        their columns are converted to their dtype first.
         """
+        cols = self._planned(self.stack.get_unfiltered())
+        if pushdown:
+            if self.execution_plan is None:
+                return
+            cols = [col for col in cols if col.name in self.execution_plan.pushdown]
+            for col in cols:
+                if not col.dtype_normalized:
+                    self._convert_dtype(col)
+
+        selection = self._filter_selection(self.df, cols)
+        if not selection.all():
+            logger.info(f"  -> Keeping {selection.sum()} of {len(selection)} rows")
+            self.df = self.df[selection]
 
-        def _apply_filter(value):
-            _func = getattr(self.df[col.name], func_name)
-            logger.info(f"  ---> Filter `{_func.__name__}`: `{value}`")
-            _value = DTYPE_MAP[col.dtype](value)
-            self.df = self.df[_func(_value)]
-
-        for col in self.stack.columnOptions:
-            if col.filters and not col.filtered:
-                logger.info(f"  -> Filters applied on column: `{col.name}`")
-                for func_name, value in col.filters.items():
-                    _func = getattr(self.df[col.name], func_name)
+    def _filter_selection(self, df: pd.DataFrame, cols: list) -> np.ndarray:
+        """Combines the filters of the columns into one boolean row selection"""
+        selection = np.ones(len(df), dtype=bool)
+        for col in cols:
+            logger.info(f"  -> Filters applied on column: `{col.name}`")
+            with self._span("apply_filters", col.name):
+                for func_name, value in self._filter_values(col):
+                    _func = getattr(df[col.name], func_name)
                     logger.info(f"  ---> Filter `{_func.__name__}`: `{value}`")
-                    _value = TypeInfo.DTYPE_MAP[col.dtype](value)
-                    self.df = self.df[_func(_value)]
+                    passed = _func(value).to_numpy(dtype=bool, na_value=False)
+                    if self.filter_counts is not None:
+                        self.filter_counts.setdefault(col.name, {})[f"{func_name} {value}"] = int(passed.sum())
+                    selection &= passed
                 col.filtered = True
+        return selection
+
+    def _parse_funcs(self, col: Column) -> list:
+        if self.compiled is not None:
+            return self.compiled.parse_funcs[col.name]
+        return [FunctionsCollection.resolve(x) for x in col.parse_funcs]
+
+    def _create_func(self, col: Column):
+        if self.compiled is not None:
+            return self.compiled.create_funcs[col.name]
+        return FunctionsCollection.resolve(col.create_func)
+
+    def _create_kwargs(self, col: Column) -> dict:
+        """The create kwargs, with the table name of a join function replaced by its index"""
+        table = self.stack.table_of(col)
+        if table is None:
+            return col.create_kwargs
+        info = FunctionsCollection.info(col.create_func)
+        return {**col.create_kwargs, info.table_arg: self.table_index(table)}
+
+    def table_index(self, name: str) -> TableIndex:
+        """The index of a secondary table of the stack, built once and rebuilt only when its options change"""
+        if name not in self.stack.tables:
+            raise KeyError(f"Table `{name}` is not declared! Options are: {list(self.stack.tables)}")
+        options = self.stack.tables[name]
+        index = self.table_indexes.get(name)
+        if index is None or any(index.options.get(k) != v for k, v in options.items()):
+            index = self.table_indexes[name] = TableIndex(**options)
+        return index
+
+    def _bins(self, col: Column) -> CompiledBins:
+        if self.compiled is not None:
+            return self.compiled.bins[col.name]
+        return Binner().compile_bins(col.bins, col.dtype)
+
+    def _filter_values(self, col: Column) -> list:
+        """`(func_name, value)` of every filter, the value converted to the column dtype"""
+        if self.compiled is not None:
+            return self.compiled.filters[col.name]
+        return [(func_name, TypeInfo.DTYPE_MAP[col.dtype](value)) for func_name, value in col.filters.items()]
@@ -0,0 +1,197 @@
+import copy
+import dataclasses
+import inspect
+import logging
+from types import MappingProxyType
+from binner import CompiledBins
+from col_creation_library import FunctionsCollection
+from column_options import ColumnStack
+from planner import ExecutionPlan
+from type_info import TypeInfo
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledPlan:
+    """
+    A stack configuration validated once and prepared for any number of renders:
+    functions resolved from `FunctionsCollection` and checked against their arguments,
+    bin specs compiled into `CompiledBins`, filter values converted to the column dtype
+    and the create functions put in dependency order.
+    Every problem in the config is reported by `compile`, before any input is read.
+    Pass the plan to `StackHandler.load` instead of the config dict; it is not changed by rendering,
+    the columns of the stack it hands out are copies.
+    """
+
+    stack: ColumnStack
+    parse_funcs: MappingProxyType
+    create_funcs: MappingProxyType
+    bins: MappingProxyType
+    filters: MappingProxyType
+    create_order: tuple
+    plans: dict = dataclasses.field(default_factory=dict, repr=False, compare=False)
+
+    FILTER_FUNCS = ("__lt__", "__le__", "__gt__", "__ge__", "__eq__", "__ne__")
+    BIN_INCLUDE = ("other", "null")
+
+    @classmethod
+    def compile(cls, config: dict) -> "CompiledPlan":
+        stack = ColumnStack.Schema().load(copy.deepcopy(config))
+        errors = []
+        parse_funcs, create_funcs, bins, filters = {}, {}, {}, {}
+
+        for col in stack.columnOptions:
+
+            def error(message):
+                errors.append(f"`{col.name}`: {message}")
+
+            if col.dtype is not None and col.dtype not in TypeInfo.DTYPE_MAP:
+                error(f"data type `{col.dtype}` is not known, options are {list(TypeInfo.DTYPE_MAP)}")
+                continue
+
+            if col.parse_funcs:
+                if len(col.parse_funcs) != len(col.parse_kwargs):
+                    error(
+                        f"{len(col.parse_funcs)} parse functions but {len(col.parse_kwargs)} "
+                        f"parse kwargs, give one (possibly empty) dict per function"
+                    )
+                funcs = []
+                for name, kwargs in zip(col.parse_funcs, col.parse_kwargs):
+                    func = cls._resolve(name, error)
+                    if func is None or not cls._check_call(func, name, [None], kwargs, error):
+                        continue
+                    info = FunctionsCollection.info(name)
+                    if info.kind == "group":
+                        error(f"group-wise function `{name}` cannot parse a single column")
+                    # values are parsed as strings
+                    cls._check_inputs(info, ["str"], error)
+                    funcs.append(FunctionsCollection.resolve(name))
+                parse_funcs[col.name] = tuple(funcs)
+
+            if col.create_func:
+                func = cls._resolve(col.create_func, error)
+                if func is not None and cls._check_call(
+                    func, col.create_func, col.create_args, col.create_kwargs, error
+                ):
+                    info = FunctionsCollection.info(col.create_func)
+                    cls._check_inputs(info, [cls._arg_dtype(stack, x) for x in col.create_args], error)
+                    if info.table_arg is not None:
+                        cls._check_table(stack, col.create_kwargs.get(info.table_arg), error)
+                    create_funcs[col.name] = FunctionsCollection.resolve(col.create_func)
+
+            if col.bins:
+                unknown = set(col.bin_include) - set(cls.BIN_INCLUDE)
+                if unknown:
+                    error(f"`bin_include` keys {sorted(unknown)} are not known, options are {cls.BIN_INCLUDE}")
+                try:
+                    bins[col.name] = CompiledBins(col.bins, col.dtype)
+                except (ValueError, TypeError) as e:
+                    error(str(e))
+
+            if col.filters:
+                typed = []
+                for func_name, value in col.filters.items():
+                    if func_name not in cls.FILTER_FUNCS:
+                        error(f"filter `{func_name}` is not known, options are {cls.FILTER_FUNCS}")
+                    elif col.dtype is None:
+                        error(f"filter `{func_name}` needs a `dtype` to convert its value")
+                    else:
+                        try:
+                            typed.append((func_name, TypeInfo.DTYPE_MAP[col.dtype](value)))
+                        except (ValueError, TypeError) as e:
+                            error(f"value `{value}` of filter `{func_name}` is not a valid `{col.dtype}`: {e}")
+                filters[col.name] = tuple(typed)
+
+        create_order = ()
+        try:
+            create_order = tuple(ExecutionPlan(stack, cls._assumed_sources(stack)).create)
+        except ValueError as e:
+            errors.append(str(e))
+
+        if errors:
+            raise ValueError("Invalid config:\n" + "\n".join(f"  - {x}" for x in errors))
+
+        logger.info(f"  -> Compiled config with {len(stack.columnOptions)} columns")
+        return cls(
+            stack=stack,
+            parse_funcs=MappingProxyType(parse_funcs),
+            create_funcs=MappingProxyType(create_funcs),
+            bins=MappingProxyType(bins),
+            filters=MappingProxyType(filters),
+            create_order=create_order,
+        )
+
+    @staticmethod
+    def _resolve(name: str, error):
+        if name not in FunctionsCollection.REGISTRY:
+            error(f"function `{name}` is not registered in `FunctionsCollection`")
+            return None
+        return getattr(FunctionsCollection, name)
+
+    @staticmethod
+    def _arg_dtype(stack: ColumnStack, name: str) -> str:
+        """The dtype a column has when create functions run, None when it is not known (e.g. raw values)"""
+        col = stack.as_dict.get(name)
+        if col is None:
+            return None
+        if col.dtype is None and col.create_func in FunctionsCollection.REGISTRY:
+            return FunctionsCollection.info(col.create_func).output
+        return col.dtype
+
+    @staticmethod
+    def _check_inputs(info, dtypes: list, error):
+        for n, (expected, dtype) in enumerate(zip(info.inputs, dtypes)):
+            if expected is not None and dtype is not None and expected != dtype:
+                error(f"argument {n + 1} of `{info.name}` must be `{expected}`, got `{dtype}`")
+
+    TABLE_OPTIONS = ("input_file", "key", "input_format", "dtypes")
+
+    @classmethod
+    def _check_table(cls, stack: ColumnStack, name: str, error):
+        if name not in stack.tables:
+            error(f"table `{name}` is not declared in `tables`, options are {list(stack.tables)}")
+            return
+        options = stack.tables[name]
+        missing = [x for x in ("input_file", "key") if not options.get(x)]
+        if missing:
+            error(f"table `{name}` needs {missing}")
+        unknown = sorted(set(options) - set(cls.TABLE_OPTIONS))
+        if unknown:
+            error(f"table `{name}` options {unknown} are not known, options are {cls.TABLE_OPTIONS}")
+
+    @staticmethod
+    def _check_call(func, name: str, args: list, kwargs: dict, error) -> bool:
+        try:
+            inspect.signature(func).bind(*args, **kwargs)
+        except TypeError as e:
+            error(f"arguments do not fit `{name}`: {e}")
+            return False
+        return True
+
+    @staticmethod
+    def _assumed_sources(stack: ColumnStack) -> list:
+        """Every column that is not created or namespaced is expected in the input"""
+        derived = set(stack.nameSpace) | {x.name for x in stack.columnOptions if x.create_func}
+        names = [x.name for x in stack.columnOptions] + list(stack.nameSpace.values())
+        names += [arg for x in stack.columnOptions if x.create_func for arg in x.create_args]
+        return [x for x in dict.fromkeys(names) if x not in derived]
+
+    def new_stack(self) -> ColumnStack:
+        """A fresh stack for one render, sharing the (read-only) config values of the plan"""
+        return ColumnStack(
+            nameSpace=dict(self.stack.nameSpace),
+            columnOptions=[dataclasses.replace(col) for col in self.stack.columnOptions],
+            outputColumns=list(self.stack.outputColumns),
+            tables=dict(self.stack.tables),
+        )
+
+    def execution_plan(self, stack: ColumnStack, source_columns: list) -> ExecutionPlan:
+        """The execution plan for an input header, built once per distinct header"""
+        key = tuple(source_columns)
+        if key not in self.plans:
+            self.plans[key] = ExecutionPlan(stack, source_columns)
+        return self.plans[key]
@@ -0,0 +1,145 @@
+import logging
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+from type_info import TypeInfo
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class DateParser:
+    """
+    Memoized date parsing for columns that mix several formats.
+    Every distinct string is parsed once: the candidate `formats` are tried in order,
+    each one vectorized over the strings not matched yet, and the strings no format matches
+    go through an optional per-value `fallback` function.
+    Results are kept in an LRU cache that persists across columns and files, keyed by type and value
+    so that e.g. `1`, `1.0` and `True` are parsed apart;
+    `stats` counts how many values each format (or the cache, or the fallback) matched.
+    """
+
+    CACHED = "cached"
+    FALLBACK = "fallback"
+    CACHE_SIZE = 1_000_000
+
+    _shared = {}
+    _MISSING = object()
+
+    def __init__(self, formats: list = None, cache_size: int = CACHE_SIZE):
+        self.formats = list(TypeInfo.DATE_FORMATS if formats is None else formats)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.stats = Counter()
+
+    @classmethod
+    def shared(cls, formats: list = None) -> "DateParser":
+        """Returns the process-wide parser for a list of formats, defaults to `TypeInfo.DATE_FORMATS`"""
+        key = tuple(TypeInfo.DATE_FORMATS if formats is None else formats)
+        if key not in cls._shared:
+            cls._shared[key] = cls(formats=list(key))
+        return cls._shared[key]
+
+    def clear(self):
+        self.cache.clear()
+        self.stats.clear()
+
+    @classmethod
+    def clear_shared(cls):
+        """Empties the caches of all process-wide parsers"""
+        for parser in cls._shared.values():
+            parser.clear()
+
+    def report(self) -> dict:
+        """Returns how many values were matched by each format, the cache and the fallback"""
+        return dict(self.stats)
+
+    def _remember(self, key, value):
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def factorize(series: pd.Series):
+        """
+        `pd.factorize`, except that equal values of different types (`1`, `1.0`, `True`) are kept apart.
+        Returns the codes (-1 for nulls) and the distinct values.
+        """
+        codes, uniques = pd.factorize(series)
+        if series.dtype != object or pd.api.types.infer_dtype(uniques, skipna=True) == "string":
+            return codes, uniques
+        types, _ = pd.factorize(series.map(type))
+        valid = np.flatnonzero(codes >= 0)
+        pair_codes, _ = pd.factorize(types[valid] * len(uniques) + codes[valid])
+        codes = np.full(len(series), -1)
+        codes[valid] = pair_codes
+        first = valid[np.unique(pair_codes, return_index=True)[1]]
+        return codes, series.to_numpy(dtype=object)[first]
+
+    def parse_unique(self, uniques, fallback=None, counts=None):
+        """
+        Parses an array of distinct values, `counts` is the number of rows holding each (for `stats`).
+        Returns a datetime64 array and a boolean mask of the values that could be parsed.
+        """
+        values = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]")
+        parsed = np.zeros(len(uniques), dtype=bool)
+        counts = np.ones(len(uniques), dtype=int) if counts is None else np.asarray(counts)
+
+        misses = []
+        for i, x in enumerate(uniques):
+            key = (type(x), x)
+            hit = self.cache.get(key, self._MISSING)
+            if hit is self._MISSING:
+                misses.append(i)
+            else:
+                self.cache.move_to_end(key)
+                values[i] = hit
+                parsed[i] = True
+        self.stats[self.CACHED] += int(counts.sum() - counts[misses].sum())
+
+        left = pd.Series(np.asarray(uniques, dtype=object)[misses], index=misses, dtype=object)
+        for fmt in self.formats:
+            if not len(left):
+                break
+            attempt = pd.to_datetime(left, format=fmt, errors="coerce")
+            hit = attempt.notnull().to_numpy()
+            values[left.index[hit]] = attempt[hit].to_numpy(dtype="datetime64[ns]")
+            parsed[left.index[hit]] = True
+            self.stats[fmt] += int(counts[left.index[hit]].sum())
+            left = left[~hit]
+
+        if fallback is not None:
+            for i, x in left.items():
+                try:
+                    value = fallback(x)
+                except (TypeError, ValueError, OverflowError):
+                    continue
+                # timezone-aware or non-date results are left to the caller
+                if value is pd.NaT or (isinstance(value, pd.Timestamp) and value.tz is None):
+                    values[i] = np.datetime64(value, "ns")
+                    parsed[i] = True
+                    self.stats[self.FALLBACK] += int(counts[i])
+
+        for i in misses:
+            if parsed[i]:
+                self._remember((type(uniques[i]), uniques[i]), values[i])
+
+        return values, parsed
+
+    def parse(self, series: pd.Series, fallback=None):
+        """
+        Parses a series by its distinct values and maps the results back to the rows.
+        Returns the parsed rows (nulls become NaT) and a boolean mask of the rows that could not be parsed.
+        """
+        codes, uniques = self.factorize(series)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        values, parsed = self.parse_unique(uniques, fallback=fallback, counts=counts)
+        logger.info(f"  ---> Date formats matched: {self.report()}")
+
+        # code -1 marks a null value, it maps to the NaT appended at the end
+        values = np.append(values, np.datetime64("NaT", "ns"))
+        rejected = np.append(~parsed, False)[codes]
+        accepted = codes[~rejected]
+        return pd.Series(values[accepted], index=series.index[~rejected]), rejected
@@ -0,0 +1,109 @@
+import logging
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from planner import ExecutionPlan
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class DeferredFrame:
+    """
+    The rendered stack of a lazy `StackHandler`, computed column by column on access.
+    `frame[name]` and `to_pandas(columns=[...])` read, parse, type, create and bin only the
+    requested columns and the columns they depend on; the rows are those passing every filter
+    of the stack, so the filtered columns are computed as well.
+    Computed columns stay in the handler's (unfiltered) dataframe, binned values in its
+    `binned_cols` and the filter selection here, so asking again costs only the row selection.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._selection = None
+        self._columns = {}
+
+    def plan(self, columns: list) -> ExecutionPlan:
+        """The execution plan of the stack restricted to `columns` (and the filtered columns)"""
+        stack = self.handler.stack
+        restricted = SimpleNamespace(
+            nameSpace=stack.nameSpace, columnOptions=stack.columnOptions, outputColumns=list(columns)
+        )
+        return ExecutionPlan(restricted, self.handler.source_columns)
+
+    @property
+    def columns(self) -> list:
+        """The output columns of the stack"""
+        return self.handler.plan().output
+
+    def _compute(self, plan: ExecutionPlan):
+        handler = self.handler
+        usecols = [x for x in plan.read if not handler.loaded or x not in handler.df.columns]
+        if usecols:
+            logger.info(f"  -> Reading {len(usecols)} of {len(handler.source_columns)} columns")
+            raw = handler._read(columns=usecols)
+            if handler.loaded:
+                for name in usecols:
+                    handler.df[name] = raw[name]
+            else:
+                handler.df = raw
+                handler.loaded = True
+        for new_col, old_col in plan.namespace.items():
+            if new_col not in handler.df.columns:
+                handler.df[new_col] = handler.df[old_col]
+
+        # columns computed before keep their stage flags, so the stages skip them
+        handler.execution_plan = plan
+        handler.apply_parse()
+        handler.apply_dtypes(on_created_cols=False)
+        handler.create_cols()
+        handler.apply_dtypes(on_created_cols=True)
+
+        for name in plan.bin:
+            if name not in handler.binned_cols:
+                col = handler.stack[name]
+                with handler._span("apply_bins", name):
+                    binned = handler._bins(col).apply(handler.df[name], col.bin_include)
+                handler.binned_cols[name] = binned.rename(name)
+                col.binned = True
+
+    def selection(self) -> np.ndarray:
+        """Rows passing every filter of the stack, computed once"""
+        if self._selection is None:
+            filtered = [col.name for col in self.handler.stack.columnOptions if col.filters]
+            cols = []
+            if filtered:
+                plan = self.plan(filtered)
+                self._compute(plan)
+                cols = [self.handler.stack[x] for x in plan.filter]
+            self._selection = self.handler._filter_selection(self.handler.df, cols)
+        return self._selection
+
+    def _column(self, name: str) -> pd.Series:
+        if name not in self._columns:
+            series = self.handler.binned_cols.get(name)
+            if series is None:
+                series = self.handler.df[name]
+            selection = self.selection()
+            self._columns[name] = series if selection.all() else series[selection]
+        return self._columns[name]
+
+    def to_pandas(self, columns: list = None) -> pd.DataFrame:
+        """The rendered `columns` (by default the output columns) of the rows passing the filters"""
+        columns = self.columns if columns is None else list(columns)
+        missing = [x for x in columns if x not in self._columns]
+        if missing:
+            self._compute(self.plan(missing))
+        return pd.DataFrame({name: self._column(name) for name in columns}, index=self._index())
+
+    def _index(self) -> pd.Index:
+        selection = self.selection()
+        index = self.handler.df.index
+        return index if selection.all() else index[selection]
+
+    def __getitem__(self, name: str) -> pd.Series:
+        if name not in self._columns:
+            self._compute(self.plan([name]))
+        return self._column(name)
@@ -0,0 +1,215 @@
+import logging
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    infer_dtype,
+    is_bool_dtype,
+    is_datetime64_any_dtype,
+    is_float_dtype,
+    is_integer_dtype,
+    is_numeric_dtype,
+)
+from type_info import TypeInfo
+from date_parser import DateParser
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+DTYPE_MAP = TypeInfo.DTYPE_MAP
+
+
+class DtypeConverter:
+    """
+    Whole-column converters for the data types in `TypeInfo.DTYPE_MAP`.
+    Every converter takes a series and returns `(converted, rejected)`: the converted values
+    of all rows it could handle in one vectorized pass, and a boolean mask of the rows it could not.
+    Rejected rows are converted one by one with the `DTYPE_MAP` function, so the output matches
+    `series.apply(DTYPE_MAP[dtype])`.
+
+    `cat` columns are stored as pandas Categoricals, use `compact` to also narrow numeric columns.
+
+    Bad values (rows the per-element function fails on) follow the `errors` policy:
+    "raise" = raise the error of the per-element function, like `apply` does
+    "coerce" = set the value to null and log how many values were coerced
+    """
+
+    ERRORS = ("raise", "coerce")
+
+    # nullable integer types, narrowest first
+    INT_DTYPES = ("Int8", "Int16", "Int32", "Int64")
+
+    # longest digit string that always fits in an int64
+    MAX_INT_DIGITS = 18
+    # timedelta64[ns] covers roughly +/- 292 years
+    MAX_DELTA_DAYS = 106751
+
+    @staticmethod
+    def to_int(series: pd.Series):
+        if is_bool_dtype(series) or (is_integer_dtype(series) and not series.hasnans):
+            return series.astype("int64"), np.zeros(len(series), dtype=bool)
+
+        if is_float_dtype(series):
+            rejected = ~np.isfinite(series.to_numpy(dtype="float64", na_value=np.nan))
+            return series[~rejected].astype("int64"), rejected
+
+        if infer_dtype(series, skipna=False) == "integer":
+            return series.astype("int64"), np.zeros(len(series), dtype=bool)
+
+        if infer_dtype(series, skipna=True) == "string":
+            stripped = series.str.strip()
+            accepted = stripped.str.fullmatch(r"[+-]?\d+") & (
+                stripped.str.lstrip("+-").str.len() <= DtypeConverter.MAX_INT_DIGITS
+            )
+            accepted = accepted.fillna(False).to_numpy(dtype=bool)
+            return stripped[accepted].astype("int64"), ~accepted
+
+        return series.iloc[:0], np.ones(len(series), dtype=bool)
+
+    @staticmethod
+    def to_float(series: pd.Series):
+        if is_numeric_dtype(series) and not series.hasnans:
+            return series.astype("float64"), np.zeros(len(series), dtype=bool)
+
+        if is_float_dtype(series):
+            return series.astype("float64"), np.zeros(len(series), dtype=bool)
+
+        converted = pd.to_numeric(series, errors="coerce").astype("float64")
+        rejected = (converted.isnull() & series.notnull()).to_numpy()
+        return converted[~rejected], rejected
+
+    @staticmethod
+    def to_bool(series: pd.Series):
+        if is_bool_dtype(series) and not series.hasnans:
+            return series.astype(bool), np.zeros(len(series), dtype=bool)
+
+        if is_numeric_dtype(series):
+            # bool(nan) is True, and so is nan != 0
+            rejected = series.isna().to_numpy() & (not is_float_dtype(series))
+            return series[~rejected] != 0, rejected
+
+        if infer_dtype(series, skipna=True) == "string":
+            lengths = series.str.len()
+            rejected = lengths.isnull().to_numpy()
+            return lengths[~rejected] > 0, rejected
+
+        return series.iloc[:0], np.ones(len(series), dtype=bool)
+
+    @staticmethod
+    def to_date(series: pd.Series, formats: list = None):
+        if is_datetime64_any_dtype(series):
+            return series, np.zeros(len(series), dtype=bool)
+
+        if is_numeric_dtype(series) and not is_bool_dtype(series):
+            return pd.to_datetime(series), np.zeros(len(series), dtype=bool)
+
+        return DateParser.shared(formats).parse(series, fallback=DTYPE_MAP["date"])
+
+    @staticmethod
+    def to_delta(series: pd.Series):
+        if is_numeric_dtype(series) and not is_bool_dtype(series):
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
+            accepted = np.abs(values) <= DtypeConverter.MAX_DELTA_DAYS
+            return pd.to_timedelta(series[accepted], unit="D"), ~accepted
+
+        return series.iloc[:0], np.ones(len(series), dtype=bool)
+
+    @staticmethod
+    def to_str(series: pd.Series):
+        if is_bool_dtype(series) or is_integer_dtype(series) or is_float_dtype(series):
+            # str(nan) is "nan", while astype(str) may keep it as a missing value
+            rejected = series.isnull().to_numpy()
+            return series[~rejected].astype(str), rejected
+
+        if infer_dtype(series, skipna=True) == "string":
+            rejected = series.isnull().to_numpy()
+            return series[~rejected], rejected
+
+        return series.iloc[:0], np.ones(len(series), dtype=bool)
+
+    @staticmethod
+    def to_cat(series: pd.Series):
+        return series.astype("category"), np.zeros(len(series), dtype=bool)
+
+    CONVERTERS = {
+        "int": to_int,
+        "float": to_float,
+        "bool": to_bool,
+        "date": to_date,
+        "delta": to_delta,
+        "str": to_str,
+        "cat": to_cat,
+    }
+
+    @classmethod
+    def convert(cls, series: pd.Series, dtype: str, errors: str = "raise", date_formats: list = None) -> pd.Series:
+        """
+        Converts a full column to `dtype`, falling back to `DTYPE_MAP` only for rejected rows.
+        `date` strings are tried against `date_formats` in order, by default `TypeInfo.DATE_FORMATS`.
+        """
+        if dtype not in cls.CONVERTERS:
+            raise TypeError(
+                f"Data type `{dtype}` is not known! Options are: {list(cls.CONVERTERS)}"
+            )
+        if errors not in cls.ERRORS:
+            raise ValueError(f"Errors policy `{errors}` is not known! Options are: {cls.ERRORS}")
+
+        kwargs = {"formats": date_formats} if dtype == "date" else {}
+        converted, rejected = cls.CONVERTERS[dtype].__func__(series, **kwargs)
+        if not rejected.any():
+            return converted.set_axis(series.index)
+
+        logger.info(f"  ---> {rejected.sum()} values converted one by one as `{dtype}`")
+        fallback = cls._convert_elements(series[rejected], dtype, errors)
+
+        positions = np.arange(len(series))
+        order = np.concatenate([positions[~rejected], positions[rejected]])
+        merged = pd.concat(
+            [converted.reset_index(drop=True), fallback.reset_index(drop=True)],
+            ignore_index=True,
+        )
+        merged = merged.iloc[np.argsort(order, kind="stable")].infer_objects()
+        return merged.set_axis(series.index)
+
+    @classmethod
+    def compact(cls, series: pd.Series, dtype: str, integers: bool = True, float32: bool = False) -> pd.Series:
+        """
+        Stores a converted column in the least memory that keeps its values:
+        with `integers` an `int` column becomes the narrowest nullable integer type holding its min and max,
+        with `float32` a `float` column becomes float32 (about 7 significant digits).
+        """
+        if dtype == "int" and integers:
+            values = series.astype("Int64")
+            low, high = values.min(), values.max()
+            if pd.isnull(low):
+                return values.astype(cls.INT_DTYPES[0])
+            for int_dtype in cls.INT_DTYPES:
+                info = np.iinfo(int_dtype.lower())
+                if info.min <= low and high <= info.max:
+                    return values.astype(int_dtype)
+        if dtype == "float" and float32:
+            return series.astype("float32")
+        return series
+
+    @staticmethod
+    def _convert_elements(series: pd.Series, dtype: str, errors: str) -> pd.Series:
+        func = DTYPE_MAP[dtype]
+        if errors == "raise":
+            return series.apply(func).astype(object)
+
+        bad = []
+
+        def _convert(x):
+            try:
+                return func(x)
+            except (TypeError, ValueError, OverflowError):
+                bad.append(x)
+                return None
+
+        converted = series.apply(_convert).astype(object)
+        if bad:
+            logger.warning(
+                f"  ---> {len(bad)} values could not be converted to `{dtype}` and were set to null,"
+                f" e.g. {bad[:3]}"
+            )
+        return converted
@@ -0,0 +1,171 @@
+import argparse
+import json
+import logging
+import numpy as np
+import pandas as pd
+from date_parser import DateParser
+from io_backends import CsvBackend, IOBackends
+from sampling import GroupSample
+from type_info import TypeInfo
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class DtypeInference:
+    """
+    Proposes a `dtype` for every column of an input from a sample of its rows.
+    Values are classified by their Python type through `TypeInfo.DTYPE_MAP_REV`: integral values
+    without nulls are `int`, other numbers `float`, booleans without nulls `bool`. Strings are `date`
+    when every sampled value matches one of `DATE_FORMATS` (the formats that matched are proposed
+    with it), `cat` when they have few distinct values, else `str`.
+    Proposals look like `{name: {"dtype": "date", "date_formats": [...]}}`; `config` turns them into
+    a stack config and `StackHandler(dtype_hints=...)` applies them while reading the input.
+    """
+
+    SAMPLE_ROWS = 100_000
+    MAX_CATEGORIES = 1000
+    CAT_RATIO = 0.05
+
+    # tried in the order `DateParser` tries them
+    DATE_FORMATS = TypeInfo.DATE_FORMATS
+
+    def __init__(
+        self,
+        sample_rows: int = SAMPLE_ROWS,
+        fraction: float = None,
+        seed: int = 0,
+        max_categories: int = MAX_CATEGORIES,
+        cat_ratio: float = CAT_RATIO,
+    ):
+        """
+        The sample is the first `sample_rows` rows of the input, or with a `fraction`
+        a `GroupSample` of rows spread over the whole input (which streams the whole input once).
+        """
+        self.sample_rows = sample_rows
+        self.fraction = fraction
+        self.seed = seed
+        self.max_categories = max_categories
+        self.cat_ratio = cat_ratio
+
+    def sample(self, input_file: str, input_format: str = None) -> pd.DataFrame:
+        reader = IOBackends.get(input_file, input_format)
+        if self.fraction is None:
+            return next(iter(reader.iter_chunks(input_file, self.sample_rows)), pd.DataFrame())
+        return GroupSample(self.fraction, seed=self.seed).sample(reader.iter_chunks(input_file, self.sample_rows))
+
+    def infer_file(self, input_file: str, input_format: str = None) -> dict:
+        """Proposals for every column of a file"""
+        return self.infer(self.sample(input_file, input_format))
+
+    def infer(self, df: pd.DataFrame) -> dict:
+        """Proposals for every column of a dataframe"""
+        proposals = {name: self.infer_series(df[name]) for name in df.columns}
+        logger.info(f"  -> Proposed dtypes: { {k: v['dtype'] for k, v in proposals.items()} }")
+        return proposals
+
+    def infer_series(self, series: pd.Series) -> dict:
+        values = series.dropna()
+        uniques = pd.unique(values)
+        types = {TypeInfo.DTYPE_MAP_REV.get(type(x), "str") for x in uniques.tolist()}
+        nulls = len(values) < len(series)
+
+        if types == {"bool"}:
+            return {"dtype": "str" if nulls else "bool"}
+        if types and types <= {"int", "float"}:
+            integral = np.all(np.mod(uniques.astype("float64"), 1) == 0)
+            return {"dtype": "int" if integral and not nulls else "float"}
+        if types == {"date"}:
+            return {"dtype": "date"}
+        if types == {"str"}:
+            date_formats = self.date_formats(uniques)
+            if date_formats:
+                return {"dtype": "date", "date_formats": date_formats}
+            if len(uniques) <= self.max_categories and len(uniques) <= self.cat_ratio * len(values):
+                return {"dtype": "cat"}
+        return {"dtype": "str"}
+
+    def date_formats(self, uniques) -> list:
+        """The formats of `DATE_FORMATS` that parse all the strings, empty if any string is left"""
+        left = pd.Series(np.asarray(uniques, dtype=object))
+        matched = []
+        for fmt in self.DATE_FORMATS:
+            if not len(left):
+                break
+            hit = pd.to_datetime(left, format=fmt, errors="coerce").notnull().to_numpy()
+            if hit.any():
+                matched.append(fmt)
+                left = left[~hit]
+        return matched if matched and not len(left) else []
+
+    @staticmethod
+    def config(proposals: dict) -> dict:
+        """A stack config typing every column as proposed"""
+        return {"columnOptions": [{"name": name, "dtype": x["dtype"]} for name, x in proposals.items()]}
+
+    @staticmethod
+    def merge(config: dict, proposals: dict) -> dict:
+        """
+        A copy of `config` where the input columns without a `dtype` (that are not parsed or created)
+        get the proposed one
+        """
+        merged = dict(config)
+        merged["columnOptions"] = []
+        for options in config.get("columnOptions", []):
+            options = dict(options)
+            proposal = proposals.get(options["name"])
+            plain = not options.get("dtype") and not options.get("parse_funcs") and not options.get("create_func")
+            if proposal is not None and plain:
+                options["dtype"] = proposal["dtype"]
+            merged["columnOptions"].append(options)
+        return merged
+
+    @staticmethod
+    def read_kwargs(reader, hints: dict) -> dict:
+        """Reader arguments typing the `cat` columns of `hints` while a CSV is read"""
+        dtypes = {name: "category" for name, x in hints.items() if x["dtype"] == "cat"}
+        if reader is CsvBackend and dtypes:
+            return {"dtypes": dtypes}
+        return {}
+
+    @staticmethod
+    def apply(df: pd.DataFrame, hints: dict) -> pd.DataFrame:
+        """
+        Types the columns of `hints` that the reader left untyped: `cat` columns become categorical and
+        `date` columns are parsed with their detected formats. A date column with a string matching no
+        format (nor `pd.to_datetime`) is left as it is, for `apply_dtypes` and its `dtype_errors` policy.
+        """
+        for name, x in hints.items():
+            if name not in df.columns:
+                continue
+            if x["dtype"] == "cat" and not isinstance(df[name].dtype, pd.CategoricalDtype):
+                df[name] = df[name].astype("category")
+            elif x["dtype"] == "date" and x.get("date_formats"):
+                parsed, rejected = DateParser.shared(x["date_formats"]).parse(
+                    df[name], fallback=TypeInfo.DTYPE_MAP["date"]
+                )
+                if rejected.any():
+                    logger.info(f"  ---> {rejected.sum()} values of `{name}` match no date format, left to `apply_dtypes`")
+                    continue
+                df[name] = parsed
+        return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Proposes a dtype for every column of an input file")
+    parser.add_argument("input_file")
+    parser.add_argument("--input-format", default=None)
+    parser.add_argument("--sample-rows", type=int, default=DtypeInference.SAMPLE_ROWS)
+    parser.add_argument("--fraction", type=float, default=None, help="sample rows over the whole input")
+    parser.add_argument("--proposals", action="store_true", help="print the proposals with the date formats")
+    args = parser.parse_args(argv)
+
+    inference = DtypeInference(sample_rows=args.sample_rows, fraction=args.fraction)
+    proposals = inference.infer_file(args.input_file, args.input_format)
+    print(json.dumps(proposals if args.proposals else DtypeInference.config(proposals), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import logging
+import os
+import numpy as np
+import pandas as pd
+from type_info import TypeInfo
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet and Feather/Arrow files need `pyarrow`, install it first") from e
+    return pyarrow
+
+
+class CsvBackend:
+    """Comma separated text files, read and written with pandas"""
+
+    @staticmethod
+    def columns(path: str) -> list:
+        return list(pd.read_csv(path, sep=",", header=0, nrows=0).columns)
+
+    @staticmethod
+    def read(path: str, columns: list = None, filters: list = None, dtypes: dict = None) -> pd.DataFrame:
+        """CSV has no row groups, `filters` are left to the render. `dtypes` are passed on to `read_csv`"""
+        return pd.read_csv(path, sep=",", header=0, usecols=columns, dtype=dtypes)
+
+    @staticmethod
+    def iter_chunks(path: str, chunksize: int, columns: list = None, dtypes: dict = None):
+        with pd.read_csv(path, sep=",", header=0, usecols=columns, dtype=dtypes, chunksize=chunksize) as reader:
+            yield from reader
+
+    @staticmethod
+    def write(df: pd.DataFrame, path: str, **kwargs):
+        # row labels are not a column of the output
+        kwargs.setdefault("index", False)
+        df.to_csv(path, **kwargs)
+
+
+class ParquetBackend:
+    """
+    Parquet files, read memory-mapped through pyarrow.
+    Only the requested columns are read, and row groups whose min/max statistics show that
+    no row can pass the column `filters` are skipped. The remaining rows keep their position in
+    the file as index, like a CSV read does; exact filtering is left to the render.
+    """
+
+    ROW_GROUP_SIZE = 1_000_000
+
+    @staticmethod
+    def columns(path: str) -> list:
+        pa = _pyarrow()
+        return list(pa.parquet.read_schema(path, memory_map=True).names)
+
+    @staticmethod
+    def read(path: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+        """`filters` are the stack columns whose filters may skip row groups"""
+        pa = _pyarrow()
+        parquet_file = pa.parquet.ParquetFile(path, memory_map=True)
+        metadata = parquet_file.metadata
+        offsets = np.cumsum([0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+
+        predicates = ColumnarFilters.from_stack(filters or [], parquet_file.schema_arrow)
+        groups = ParquetBackend.row_groups(parquet_file, predicates)
+        if len(groups) < metadata.num_row_groups:
+            skipped = metadata.num_row_groups - len(groups)
+            logger.info(f"  ---> Skipped {skipped} of {metadata.num_row_groups} row groups")
+        table = parquet_file.read_row_groups(groups, columns=columns, use_pandas_metadata=False)
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        positions = [np.arange(offsets[i], offsets[i + 1]) for i in groups]
+        df.index = np.concatenate(positions) if positions else np.arange(0)
+        return df
+
+    @staticmethod
+    def row_groups(parquet_file, filters: dict) -> list:
+        """Numbers of the row groups that may hold rows passing `filters`"""
+        names = parquet_file.schema_arrow.names
+        groups = []
+        for i in range(parquet_file.metadata.num_row_groups):
+            row_group = parquet_file.metadata.row_group(i)
+            keep = True
+            for name, predicates in filters.items():
+                if name not in names:
+                    continue
+                stats = row_group.column(names.index(name)).statistics
+                if stats is None or not stats.has_min_max:
+                    continue
+                for func_name, value in predicates:
+                    if not ColumnarFilters.may_match(func_name, value, stats):
+                        keep = False
+            if keep:
+                groups.append(i)
+        return groups
+
+    @staticmethod
+    def iter_chunks(path: str, chunksize: int, columns: list = None):
+        pa = _pyarrow()
+        parquet_file = pa.parquet.ParquetFile(path, memory_map=True)
+        start = 0
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns, use_pandas_metadata=False):
+            chunk = batch.to_pandas(split_blocks=True, self_destruct=True)
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+
+    @staticmethod
+    def write(df: pd.DataFrame, path: str, **kwargs):
+        kwargs.setdefault("row_group_size", ParquetBackend.ROW_GROUP_SIZE)
+        df.to_parquet(path, engine="pyarrow", **kwargs)
+
+
+class FeatherBackend:
+    """
+    Feather v2 / Arrow IPC files, memory-mapped through pyarrow.
+    Uncompressed files are read without copying the buffers; the format has no
+    statistics, so only columns are pruned and `filters` are left to the render.
+    """
+
+    @staticmethod
+    def _open(path: str):
+        pa = _pyarrow()
+        return pa.ipc.open_file(pa.memory_map(path, "r"))
+
+    @staticmethod
+    def columns(path: str) -> list:
+        return list(FeatherBackend._open(path).schema.names)
+
+    @staticmethod
+    def read(path: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+        table = FeatherBackend._open(path).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas(split_blocks=True, use_threads=True)
+
+    @staticmethod
+    def iter_chunks(path: str, chunksize: int, columns: list = None):
+        reader = FeatherBackend._open(path)
+        table = reader.read_all()
+        if columns is not None:
+            table = table.select(columns)
+        for start in range(0, table.num_rows, chunksize):
+            chunk = table.slice(start, chunksize).to_pandas(split_blocks=True)
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            yield chunk
+
+    @staticmethod
+    def write(df: pd.DataFrame, path: str, **kwargs):
+        pa = _pyarrow()
+        kwargs.setdefault("compression", "uncompressed")
+        table = pa.Table.from_pandas(df, preserve_index=None)
+        pa.feather.write_feather(table, path, **kwargs)
+
+
+class ColumnarFilters:
+    """Translates column `filters` into predicates a columnar reader can check against statistics"""
+
+    # the stored type must match the configured dtype, else the filter value is compared to raw values
+    ARROW_TYPES = {
+        "int": ("is_integer",),
+        "float": ("is_integer", "is_floating"),
+        "bool": ("is_boolean",),
+        "date": ("is_timestamp", "is_date"),
+        "str": ("is_string", "is_large_string"),
+        "cat": ("is_string", "is_large_string"),
+    }
+
+    @staticmethod
+    def from_stack(cols: list, schema=None) -> dict:
+        """
+        Returns `{column: [(func_name, typed value), ...]}` for the filters that can be checked
+        on the stored values. `schema` is the arrow schema of the file, used to skip columns whose
+        stored type does not match the configured dtype.
+        Applies to columns read straight from the file, not parsed, created or namespaced.
+        """
+        filters = {}
+        for col in cols:
+            if not col.filters or col.dtype not in ColumnarFilters.ARROW_TYPES:
+                continue
+            if schema is not None and not ColumnarFilters._matches(col, schema):
+                continue
+            filters[col.name] = [
+                (func_name, TypeInfo.DTYPE_MAP[col.dtype](value))
+                for func_name, value in col.filters.items()
+            ]
+        return filters
+
+    @staticmethod
+    def _matches(col, schema) -> bool:
+        pa = _pyarrow()
+        if col.name not in schema.names:
+            return False
+        arrow_type = schema.field(col.name).type
+        return any(getattr(pa.types, x)(arrow_type) for x in ColumnarFilters.ARROW_TYPES[col.dtype])
+
+    @staticmethod
+    def may_match(func_name: str, value, stats) -> bool:
+        """False only if no value between the row group's min and max can pass the filter"""
+        low, high = stats.min, stats.max
+        try:
+            if func_name == "__lt__":
+                return low < value
+            if func_name == "__le__":
+                return low <= value
+            if func_name == "__gt__":
+                return high > value
+            if func_name == "__ge__":
+                return high >= value
+            if func_name == "__eq__":
+                return low <= value <= high
+            if func_name == "__ne__":
+                # nulls pass a not-equal filter
+                return not (low == high == value) or stats.null_count != 0
+        except TypeError:
+            pass
+        return True
+
+
+class IOBackends:
+    """Picks the reader/writer of a file by its format name or extension"""
+
+    FORMATS = {
+        "csv": CsvBackend,
+        "parquet": ParquetBackend,
+        "feather": FeatherBackend,
+    }
+
+    EXTENSIONS = {
+        ".csv": "csv",
+        ".parquet": "parquet",
+        ".pq": "parquet",
+        ".feather": "feather",
+        ".arrow": "feather",
+        ".ipc": "feather",
+    }
+
+    @staticmethod
+    def get(path: str, file_format: str = None):
+        if file_format is None:
+            extension = os.path.splitext(path)[1].lower()
+            file_format = IOBackends.EXTENSIONS.get(extension, "csv")
+        if file_format not in IOBackends.FORMATS:
+            raise ValueError(
+                f"File format `{file_format}` is not known! Options are: {list(IOBackends.FORMATS)}"
+            )
+        return IOBackends.FORMATS[file_format]
+
+    @staticmethod
+    def convert(input_file: str, output_file: str, input_format: str = None, output_format: str = None, **kwargs):
+        """Re-writes a file in another format, keeping the row order so row positions stay the same"""
+        df = IOBackends.get(input_file, input_format).read(input_file)
+        writer = IOBackends.get(output_file, output_format)
+        writer.write(df.reset_index(drop=True), output_file, **kwargs)
+        logger.info(f"  -> Converted {len(df)} rows from `{input_file}` to `{output_file}`")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an input file to CSV, Parquet or Feather/Arrow")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument("--input-format", choices=list(IOBackends.FORMATS))
+    parser.add_argument("--output-format", choices=list(IOBackends.FORMATS))
+    args = parser.parse_args(argv)
+    IOBackends.convert(args.input_file, args.output_file, args.input_format, args.output_format)
+
+
+if __name__ == "__main__":
+    main()
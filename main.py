@@ -1,30 +1,14 @@
-import pandas as pd 
-import column_options
 import os
-import json
+import sys
+import batch
 
-# load config file
-with open('config.json', "r") as config_file:
-	payload = json.load(config_file)
-
-print(payload)
-
-# set directories and load input
+# without arguments: the former single-file run, `config.json` on `inputs/ADT.csv` into `outputs/output.csv`
 BASE_DIR = os.path.join(os.path.dirname(__file__))
-INPUT_DIR = os.path.join(BASE_DIR, "inputs")
-INPUT_FILE = os.path.join(INPUT_DIR, "ADT.csv")
-
-#load input and config with column options
-sh =column_options.StackHandler(INPUT_FILE)
-sh.load(payload)
-print(sh.df)
-
-#write to csv
-
+INPUT_FILE = os.path.join(BASE_DIR, "inputs", "ADT.csv")
 OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "output.csv")
-data = sh.df
-data.to_csv(OUTPUT_FILE)
-
-
 
+if __name__ == "__main__":
+    # e.g. `python main.py config.json "inputs/*.csv" --output-dir outputs --workers 4 --compression gzip`
+    argv = sys.argv[1:] or ["config.json", INPUT_FILE, "--combined", OUTPUT_FILE]
+    sys.exit(batch.main(argv))
@@ -0,0 +1,274 @@
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from binner import BinIndex
+from io_backends import CsvBackend, FeatherBackend, IOBackends, ParquetBackend, _pyarrow
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class _CsvSink:
+    """Chunks formatted as CSV text and compressed one by one: gzip members and zstd frames concatenate"""
+
+    def __init__(self, path: str, compression: str, index: bool):
+        self.compression = compression
+        self.index = index
+        self.header = True
+        self._handle = open(path, "wb")
+
+    def prepare(self, df: pd.DataFrame):
+        """Called in order, returns the arguments of `format`"""
+        header, self.header = self.header, False
+        return df, header
+
+    def format(self, df: pd.DataFrame, header: bool) -> bytes:
+        data = df.to_csv(header=header, index=self.index).encode()
+        if self.compression == "gzip":
+            return gzip.compress(data, compresslevel=OutputWriter.GZIP_LEVEL)
+        if self.compression == "zstd":
+            return _pyarrow().Codec("zstd").compress(data, asbytes=True)
+        return data
+
+    def append(self, data: bytes):
+        self._handle.write(data)
+
+    def close(self):
+        self._handle.close()
+
+
+class _ArrowSink:
+    """Chunks converted to arrow tables, written as parquet row groups or feather record batches"""
+
+    def __init__(self, path: str, compression: str, index: bool, backend):
+        self.path = path
+        self.compression = compression
+        self.index = index
+        self.backend = backend
+        self.schema = None
+        self._writer = None
+
+    def prepare(self, df: pd.DataFrame):
+        return (df,)
+
+    def format(self, df: pd.DataFrame):
+        return _pyarrow().Table.from_pandas(df, preserve_index=self.index)
+
+    def append(self, table):
+        pa = _pyarrow()
+        if self._writer is None:
+            self.schema = table.schema
+            if self.backend is ParquetBackend:
+                self._writer = pa.parquet.ParquetWriter(self.path, self.schema, compression=self.compression or "none")
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                self._writer = pa.ipc.new_file(self.path, self.schema, options=options)
+        elif not table.schema.equals(self.schema):
+            # e.g. categorical codes or all-null columns stored differently in another chunk
+            try:
+                table = table.cast(self.schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError) as e:
+                raise ValueError(f"Chunk schema does not match the first chunk of `{self.path}`: {e}") from e
+        if self.backend is ParquetBackend:
+            self._writer.write_table(table, row_group_size=ParquetBackend.ROW_GROUP_SIZE)
+        else:
+            self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class OutputWriter:
+    """
+    Writes rendered rows to an output file as they come, e.g. the chunks of `StackHandler.iter_render`.
+    Chunks are split into `chunksize` rows and formatted and compressed by `workers` threads while
+    earlier chunks are written, in order, by one writer thread; at most `2 * workers` chunks are held.
+    CSV chunks become gzip members or zstd frames of one valid stream; parquet chunks become row groups
+    and feather chunks record batches, compressed by arrow (feather knows zstd but not gzip).
+    With `partition_by` the rows go to one file per value of a low-cardinality column (e.g. a binned
+    column), `<column>=<value>/part<extension>` under the output path.
+    Every file is written to a temp file next to it and renamed into place by `close`, so no reader
+    sees a partial output; on an error in a `with` block the temp files are removed instead.
+    Partitions are written into a temp directory next to the output path, which replaces the whole
+    output directory on `close`: partitions of an earlier run that this run has no rows for are removed.
+    """
+
+    COMPRESSIONS = ("gzip", "zstd")
+    EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+    CHUNKSIZE = 100_000
+    GZIP_LEVEL = 6
+    NULL_PARTITION = "__null__"
+
+    def __init__(
+        self,
+        path: str,
+        output_format: str = None,
+        compression: str = None,
+        partition_by: str = None,
+        workers: int = None,
+        chunksize: int = CHUNKSIZE,
+        index: bool = False,
+    ):
+        stem, extension = os.path.splitext(path)
+        if compression is None and output_format in (None, "csv"):
+            compression = {v: k for k, v in self.EXTENSIONS.items()}.get(extension.lower())
+        if compression is not None and output_format is None and extension.lower() == self.EXTENSIONS.get(compression):
+            # `out.csv.gz` is a compressed csv
+            output_format = IOBackends.EXTENSIONS.get(os.path.splitext(stem)[1].lower(), "csv")
+        if compression is not None and compression not in self.COMPRESSIONS:
+            raise ValueError(f"Compression `{compression}` is not known! Options are: {list(self.COMPRESSIONS)}")
+        self.backend = IOBackends.get(path, output_format)
+        if self.backend is FeatherBackend and compression == "gzip":
+            raise ValueError("Feather files are compressed with `zstd`, not `gzip`")
+        if not chunksize or chunksize < 1:
+            raise ValueError(f"Chunk size must be a positive integer, got `{chunksize}`")
+
+        self.output_format = {backend: name for name, backend in IOBackends.FORMATS.items()}[self.backend]
+        self.path = path
+        self.compression = compression
+        self.partition_by = partition_by
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.index = index
+        self.rows = 0
+        self.paths = []
+        self._sinks = {}
+        self._staging = None
+        self._pending = deque()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._closed = False
+
+    def _extension(self) -> str:
+        extension = {v: k for k, v in reversed(list(IOBackends.EXTENSIONS.items()))}[self.output_format]
+        if self.backend is CsvBackend and self.compression:
+            extension += self.EXTENSIONS[self.compression]
+        return extension
+
+    def _target(self, value) -> str:
+        if self.partition_by is None:
+            return self.path
+        name = self.NULL_PARTITION if pd.isnull(value) else str(value).replace(os.sep, "_")
+        return os.path.join(self._staging_dir(), f"{self.partition_by}={name}", "part" + self._extension())
+
+    def _staging_dir(self) -> str:
+        """The temp directory partitions are written to, swapped with the output directory by `close`"""
+        if self._staging is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._staging = tempfile.mkdtemp(prefix=f".{os.path.basename(self.path)}.", suffix=".tmp", dir=directory)
+        return self._staging
+
+    def _swap(self):
+        """Replaces the output directory (or file) with the staged partitions"""
+        staging = self._staging_dir()
+        previous = staging + ".old"
+        if os.path.lexists(self.path):
+            os.replace(self.path, previous)
+        os.replace(staging, self.path)
+        self._staging = None
+        if os.path.isdir(previous) and not os.path.islink(previous):
+            shutil.rmtree(previous)
+        elif os.path.lexists(previous):
+            os.remove(previous)
+
+    def _sink(self, target: str):
+        if target not in self._sinks:
+            directory = os.path.dirname(os.path.abspath(target))
+            os.makedirs(directory, exist_ok=True)
+            handle, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix=".tmp", dir=directory)
+            os.close(handle)
+            if self.backend is CsvBackend:
+                sink = _CsvSink(tmp_path, self.compression, self.index)
+            else:
+                sink = _ArrowSink(tmp_path, self.compression, self.index, self.backend)
+            self._sinks[target] = (tmp_path, sink)
+        return self._sinks[target][1]
+
+    def write(self, df: pd.DataFrame):
+        """Queues rows for writing, returns once at most `2 * workers` chunks are waiting"""
+        if self._closed:
+            raise ValueError("The output writer is closed")
+        # an empty frame still writes the csv header or the arrow schema
+        for start in range(0, len(df), self.chunksize) if len(df) else [0]:
+            chunk = df.iloc[start:start + self.chunksize]
+            if self.partition_by is None:
+                self._submit(self.path, chunk)
+                continue
+            bins = BinIndex(chunk[self.partition_by])
+            for value, positions in bins.as_dict(remove_nan=False, positions=True).items():
+                self._submit(self._target(value), chunk.iloc[positions])
+        self.rows += len(df)
+
+    def _submit(self, target: str, df: pd.DataFrame):
+        sink = self._sink(target)
+        formatted = self._pool.submit(sink.format, *sink.prepare(df))
+        # one writer thread appends the formatted chunks in the order they were queued
+        self._pending.append(self._writer.submit(lambda: sink.append(formatted.result())))
+        while len(self._pending) > 2 * self.workers:
+            self._pending.popleft().result()
+
+    def _drain(self):
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self) -> list:
+        """Waits for every chunk, renames the files into place and returns their paths"""
+        if self._closed:
+            return self.paths
+        try:
+            self._drain()
+            for target, (tmp_path, sink) in self._sinks.items():
+                sink.close()
+                os.replace(tmp_path, target)
+            if self.partition_by is None:
+                self.paths = list(self._sinks)
+            else:
+                self.paths = [os.path.join(self.path, os.path.relpath(x, self._staging_dir())) for x in self._sinks]
+                self._swap()
+        except BaseException:
+            self.abort()
+            raise
+        self._shutdown()
+        logger.info(f"  -> Wrote {self.rows} rows to {len(self.paths)} file(s) under `{self.path}`")
+        return self.paths
+
+    def abort(self):
+        """Drops everything written so far, no output file is created or replaced"""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._shutdown()
+        for tmp_path, sink in self._sinks.values():
+            try:
+                sink.close()
+            except Exception:
+                pass
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._sinks = {}
+        if self._staging is not None:
+            shutil.rmtree(self._staging, ignore_errors=True)
+            self._staging = None
+
+    def _shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,177 @@
+import logging
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from column_options import ColumnStack, StackHandler
+from io_backends import IOBackends
+from planner import ExecutionPlan
+from spill import HashPartitioner
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class ColumnarFiles:
+    """
+    Writes a dataframe as one file per column, so worker processes can memory-map it.
+    Numeric, boolean and datetime columns are stored as `.npy` arrays; any other column
+    is factorized into an `.npy` array of codes plus its pickled distinct values and dtype.
+    """
+
+    META_FILE = "columns.pkl"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{len(name)}_{abs(hash(name))}{suffix}")
+
+    def write(self, df: pd.DataFrame):
+        meta = {"columns": [], "index": self._path("__index__", ".npy")}
+        np.save(meta["index"], df.index.to_numpy())
+        for name in df.columns:
+            series = df[name]
+            path = self._path(name, ".npy")
+            if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufmM":
+                np.save(path, series.to_numpy())
+                meta["columns"].append((name, path, None))
+            else:
+                codes, uniques = pd.factorize(series)
+                np.save(path, codes)
+                uniques_path = self._path(name, ".pkl")
+                with open(uniques_path, "wb") as f:
+                    pickle.dump((np.asarray(uniques, dtype=object), series.dtype), f)
+                meta["columns"].append((name, path, uniques_path))
+
+        with open(os.path.join(self.directory, self.META_FILE), "wb") as f:
+            pickle.dump(meta, f)
+
+    def read(self, positions: np.ndarray = None) -> pd.DataFrame:
+        """Reads the rows at `positions` (all rows by default) from the memory-mapped columns"""
+        with open(os.path.join(self.directory, self.META_FILE), "rb") as f:
+            meta = pickle.load(f)
+
+        def take(path):
+            values = np.load(path, mmap_mode="r")
+            return np.array(values if positions is None else values[positions])
+
+        columns = {}
+        for name, path, uniques_path in meta["columns"]:
+            values = take(path)
+            if uniques_path is not None:
+                with open(uniques_path, "rb") as f:
+                    uniques, dtype = pickle.load(f)
+                values = pd.array(np.append(uniques, None)[values], dtype=dtype)
+            columns[name] = values
+        return pd.DataFrame(columns, index=take(meta["index"]))
+
+
+def _render_partition(directory: str, positions_file: str, config: dict, output_file: str, options: dict):
+    """Worker: renders one partition of the memory-mapped input and writes the result to `output_file`"""
+    positions = np.load(positions_file)
+    df = ColumnarFiles(directory).read(positions)
+    handler = StackHandler.from_frame(df, **options)
+    handler.load(config)
+    handler.output_df.to_pickle(output_file)
+    return len(df), len(handler.df)
+
+
+class ParallelRenderer:
+    """
+    Renders an input file on a process pool.
+    The needed input columns are read once and written as memory-mapped column files,
+    rows are split into one partition per worker and every worker runs the full render chain
+    on its partition. Results are concatenated back in the original row order.
+    Rows are partitioned by hashing `partition_key`, so the rows of a group always land in the
+    same partition; without a key the group key of the group-wise create functions is used,
+    and inputs without group-wise functions are split into contiguous ranges.
+    With `prune` only the input columns the config needs are read; other `options` are passed
+    on to the `StackHandler` of every partition.
+    """
+
+    def __init__(
+        self,
+        input_file: str,
+        config: dict,
+        workers: int = None,
+        partition_key: str = None,
+        tmp_dir: str = None,
+        prune: bool = False,
+        input_format: str = None,
+        **options,
+    ):
+        self.input_file = input_file
+        self.config = config
+        self.workers = workers or os.cpu_count()
+        self.partition_key = partition_key
+        self.tmp_dir = tmp_dir
+        self.prune = prune
+        self.reader = IOBackends.get(input_file, input_format)
+        self.options = options
+
+    def _plan(self) -> ExecutionPlan:
+        stack = ColumnStack.Schema().load(self.config)
+        return ExecutionPlan(stack, self.reader.columns(self.input_file))
+
+    def group_key(self, plan: ExecutionPlan) -> str:
+        """The input column rows are partitioned by, None for contiguous ranges"""
+        if self.partition_key:
+            return self.partition_key
+
+        return plan.group_key()
+
+    def partitions(self, df: pd.DataFrame, key: str) -> list:
+        """Row positions of every partition"""
+        if key is None:
+            return np.array_split(np.arange(len(df)), self.workers)
+        buckets = pd.util.hash_pandas_object(df[key], index=False).to_numpy() % self.workers
+        return [np.flatnonzero(buckets == n) for n in range(self.workers)]
+
+    def render(self) -> pd.DataFrame:
+        plan = self._plan()
+        if plan.whole_input:
+            raise ValueError(
+                f"Columns {plan.whole_input} are computed by functions that are not row-local "
+                f"and need every row of the input, they cannot be rendered in partitions"
+            )
+        key = self.group_key(plan)
+        usecols = None
+        if self.prune:
+            usecols = plan.read if key is None or key in plan.read else plan.read + [key]
+        df = self.reader.read(self.input_file, columns=usecols)
+        logger.info(f"  -> Rendering {len(df)} rows on {self.workers} workers, partitioned by `{key}`")
+
+        with tempfile.TemporaryDirectory(dir=self.tmp_dir) as directory:
+            jobs = []
+            for n, positions in enumerate(self.partitions(df, key)):
+                if not len(positions):
+                    continue
+                positions_file = os.path.join(directory, f"partition_{n}.npy")
+                np.save(positions_file, positions)
+                jobs.append((positions_file, os.path.join(directory, f"output_{n}.pkl")))
+            ColumnarFiles(directory).write(df)
+            del df
+
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                    pool.submit(
+                        _render_partition, directory, positions_file, self.config, output_file, self.options
+                    )
+                    for positions_file, output_file in jobs
+                ]
+                for future in futures:
+                    future.result()
+
+            results = [pd.read_pickle(output_file) for _, output_file in jobs]
+
+        return self.concat(results).sort_index()
+
+    @staticmethod
+    def concat(results: list) -> pd.DataFrame:
+        """Concatenates rendered partitions, merging the categories of categorical columns"""
+        return HashPartitioner.concat(results)
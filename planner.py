@@ -0,0 +1,172 @@
+import logging
+from col_creation_library import FunctionsCollection
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class ExecutionPlan:
+    """
+    Dependency graph of a stack configuration and the work `render()` has to do for it.
+    A column depends on its `nameSpace` source and on its `create_args`. Starting from the output
+    columns and the filtered columns, only the columns reachable through these dependencies are
+    read from the input, parsed, typed, created and binned; everything else is pruned.
+    Output columns are `outputColumns` when the stack declares them, else all configured columns.
+    """
+
+    def __init__(self, stack, source_columns: list):
+        self.source_columns = list(source_columns)
+        namespace = dict(stack.nameSpace or {})
+        configured = {col.name: col for col in stack.columnOptions}
+
+        output = stack.outputColumns or list(configured) + list(namespace)
+        self.output = list(dict.fromkeys(output))
+
+        self.deps = {}
+        for new_col, old_col in namespace.items():
+            self.deps[new_col] = [old_col]
+        for col in configured.values():
+            if col.create_func:
+                self.deps[col.name] = list(col.create_args)
+
+        roots = self.output + [col.name for col in configured.values() if col.filters]
+        self.needed = self._closure(roots)
+        self._check_sources(configured)
+
+        self.read = [x for x in self.source_columns if x in self.needed]
+        self.pruned = [x for x in self.source_columns if x not in self.needed] + [
+            x for x in configured if x not in self.needed and x not in self.source_columns
+        ]
+        self.namespace = {k: v for k, v in namespace.items() if k in self.needed}
+
+        planned = [col for col in configured.values() if col.name in self.needed]
+        self.parse = [col.name for col in planned if col.parse_funcs]
+        self.dtype = [col.name for col in planned if col.dtype and not col.create_func]
+        self.create = [
+            x for x in self._topological_order() if x in configured and configured[x].create_func
+        ]
+        # functions that are not row-local see other rows: group-wise ones the rows of their group,
+        # all others (`whole_input`) every row of the input
+        self.group_keys, self.whole_input = [], []
+        for col in planned:
+            for name in col.parse_funcs:
+                info = FunctionsCollection.REGISTRY.get(name)
+                if info is not None and not info.row_local:
+                    self.whole_input.append(col.name)
+            info = FunctionsCollection.REGISTRY.get(col.create_func) if col.name in self.create else None
+            if info is None or info.row_local:
+                continue
+            if info.group_arg is None:
+                self.whole_input.append(col.name)
+            else:
+                key = col.create_args[info.group_arg]
+                self.group_keys.append(self.namespace.get(key, key))
+        self.group_keys = list(dict.fromkeys(self.group_keys))
+        self.whole_input = list(dict.fromkeys(self.whole_input))
+        self.filter = [col.name for col in planned if col.filters]
+        self.pushdown = self._pushdown(configured)
+        self.bin = [col.name for col in planned if col.bins]
+
+    def _pushdown(self, configured: dict) -> list:
+        """
+        Filters that can run right after the input is read, before parse and create.
+        Safe when the column comes straight from the input (not parsed, created or namespaced)
+        and every parse and create function is row-local, so none needs the rows that the filter drops.
+        """
+        if self.group_keys or self.whole_input:
+            return []
+        return [
+            x
+            for x in self.filter
+            if x in self.source_columns
+            and x not in self.deps
+            and not configured[x].parse_funcs
+            and configured[x].dtype
+        ]
+
+    def group_key(self) -> str:
+        """The input column all group-wise create functions group by, None without group-wise functions"""
+        if len(self.group_keys) > 1:
+            raise ValueError(
+                f"Group-wise create functions group by different columns {sorted(self.group_keys)}, "
+                f"pass the key to partition rows by"
+            )
+        key = self.group_keys[0] if self.group_keys else None
+        if key is not None and key not in self.source_columns:
+            raise ValueError(f"Group key `{key}` is not an input column and cannot partition rows")
+        return key
+
+    def _closure(self, roots: list) -> set:
+        needed, todo = set(), list(roots)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.deps.get(name, []))
+        return needed
+
+    def _check_sources(self, configured: dict):
+        """
+        Every needed column must come from the input, the namespace or a create function.
+        Configured columns that are missing but have no work and no dependents are just left out.
+        """
+        missing = [
+            x for x in self.needed if x not in self.source_columns and x not in self.deps
+        ]
+        required = {dep for name in self.needed for dep in self.deps.get(name, [])}
+        idle = [
+            x
+            for x in missing
+            if x not in required
+            and x in configured
+            and not any(
+                [configured[x].dtype, configured[x].parse_funcs, configured[x].filters, configured[x].bins]
+            )
+        ]
+        self.needed -= set(idle)
+        self.output = [x for x in self.output if x not in idle]
+        missing = [x for x in missing if x not in idle]
+        if missing:
+            raise KeyError(
+                f"Columns {sorted(missing)} are neither in the input nor created by the config"
+            )
+
+    def _topological_order(self) -> list:
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Circular column dependencies: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in self.deps.get(name, []):
+                visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in sorted(self.needed):
+            visit(name, [])
+        return order
+
+    def explain(self) -> str:
+        """Returns a readable description of the plan"""
+
+        def _list(names):
+            return ", ".join(names) if names else "-"
+
+        lines = [
+            f"Read:      {_list(self.read)} ({len(self.read)} of {len(self.source_columns)} columns)",
+            f"Pruned:    {_list(self.pruned)}",
+            f"Namespace: {_list([f'{k} <- {v}' for k, v in self.namespace.items()])}",
+            f"Pushdown:  {_list(self.pushdown)}",
+            f"Parse:     {_list(self.parse)}",
+            f"Dtype:     {_list(self.dtype)}",
+            f"Create:    {_list([f'{x} <- ' + ', '.join(self.deps[x]) for x in self.create])}",
+            f"Filter:    {_list([x for x in self.filter if x not in self.pushdown])}",
+            f"Bin:       {_list(self.bin)}",
+            f"Output:    {_list(self.output)}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,181 @@
+import json
+import logging
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class _NoSpan:
+    """Stands in for a span when profiling is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Span:
+    """
+    Measures one stage, or one column within a stage, and hands the record to the profiler.
+    Spans nest: the tracemalloc peak is reset when a span starts, so the peak reached so far is first
+    folded into the enclosing span, and a finished span folds its own peak into it as well.
+    """
+
+    def __init__(self, profiler: "RenderProfiler", stage: str, column: str = None, rows=None):
+        self.profiler = profiler
+        self.stage = stage
+        self.column = column
+        self.rows = rows
+
+    def __enter__(self):
+        self.rows_in = self.rows() if self.rows else None
+        if self.profiler.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.profiler.open_spans:
+                parent = self.profiler.open_spans[-1]
+                parent.peak = max(parent.peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_in = self.peak = current
+            self.profiler.open_spans.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        record = {
+            "stage": self.stage,
+            "column": self.column,
+            "seconds": seconds,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows() if self.rows else None,
+            "bytes_allocated": None,
+            "bytes_retained": None,
+            "peak_rss": RenderProfiler.peak_rss(),
+        }
+        if self.profiler.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            self.profiler.open_spans.remove(self)
+            if self.profiler.open_spans:
+                parent = self.profiler.open_spans[-1]
+                parent.peak = max(parent.peak, self.peak)
+            record["bytes_allocated"] = max(self.peak - self.memory_in, 0)
+            record["bytes_retained"] = current - self.memory_in
+        self.profiler.add(record)
+        return False
+
+
+class RenderProfiler:
+    """
+    Collects a record for every render stage and every column a stage works on:
+    wall time, rows in and out, bytes allocated (peak above the start of the span) and retained,
+    and the peak resident set size of the process so far.
+    Callbacks registered with `on_record` get every record as soon as it is finished.
+    Memory is traced with `tracemalloc`, which slows down allocations; set `trace_memory=False`
+    to only measure times and rows.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.hooks = []
+        self.open_spans = []
+        self._started_tracing = False
+
+    def on_record(self, callback):
+        """Registers `callback(record)`, called at the end of every span"""
+        self.hooks.append(callback)
+        return callback
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def span(self, stage: str, column: str = None, rows=None) -> Span:
+        """`rows` is a callable returning the current number of rows"""
+        return Span(self, stage, column=column, rows=rows)
+
+    def add(self, record: dict):
+        self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    @staticmethod
+    def peak_rss() -> int:
+        """Peak resident set size of the process in bytes, None where it is not available"""
+        if resource is None:
+            return None
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def stages(self) -> list:
+        """Stage records summed over all renders (e.g. all chunks of a streamed render)"""
+        totals = {}
+        for record in self.records:
+            if record["column"] is not None:
+                continue
+            total = totals.setdefault(
+                record["stage"],
+                {"stage": record["stage"], "calls": 0, "seconds": 0.0, "rows_in": 0, "rows_out": 0},
+            )
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            total["rows_in"] += record["rows_in"] or 0
+            total["rows_out"] += record["rows_out"] or 0
+        return list(totals.values())
+
+    def columns(self) -> list:
+        """Column records summed per (stage, column), slowest first"""
+        totals = {}
+        for record in self.records:
+            if record["column"] is None:
+                continue
+            key = (record["stage"], record["column"])
+            total = totals.setdefault(
+                key, {"stage": key[0], "column": key[1], "calls": 0, "seconds": 0.0, "bytes_allocated": None}
+            )
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            if record["bytes_allocated"] is not None:
+                total["bytes_allocated"] = max(total["bytes_allocated"] or 0, record["bytes_allocated"])
+        return sorted(totals.values(), key=lambda x: x["seconds"], reverse=True)
+
+    def report(self) -> dict:
+        stages = self.stages()
+        return {
+            "seconds": sum(x["seconds"] for x in stages),
+            "peak_rss": self.peak_rss(),
+            "stages": stages,
+            "columns": self.columns(),
+            "records": self.records,
+        }
+
+    def to_json(self, path: str = None, **kwargs) -> str:
+        """Returns the report as JSON, and writes it to `path` if given"""
+        text = json.dumps(self.report(), **kwargs)
+        if path is not None:
+            with open(path, "w") as report_file:
+                report_file.write(text)
+        return text
+
+    def clear(self):
+        self.records = []
@@ -0,0 +1,42 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class GroupSample:
+    """
+    Deterministic sample of about `fraction` of the rows of an input, taken chunk by chunk.
+    With a `key` whole groups are kept or dropped (a row is kept when the hash of its key is
+    below the fraction), so group-wise create functions see every row of a sampled group and
+    every group has the same chance to be sampled. Without a key rows are sampled by position.
+    The same `seed` picks the same rows on every run and for every chunk size.
+    """
+
+    def __init__(self, fraction: float, key: str = None, seed: int = 0):
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Sample fraction must be in (0, 1], got `{fraction}`")
+        self.fraction = fraction
+        self.key = key
+        self.hash_key = str(seed).zfill(16)[-16:]
+        self.rows = 0
+
+    def select(self, df: pd.DataFrame) -> np.ndarray:
+        """Boolean mask of the sampled rows of a chunk, counts the rows seen"""
+        self.rows += len(df)
+        if self.key is None:
+            values = pd.Series(df.index)
+        else:
+            values = df[self.key]
+        hashes = pd.util.hash_pandas_object(values, index=False, hash_key=self.hash_key).to_numpy()
+        return hashes < np.uint64(self.fraction * float(2 ** 64 - 1))
+
+    def sample(self, chunks) -> pd.DataFrame:
+        """The sampled rows of all chunks"""
+        kept = [chunk[self.select(chunk)] for chunk in chunks]
+        logger.info(f"  -> Sampled {sum(len(x) for x in kept)} of {self.rows} rows")
+        return pd.concat(kept) if kept else pd.DataFrame()
@@ -0,0 +1,193 @@
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class SpillFile:
+    """Dataframes appended to one file on local disk, read back one at a time"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.bytes = 0
+        self._handle = None
+
+    def append(self, df: pd.DataFrame, size: float = 0):
+        """`size` is the estimated in-memory size of the frame, summed into `bytes`"""
+        if not len(df):
+            return
+        if self._handle is None:
+            self._handle = open(self.path, "ab")
+        pickle.dump(df, self._handle, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows += len(df)
+        self.bytes += size
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def __iter__(self):
+        self.close()
+        if not self.rows:
+            return
+        with open(self.path, "rb") as spill_file:
+            while True:
+                try:
+                    yield pickle.load(spill_file)
+                except EOFError:
+                    return
+
+    def read(self) -> pd.DataFrame:
+        return pd.concat(list(self))
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class HashPartitioner:
+    """
+    Runs a frame-wise `render` on an input larger than memory whose rows must be rendered
+    together per group (e.g. group-wise create functions over all lines of therapy of a patient).
+    Chunks are held in memory until they exceed `memory_budget` bytes; an input that stays below it
+    is rendered in one piece and nothing touches the disk.
+    Past the budget, rows are hash-partitioned by the group key into `fanout` spill files, so all rows
+    of a group land in the same partition, and every partition is rendered on its own. A partition
+    still larger than the budget is partitioned again with another hash, up to `max_depth` times
+    (a single group larger than the budget is rendered as it is).
+    Rendered partitions are spilled sorted by row position and merged back in the original row order,
+    `chunksize` positions at a time. Row positions are the index of the input chunks.
+    """
+
+    FANOUT = 16
+    MAX_DEPTH = 3
+
+    def __init__(self, memory_budget: int, fanout: int = FANOUT, max_depth: int = MAX_DEPTH, tmp_dir: str = None):
+        if not memory_budget or memory_budget < 1:
+            raise ValueError(f"Memory budget must be a positive number of bytes, got `{memory_budget}`")
+        if fanout < 2:
+            raise ValueError(f"Fanout must be at least 2, got `{fanout}`")
+        self.memory_budget = memory_budget
+        self.fanout = fanout
+        self.max_depth = max_depth
+        self.tmp_dir = tmp_dir
+        self.spilled = False
+
+    @staticmethod
+    def memory(df: pd.DataFrame) -> int:
+        return int(df.memory_usage(deep=True).sum())
+
+    def render(self, chunks, key: str, render, chunksize: int):
+        """Yields the rendered rows of `chunks` in row order, `render(df)` returns the rendered frame"""
+        chunks = iter(chunks)
+        held, size = [], 0
+        for chunk in chunks:
+            held.append(chunk)
+            size += self.memory(chunk)
+            if size > self.memory_budget:
+                break
+        else:
+            self.spilled = False
+            if held:
+                yield render(pd.concat(held))
+            return
+
+        self.spilled = True
+        logger.info(f"  -> Input exceeds the memory budget of {self.memory_budget} bytes, spilling to disk")
+        directory = tempfile.mkdtemp(prefix="spill_", dir=self.tmp_dir)
+        try:
+            parts = self._files(directory, "input", self.fanout)
+            for chunk in held:
+                self.scatter(chunk, key, parts, depth=0)
+            del held
+            for chunk in chunks:
+                self.scatter(chunk, key, parts, depth=0)
+
+            runs = []
+            for part in parts:
+                runs += self._render_part(part, key, render, chunksize, directory, depth=0)
+            yield from self.merge(runs, chunksize)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    def _files(directory: str, prefix: str, count: int) -> list:
+        return [SpillFile(os.path.join(directory, f"{prefix}_{n}.pkl")) for n in range(count)]
+
+    def scatter(self, df: pd.DataFrame, key: str, parts: list, depth: int):
+        """Appends every row of `df` to the partition of its key, with a different hash per `depth`"""
+        row_size = self.memory(df) / max(len(df), 1)
+        hash_key = str(depth).zfill(16)
+        buckets = pd.util.hash_pandas_object(df[key], index=False, hash_key=hash_key).to_numpy() % len(parts)
+        order = np.argsort(buckets, kind="stable")
+        bounds = np.searchsorted(buckets[order], np.arange(len(parts) + 1))
+        for n, part in enumerate(parts):
+            rows = order[bounds[n]:bounds[n + 1]]
+            if len(rows):
+                part.append(df.iloc[rows], size=row_size * len(rows))
+
+    def _render_part(self, part: SpillFile, key: str, render, chunksize: int, directory: str, depth: int) -> list:
+        """Renders one partition, returns the spill files of its rendered rows sorted by position"""
+        if not part.rows:
+            return []
+        if part.bytes > self.memory_budget and depth < self.max_depth:
+            logger.info(f"  ---> Partition of {part.rows} rows exceeds the memory budget, partitioning again")
+            sub_parts = self._files(directory, f"{os.path.basename(part.path)[:-4]}_{depth + 1}", self.fanout)
+            for df in part:
+                self.scatter(df, key, sub_parts, depth=depth + 1)
+            part.remove()
+            runs = []
+            for sub_part in sub_parts:
+                runs += self._render_part(sub_part, key, render, chunksize, directory, depth + 1)
+            return runs
+
+        df = part.read()
+        part.remove()
+        logger.info(f"  ---> Rendering partition of {len(df)} rows")
+        rendered = render(df).sort_index(kind="stable")
+        run = SpillFile(part.path[:-4] + "_rendered.pkl")
+        for start in range(0, len(rendered), chunksize):
+            run.append(rendered.iloc[start:start + chunksize])
+        run.close()
+        return [run]
+
+    @staticmethod
+    def merge(runs: list, chunksize: int):
+        """Merges runs sorted by row position into frames covering `chunksize` positions each"""
+        iters = [iter(run) for run in runs]
+        heads = [next(x, None) for x in iters]
+        while any(head is not None for head in heads):
+            end = min(head.index[0] for head in heads if head is not None) + chunksize
+            pieces = []
+            for n, head in enumerate(heads):
+                while head is not None and head.index[0] < end:
+                    cut = head.index.searchsorted(end)
+                    pieces.append(head.iloc[:cut])
+                    head = head.iloc[cut:] if cut < len(head) else next(iters[n], None)
+                heads[n] = head
+            yield HashPartitioner.concat(pieces).sort_index(kind="stable")
+        for run in runs:
+            run.remove()
+
+    @staticmethod
+    def concat(frames: list) -> pd.DataFrame:
+        """Concatenates rendered partitions, merging the categories of categorical columns"""
+        df = pd.concat(frames)
+        for name in frames[0].columns:
+            dtypes = [x[name].dtype for x in frames]
+            if isinstance(dtypes[0], pd.CategoricalDtype) and any(x != dtypes[0] for x in dtypes):
+                merged = union_categoricals([x[name] for x in frames], sort_categories=True)
+                df[name] = pd.Series(merged, index=df.index)
+        return df
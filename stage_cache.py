@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+import pandas as pd
+from io_backends import FeatherBackend, _pyarrow
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class StageCache:
+    """
+    On-disk cache of rendered columns, stored per stage: parsed, typed, created and binned.
+    An entry is keyed by the content hash of the input file and a canonical hash of the
+    column's config (as dumped by `StackHandler.dump()`) for that stage, including the keys of
+    the columns it is created from. Entries are feather files of one column (and its index),
+    evicted least recently used once the cache grows past `max_bytes`; a column arrow cannot
+    store (e.g. mixed Python objects) is not cached.
+    """
+
+    # bump when a change in the code alters rendered values
+    VERSION = 3
+    MAX_BYTES = 10 * 1024 ** 3
+    INDEX_FILE = "index.json"
+    HASH_BLOCK = 1024 ** 2
+    # name of the single column of an entry file
+    VALUE = "value"
+
+    STAGES = ("parsed", "typed", "created", "binned")
+    STAGE_FIELDS = {
+        "parsed": ("parse_funcs", "parse_kwargs"),
+        "typed": ("parse_funcs", "parse_kwargs", "dtype"),
+        "created": ("create_func", "create_args", "create_kwargs", "dtype"),
+        "binned": (
+            "parse_funcs",
+            "parse_kwargs",
+            "dtype",
+            "create_func",
+            "create_args",
+            "create_kwargs",
+            "bins",
+            "bin_include",
+        ),
+    }
+
+    def __init__(self, cache_dir: str, max_bytes: int = MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self) -> dict:
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.exists(path):
+            return {"entries": {}, "files": {}}
+        with open(path, "r") as index_file:
+            return json.load(index_file)
+
+    def _save_index(self):
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        with open(path + ".tmp", "w") as index_file:
+            json.dump(self.index, index_file)
+        os.replace(path + ".tmp", path)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".feather")
+
+    @staticmethod
+    def _hash(obj) -> str:
+        canonical = json.dumps(obj, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def file_hash(self, input_file: str) -> str:
+        """Content hash of a file, remembered as long as its size and mtime do not change"""
+        path = os.path.abspath(input_file)
+        stat = os.stat(path)
+        known = self.index["files"].get(path)
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+            return known["hash"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.HASH_BLOCK), b""):
+                digest.update(block)
+        self.index["files"][path] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": digest.hexdigest(),
+        }
+        self._save_index()
+        return digest.hexdigest()
+
+    def column_keys(self, config: dict, input_file: str, **options) -> dict:
+        """
+        Returns the cache key of every (column, stage) of a dumped stack config.
+        `options` are render settings that change values for all columns, e.g. the dtype errors policy.
+        """
+        input_hash = self.file_hash(input_file)
+        columns = {col["name"]: col for col in config.get("columnOptions", [])}
+        namespace = config.get("nameSpace", {})
+        # a column created from a secondary table depends on the table file as well
+        tables = {
+            name: {**table_options, "hash": self.file_hash(table_options["input_file"])}
+            for name, table_options in config.get("tables", {}).items()
+        }
+        keys, stack = {}, []
+
+        def column_key(name: str, stage: str) -> str:
+            if (name, stage) in keys:
+                return keys[(name, stage)]
+            if name in stack:
+                raise ValueError(f"Circular column dependencies at `{name}`")
+            stack.append(name)
+            col = columns.get(name, {})
+            fields = {x: col.get(x) for x in self.STAGE_FIELDS[stage] if col.get(x)}
+            deps = [
+                column_key(x, "created" if columns.get(x, {}).get("create_func") else "typed")
+                for x in col.get("create_args", []) if col.get("create_func")
+            ]
+            kwargs = col.get("create_kwargs", {}).values() if col.get("create_func") else ()
+            deps += [tables[x] for x in kwargs if isinstance(x, str) and x in tables]
+            keys[(name, stage)] = self._hash(
+                {
+                    "version": self.VERSION,
+                    "input": input_hash,
+                    "name": name,
+                    "source": namespace.get(name),
+                    "stage": stage,
+                    "fields": fields,
+                    "deps": deps,
+                    "options": options,
+                }
+            )
+            stack.pop()
+            return keys[(name, stage)]
+
+        for name in columns:
+            for stage in self.STAGES:
+                column_key(name, stage)
+        return keys
+
+    def get(self, key: str):
+        """Returns the cached series, or None"""
+        entry = self.index["entries"].get(key)
+        if entry is None or not os.path.exists(self._path(key)):
+            return None
+        entry["atime"] = time.time()
+        logger.info(f"  -> Loaded `{entry['column']}` ({entry['stage']}) from cache")
+        return FeatherBackend.read(self._path(key))[self.VALUE].rename(entry["column"])
+
+    def put(self, key: str, series: pd.Series, column: str, stage: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            FeatherBackend.write(series.to_frame(self.VALUE), path + ".tmp")
+        except _pyarrow().ArrowException as e:
+            logger.info(f"  -> Not caching `{column}` ({stage}): {e}")
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            return
+        os.replace(path + ".tmp", path)
+        self.index["entries"][key] = {
+            "column": column,
+            "stage": stage,
+            "size": os.path.getsize(path),
+            "atime": time.time(),
+        }
+        self.evict()
+
+    def flush(self):
+        """Writes the access times of the entries read since the last write"""
+        self._save_index()
+
+    def size(self) -> int:
+        return sum(x["size"] for x in self.index["entries"].values())
+
+    def evict(self, max_bytes: int = None):
+        """Removes the least recently used entries until the cache fits in `max_bytes`"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.index["entries"]
+        total = self.size()
+        for key in sorted(entries, key=lambda x: entries[x]["atime"]):
+            if total <= max_bytes:
+                break
+            total -= entries[key]["size"]
+            del entries[key]
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+        self._save_index()
+
+    def clear(self):
+        self.evict(max_bytes=0)
+        self.index["files"] = {}
+        self._save_index()
+
+    def info(self) -> dict:
+        entries = self.index["entries"].values()
+        stages = {x: sum(1 for e in entries if e["stage"] == x) for x in self.STAGES}
+        return {
+            "cache_dir": self.cache_dir,
+            "entries": len(self.index["entries"]),
+            "bytes": self.size(),
+            "max_bytes": self.max_bytes,
+            "stages": stages,
+            "files": len(self.index["files"]),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the render stage cache")
+    parser.add_argument("command", choices=["info", "clear", "evict"])
+    parser.add_argument("--cache-dir", default=".column_cache")
+    parser.add_argument("--max-bytes", type=int, default=StageCache.MAX_BYTES)
+    args = parser.parse_args(argv)
+
+    cache = StageCache(args.cache_dir, max_bytes=args.max_bytes)
+    if args.command == "clear":
+        cache.clear()
+    elif args.command == "evict":
+        cache.evict()
+    print(json.dumps(cache.info(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class SyntheticADT:
+    """
+    Seeded generator of ADT-shaped extracts with the columns of `inputs/test-col-ops.csv` plus `lot`.
+    Every patient has one to `max_lots` lines of therapy on consecutive rows (sorted by `pat_id`),
+    with one country and date of birth per patient and later `lot1` dates for later lots.
+    A `mixed_dates` share of the dates is written in one of the other formats seen in the fixture.
+    Rows are generated in blocks of `BLOCK_ROWS` that each get their own seed and patients,
+    so any number of rows can be written with the memory of one block,
+    and a row only depends on the seed and the block it is in.
+    """
+
+    BLOCK_ROWS = 1_000_000
+    COUNTRIES = ("gb", "fr", "de", "it", "es")
+    COUNTRY_WEIGHTS = (0.4, 0.2, 0.2, 0.1, 0.1)
+    ISO_FORMAT = "%Y-%m-%d"
+    MIXED_FORMATS = ("%Y.%m.%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+    COLUMNS = ("pat_id", "country", "location_code", "dob", "lot1", "aspirin", "lot")
+
+    def __init__(self, rows: int, seed: int = 0, max_lots: int = 4, mixed_dates: float = 0.2):
+        if rows < 1:
+            raise ValueError(f"Number of rows must be positive, got `{rows}`")
+        self.rows = rows
+        self.seed = seed
+        self.max_lots = max_lots
+        self.mixed_dates = mixed_dates
+
+    def _format_dates(self, days: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Formats days since 1970 as text, every distinct day once per format"""
+        uniques, codes = np.unique(days, return_inverse=True)
+        dates = pd.Series(pd.Timestamp("1970-01-01") + pd.to_timedelta(uniques, unit="D"))
+        text = dates.dt.strftime(self.ISO_FORMAT).to_numpy(dtype=object)[codes]
+
+        mixed = np.flatnonzero(rng.random(len(days)) < self.mixed_dates)
+        formats = rng.integers(0, len(self.MIXED_FORMATS), len(mixed))
+        for n, fmt in enumerate(self.MIXED_FORMATS):
+            rows = mixed[formats == n]
+            text[rows] = dates.dt.strftime(fmt).to_numpy(dtype=object)[codes[rows]]
+        return text
+
+    def block(self, number: int) -> pd.DataFrame:
+        """Rows `number * BLOCK_ROWS` up to the next block (or the end)"""
+        start = number * self.BLOCK_ROWS
+        rows = min(self.BLOCK_ROWS, self.rows - start)
+        rng = np.random.default_rng([self.seed, number])
+
+        lots_per_patient = rng.integers(1, self.max_lots + 1, rows)
+        patient = np.repeat(np.arange(rows), lots_per_patient)[:rows]
+        first = np.r_[True, patient[1:] != patient[:-1]]
+        lot = np.arange(rows) - np.maximum.accumulate(np.where(first, np.arange(rows), 0)) + 1
+
+        # born 1929 to 1978, first line of therapy at 20 to 45
+        dob_days = rng.integers(-15000, 3000, rows)[patient]
+        lot_days = dob_days + rng.integers(20 * 365, 45 * 365, rows)[patient] + (lot - 1) * 200
+
+        df = pd.DataFrame(
+            {
+                "pat_id": ("p" + pd.Series(start + np.arange(patient[-1] + 1)).astype(str).str.zfill(9))
+                .to_numpy(dtype=object)[patient],
+                "country": np.asarray(self.COUNTRIES)[
+                    rng.choice(len(self.COUNTRIES), rows, p=self.COUNTRY_WEIGHTS)[patient]
+                ],
+                "location_code": rng.integers(1, 10 ** 7, rows),
+                "dob": self._format_dates(dob_days, rng),
+                "lot1": self._format_dates(lot_days, rng),
+                "aspirin": rng.integers(0, 2, rows),
+                "lot": lot,
+            }
+        )
+        df.index = pd.RangeIndex(start, start + rows)
+        return df
+
+    def __iter__(self):
+        for number in range(-(-self.rows // self.BLOCK_ROWS)):
+            yield self.block(number)
+
+    def frame(self) -> pd.DataFrame:
+        return pd.concat(list(self))
+
+    def write_csv(self, path: str):
+        """Writes the extract block by block"""
+        for number, block in enumerate(self):
+            block.to_csv(path, mode="w" if number == 0 else "a", header=number == 0, index=False)
+        logger.info(f"  -> Wrote {self.rows} synthetic rows to `{path}`")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic ADT-shaped CSV extract")
+    parser.add_argument("output_file")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-lots", type=int, default=4)
+    parser.add_argument("--mixed-dates", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    SyntheticADT(args.rows, args.seed, args.max_lots, args.mixed_dates).write_csv(args.output_file)
+
+
+if __name__ == "__main__":
+    main()
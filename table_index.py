@@ -0,0 +1,87 @@
+import logging
+import numpy as np
+import pandas as pd
+from dtype_converter import DtypeConverter
+from io_backends import IOBackends
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+# logger.setLevel(logging.INFO)
+
+
+class TableIndex:
+    """
+    Hash index of a secondary input (e.g. treatment lines or labs kept apart from the patients)
+    on its `key` column, for create functions that pull values from it by key.
+    Only the key column is read to build the index; other columns are read on their first use,
+    typed with `dtypes` and kept, so joined values come in one column at a time and no merged frame
+    is built. The index is built once and probed by every render and every chunk.
+    A table may hold many rows per key: `positions` picks the first or the last one (in file order),
+    optionally among the rows where another column equals a value; each such pick is computed once.
+    Keys are matched by value and dtype, type the key columns alike on both sides.
+    """
+
+    PICKS = ("first", "last")
+
+    def __init__(self, input_file: str, key: str, input_format: str = None, dtypes: dict = None):
+        self.options = {"input_file": input_file, "key": key, "input_format": input_format, "dtypes": dtypes}
+        self.input_file = input_file
+        self.key = key
+        self.dtypes = dict(dtypes or {})
+        self.reader = IOBackends.get(input_file, input_format)
+
+        keys = self._read(key)
+        self.rows = len(keys)
+        # nulls get code -1 and never match
+        self.codes, uniques = pd.factorize(keys)
+        self.keys = pd.Index(uniques)
+        self._columns = {key: keys}
+        self._picks = {}
+        logger.info(f"  -> Indexed `{input_file}` on `{key}`: {len(self.keys)} keys, {self.rows} rows")
+
+    def _read(self, name: str) -> pd.Series:
+        series = self.reader.read(self.input_file, columns=[name])[name].reset_index(drop=True)
+        if name in self.dtypes:
+            series = DtypeConverter.convert(series, self.dtypes[name])
+        return series
+
+    def column(self, name: str) -> pd.Series:
+        """A column of the table on a RangeIndex of row positions, read once"""
+        if name not in self._columns:
+            logger.info(f"  ---> Reading `{name}` of `{self.input_file}`")
+            self._columns[name] = self._read(name)
+        return self._columns[name]
+
+    def _rows(self, pick: str, where: tuple = None) -> np.ndarray:
+        """The row picked for every distinct key, -1 for keys without a row"""
+        if pick not in self.PICKS:
+            raise ValueError(f"Pick `{pick}` is not known! Options are: {list(self.PICKS)}")
+        cache_key = (pick, where)
+        if cache_key not in self._picks:
+            mask = self.codes >= 0
+            if where is not None:
+                mask &= (self.column(where[0]) == where[1]).to_numpy(dtype=bool, na_value=False)
+            rows = np.flatnonzero(mask)
+            if pick == "last":
+                rows = rows[::-1]
+            codes, first = np.unique(self.codes[rows], return_index=True)
+            picked = np.full(len(self.keys), -1)
+            picked[codes] = rows[first]
+            self._picks[cache_key] = picked
+        return self._picks[cache_key]
+
+    def positions(self, keys: pd.Series, pick: str = "last", where: tuple = None) -> np.ndarray:
+        """
+        The table row of every key, -1 when the table has none.
+        `where` is a `(column, value)` pair restricting the rows that can be picked.
+        """
+        codes = self.keys.get_indexer(keys)
+        picked = self._rows(pick, where)
+        return np.where(codes >= 0, picked[codes], -1)
+
+    def take(self, name: str, positions: np.ndarray, index: pd.Index) -> pd.Series:
+        """Values of column `name` at table rows `positions` (null at -1), on `index`"""
+        values = self.column(name).reindex(positions)
+        values.index = index
+        return values
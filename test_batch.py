@@ -0,0 +1,70 @@
+import json
+import pandas as pd
+import pytest
+from batch import BatchRenderer, main
+from column_options import StackHandler
+
+
+config = {
+    "columnOptions": [
+        {"name": "a", "dtype": "int", "filters": {"__gt__": 1}},
+        {"name": "b", "dtype": "cat", "bins": {"x": "[x]"}, "bin_include": {"other": True}},
+    ]
+}
+
+
+def write_inputs(tmp_path) -> list:
+    files = []
+    for n in range(3):
+        path = tmp_path / f"in_{n}.csv"
+        pd.DataFrame({"a": [n, n + 1, n + 2], "b": ["x", "y", "x"]}).to_csv(path, index=False)
+        files.append(str(path))
+    (tmp_path / "bad.csv").write_text("c\n1\n")
+    return files
+
+
+def test_batch_writes_one_output_per_input_and_reports_failures(tmp_path):
+    files = write_inputs(tmp_path)
+    batch = BatchRenderer(config, [str(tmp_path / "*.csv")], output_dir=str(tmp_path / "out"), workers=2)
+    results = {x["input_file"]: x for x in batch.run()}
+
+    assert "KeyError" in results[str(tmp_path / "bad.csv")]["error"]
+    for input_file in files:
+        expected = StackHandler(input_file)
+        expected.load(config)
+        output = pd.read_csv(results[input_file]["output_file"])
+        assert results[input_file]["error"] is None
+        assert results[input_file]["rows"] == len(expected.df) == len(output)
+    assert "3 of 4 files rendered" in batch.summary()
+
+
+def test_batch_outputs_have_the_same_columns_with_any_write_options(tmp_path):
+    files = write_inputs(tmp_path)
+    (tmp_path / "bad.csv").unlink()
+    BatchRenderer(config, files, output_dir=str(tmp_path / "plain")).run()
+    BatchRenderer(config, files, output_dir=str(tmp_path / "gzip"), compression="gzip").run()
+    BatchRenderer(config, files, combined=str(tmp_path / "combined.csv")).run()
+    plain = pd.read_csv(tmp_path / "plain" / "in_0.csv")
+    assert list(plain.columns) == ["a", "b"]
+    assert list(pd.read_csv(tmp_path / "gzip" / "in_0.csv.gz").columns) == list(plain.columns)
+    assert list(pd.read_csv(tmp_path / "combined.csv").columns) == list(plain.columns)
+
+
+def test_batch_combined_output_keeps_input_order(tmp_path):
+    files = write_inputs(tmp_path)
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    combined = tmp_path / "all.csv"
+    code = main(
+        [str(tmp_path / "config.json"), *files, "--combined", str(combined), "--source-column", "src", "--workers", "2"]
+    )
+    df = pd.read_csv(combined)
+    assert code == 0
+    assert list(df["src"].drop_duplicates()) == files
+    assert list(df["a"]) == [2, 2, 3, 2, 3, 4]
+    assert list(df["b"]) == ["x", "other", "x", "x", "other", "x"]
+
+
+def test_batch_rejects_bad_config_before_rendering(tmp_path):
+    files = write_inputs(tmp_path)
+    with pytest.raises(ValueError):
+        BatchRenderer({"columnOptions": [{"name": "a", "dtype": "number"}]}, files, output_dir=str(tmp_path))
@@ -0,0 +1,25 @@
+import pytest
+from benchmark import Benchmark
+
+
+def results(**rows_per_second):
+    return {
+        "rows": 1000,
+        "results": {
+            name: {"seconds": 1000 / value, "rows": 1000, "rows_per_second": value}
+            for name, value in rows_per_second.items()
+        },
+    }
+
+
+def test_compare_flags_regressions():
+    baseline = results(fast=100.0, slow=100.0, gone=100.0)
+    current = results(fast=90.0, slow=50.0)
+    assert Benchmark.compare(current, baseline, threshold=0.2) == [("slow", 100.0, 50.0)]
+    assert Benchmark.compare(current, baseline, threshold=0.6) == []
+
+    # timings below the noise floor are not compared
+    assert Benchmark.compare(results(tiny=1.0), results(tiny=10 ** 7), threshold=0.2) == []
+
+    with pytest.raises(ValueError):
+        Benchmark.compare(dict(current, rows=10), baseline)
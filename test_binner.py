@@ -0,0 +1,81 @@
+import pytest
+import numpy as np
+import pandas as pd
+from binner import BinIndex, Binner
+
+
+AGE_BINS = {
+    "<20": "(..20)",
+    "20s": "[20..30)",
+    "30s": "[30..40)",
+    "40": "[40]",
+    "40s": "(40..50]",
+    "50+": "(50..]",
+}
+
+
+def test_matches_condition_index():
+    series = pd.Series(np.random.default_rng(0).integers(0, 80, 500)).astype(float)
+    series[::7] = np.nan
+    binned = Binner().apply_bins(series, "float", AGE_BINS, {"null": True})
+
+    assert list(binned.cat.categories) == list(AGE_BINS) + [Binner.NULL_BIN_NAME]
+    for label, obj in AGE_BINS.items():
+        if ".." not in obj:
+            expected = series == 40
+        else:
+            expected = Binner().condition_index(obj, "float", series)
+        assert (binned == label).equals(expected)
+    assert (binned == Binner.NULL_BIN_NAME).equals(series.isnull())
+
+
+def test_other_and_dates():
+    series = pd.to_datetime(pd.Series(["2009-04-16", "2012-01-28", "2015-06-08", None]))
+    bins = {"00s": "[2000-01-01..2010-01-01)", "2012": "[2012-01-01..2012-12-31]"}
+    binned = Binner().apply_bins(series, "date", bins, {"other": True})
+    assert list(binned.astype(object)) == ["00s", "2012", Binner.OTHER_BIN_NAME, np.nan]
+
+
+def test_float_bins_on_int_series():
+    # e.g. a created int column, which is not converted to the configured float dtype
+    series = pd.Series([0, 1, 2, 3, 5], dtype="int64")
+    for bins in ({"low": "[..2.5)", "high": "[2.5..]"}, {"low": "[0..2.5)", "high": "[2.5..)"}):
+        binned = Binner().apply_bins(series, "float", bins, {})
+        assert list(binned.astype(object)) == ["low", "low", "low", "high", "high"]
+
+
+@pytest.mark.parametrize(
+    "bins",
+    [
+        {"a": "[0..10]", "b": "[10..20]"},
+        {"b": "[15..20]", "a": "[0..16)"},
+        {"a": "[0..10)", "b": "[5,12]"},
+        {"a": "[1,2]", "b": "[2,3]"},
+        {"a": "(5..5]"},
+    ],
+)
+def test_overlaps_are_rejected_at_compile_time(bins):
+    with pytest.raises(ValueError):
+        Binner().compile_bins(bins, "int")
+
+
+def test_bin_index_matches_loop_and_counts():
+    rng = np.random.default_rng(1)
+    age = pd.Series(rng.integers(0, 80, 1000)).astype(float).mask(rng.random(1000) < 0.1)
+    age.index = rng.permutation(1000) + 50
+    binned = Binner().apply_bins(series=age, dtype="float", bins=AGE_BINS, bin_options={})
+    index = BinIndex(binned)
+
+    for label, rows in Binner().unpack_bins(binned).items():
+        assert rows.equals(binned[binned == label].index)
+        assert (index.positions(label) == np.flatnonzero(binned == label)).all()
+    assert index.positions(label).dtype == np.int32
+    assert index.rows_of(np.nan).equals(binned[binned.isnull()].index)
+    assert index.counts().to_dict() == binned.value_counts().to_dict()
+
+    country = pd.Series(rng.choice(["gb", "fr"], 1000), index=age.index)
+    expected = pd.crosstab(binned, country, dropna=False).reindex(index=list(AGE_BINS), fill_value=0)
+    crosstab = index.crosstab(BinIndex(country))
+    assert (crosstab.to_numpy() == expected[crosstab.columns].to_numpy()).all()
+    with pytest.raises(ValueError):
+        index.crosstab(BinIndex(country.iloc[:10]))
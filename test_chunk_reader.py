@@ -0,0 +1,32 @@
+import pytest
+import pandas as pd
+from chunk_reader import GroupedChunkReader
+
+
+@pytest.fixture
+def grouped_csv(tmp_path):
+    path = tmp_path / "grouped.csv"
+    pd.DataFrame(
+        {"pat_id": ["p1", "p1", "p2", "p2", "p2", "p3", "p4", "p4"], "lot": range(8)}
+    ).to_csv(path, index=False)
+    return str(path)
+
+
+def test_chunks_keep_groups_together(grouped_csv):
+    chunks = list(GroupedChunkReader(grouped_csv, chunksize=3, group_key="pat_id"))
+    assert sum(len(x) for x in chunks) == 8
+    seen = set()
+    for chunk in chunks:
+        keys = set(chunk["pat_id"])
+        assert not keys & seen
+        seen |= keys
+    assert list(pd.concat(chunks).index) == list(range(8))
+
+
+def test_non_contiguous_groups_raise(tmp_path):
+    path = tmp_path / "unsorted.csv"
+    pd.DataFrame({"pat_id": ["p1", "p2", "p1", "p3"], "lot": range(4)}).to_csv(
+        path, index=False
+    )
+    with pytest.raises(ValueError):
+        list(GroupedChunkReader(str(path), chunksize=2, group_key="pat_id"))
@@ -0,0 +1,128 @@
+import pytest
+import numpy as np
+import pandas as pd
+from col_creation_library import FunctionsCollection
+
+
+# reference implementations: the original group-by-group loops
+def next_lot_date_loop(lots, date, patient_id):
+    df = pd.concat([lots, date, patient_id], axis=1)
+    df.columns = ["lot", "date", "pid"]
+    groups = df.groupby(patient_id)
+
+    for group_at_idx in groups:
+        df_at_idx = group_at_idx[1]
+        sorted = df_at_idx.sort_values(by="lot")
+
+        shifted_dates = list(sorted["date"])[1:] + [pd.NaT]
+        df.loc[sorted.index, "new_date"] = shifted_dates
+
+    return df["new_date"].apply(lambda x: pd.to_datetime(x))
+
+
+def col_for_lot_loop(keys, vals, idx, keep_key):
+    df = pd.concat([keys, vals], axis=1)
+    df.columns = ["key", "val"]
+    res_series = pd.Series([np.nan for x in idx], index=idx.index, dtype=object)
+    groups = df.groupby(idx)
+
+    for group_at_idx in groups:
+        df_at_idx = group_at_idx[1]
+
+        for (_, row) in df_at_idx.iterrows():
+            if row["key"] == keep_key:
+                res_series[df_at_idx.index] = row["val"]
+
+    return res_series
+
+
+def random_lots(seed, n=300):
+    rng = np.random.default_rng(seed)
+    pids = pd.Series(rng.choice([f"p{x}" for x in range(n // 4)] + [None], n))
+    # lot numbers are unique per patient (the loop's order for ties is unspecified)
+    # and shuffled, so rows are not already in lot order
+    lots = pd.Series(rng.random(n)).groupby(pids).rank(method="first").fillna(1).astype(int)
+    dates = pd.Series(
+        pd.to_datetime("2005-01-01") + pd.to_timedelta(rng.integers(0, 5000, n), "D")
+    )
+    vals = pd.Series(rng.normal(size=n)).mask(rng.random(n) < 0.1)
+    index = rng.permutation(n) + 100
+    for series in (pids, lots, dates, vals):
+        series.index = index
+    return lots, dates, pids, vals
+
+
+def test_random_lots_are_out_of_order():
+    lots, _, pids, _ = random_lots(0)
+    assert not lots.groupby(pids).is_monotonic_increasing.all()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_next_lot_date_matches_loop(seed):
+    lots, dates, pids, _ = random_lots(seed)
+    expected = next_lot_date_loop(lots, dates, pids)
+    result = FunctionsCollection.next_lot_date(lots, dates, pids)
+    pd.testing.assert_series_equal(
+        result.astype("datetime64[ns]"), expected.astype("datetime64[ns]"), check_names=False
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_col_for_lot_matches_loop(seed):
+    lots, _, pids, vals = random_lots(seed)
+    expected = col_for_lot_loop(lots, vals, pids, keep_key=2)
+    result = FunctionsCollection.col_for_lot(lots, vals, pids, keep_key=2)
+    pd.testing.assert_series_equal(
+        result, expected.astype(float), check_names=False
+    )
+
+
+def test_vectorized_ports_match_elementwise_versions():
+    date = pd.Series(pd.to_datetime(["2020-01-01", None, "1990-06-30", "2001-03-01"]))
+    dob = pd.Series(pd.to_datetime(["1950-01-01", "1950-01-01", "2000-01-01", None]))
+    expected = (date - dob).apply(lambda x: float(x.days / 365.25))
+    pd.testing.assert_series_equal(FunctionsCollection.get_age_float(date, dob), expected)
+
+    data = pd.Series(["2020-01-02", None, "bad", "2020-01-02"], index=[3, 1, 2, 0])
+    result = FunctionsCollection.to_date_str(data, input_format="%Y-%m-%d", output_format="%d.%m.%Y")
+    assert result.to_dict() == {3: "02.01.2020", 1: "nan", 2: "nan", 0: "02.01.2020"}
+
+
+@pytest.fixture
+def registered():
+    names = []
+
+    def register(func, **info):
+        FunctionsCollection.register(func, **info)
+        names.append(info.get("name") or func.__name__)
+
+    yield register
+    for name in names:
+        FunctionsCollection.REGISTRY.pop(name, None)
+        FunctionsCollection.GROUP_FUNCS.pop(name, None)
+        delattr(FunctionsCollection, name)
+
+
+def test_elementwise_functions_run_once_per_distinct_value(registered):
+    calls = []
+
+    def initials(first, last):
+        calls.append((first, last))
+        return f"{first[0]}{last[0]}" if isinstance(last, str) else first[0]
+
+    registered(initials, kind="elementwise", inputs=("str", "str"), output="str")
+    assert FunctionsCollection.info("initials").row_local
+    first = pd.Series(["ada", "alan", "ada", "ada"], index=[9, 8, 7, 6])
+    last = pd.Series(["lovelace", "turing", "lovelace", None], index=[9, 8, 7, 6])
+
+    result = FunctionsCollection.resolve("initials")(first, last)
+    assert result.to_dict() == {9: "al", 8: "at", 7: "al", 6: "a"}
+    assert len(calls) == 3
+
+    with pytest.raises(ValueError):
+        registered(initials, name="id")
+    for name in ("register", "info", "resolve", "REGISTRY"):
+        with pytest.raises(ValueError, match="already taken"):
+            registered(initials, name=name)
+    with pytest.raises(ValueError):
+        registered(initials, name="grouped", kind="group")
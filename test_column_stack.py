@@ -0,0 +1,47 @@
+import pytest
+from column_options import Column, ColumnStack
+
+
+config = {
+    "columnOptions": [
+        {"name": "a", "parse_funcs": ["id"], "parse_kwargs": [{}], "filters": {"__gt__": 1}},
+        {"name": "b", "bins": {"x": "[1..2)"}, "dtype": "int"},
+        {"name": "c", "create_func": "copy_col", "create_args": ["a"], "dtype": "int"},
+        {"name": "d", "bins": {"x": "[1..2)"}, "filters": {"__lt__": 3}},
+    ]
+}
+
+
+def test_pending_sets_follow_flags_and_config():
+    stack = ColumnStack.Schema().load(config)
+    names = lambda cols: [x.name for x in cols]
+    assert names(stack.get_unparsed()) == ["a"]
+    assert names(stack.get_aggr_objs()) == ["c"]
+    assert names(stack.get_unbinned_objs()) == ["b", "d"]
+    assert names(stack.get_unfiltered()) == ["a", "d"]
+    assert names(stack.get_untyped()) == ["b"] and names(stack.get_untyped(created=True)) == ["c"]
+
+    stack["b"].binned = True
+    stack["d"].filters = {}
+    stack["a"].bins = {"y": "[0..1)"}
+    assert names(stack.get_unbinned_objs()) == ["a", "d"]
+    assert names(stack.get_unfiltered()) == ["a"]
+
+    stack.reset_state()
+    assert names(stack.get_unbinned_objs()) == ["a", "b", "d"]
+
+    stack.append_column(Column("e", bins={"z": "[0..1)"}))
+    assert stack["e"].stack is stack
+    assert names(stack.get_unbinned_objs()) == ["a", "b", "d", "e"]
+    assert names(stack.get_columns(["e", "a", "missing"])) == ["a", "e"]
+
+
+def test_column_is_slotted_and_state_is_not_dumped():
+    col = Column("a", dtype="int")
+    with pytest.raises(AttributeError):
+        col.unknown = 1
+    col.parsed = True
+
+    dumped = ColumnStack.Schema().dump(ColumnStack(columnOptions=[col]))
+    assert dumped["columnOptions"] == [{"name": "a", "dtype": "int"}]
+    assert ColumnStack.Schema().load(dumped)["a"] == col
@@ -0,0 +1,58 @@
+import copy
+import pandas as pd
+import pytest
+from benchmark import CONFIG
+from column_options import StackHandler
+from compiled_plan import CompiledPlan
+from synthetic_data import SyntheticADT
+
+
+def test_config_errors_are_reported_at_compile_time():
+    config = {
+        "columnOptions": [
+            {"name": "a", "dtype": "number"},
+            {"name": "b", "parse_funcs": ["missing"], "parse_kwargs": [{}]},
+            {"name": "c", "create_func": "copy_col", "create_args": ["a", "b"]},
+            {"name": "d", "dtype": "int", "bins": {"x": "[2..1)"}},
+            {"name": "e", "dtype": "int", "filters": {"__gt__": "abc", "__in__": 1}},
+            {"name": "f", "create_func": "copy_col", "create_args": ["g"]},
+            {"name": "g", "create_func": "copy_col", "create_args": ["f"]},
+        ]
+    }
+    with pytest.raises(ValueError) as error:
+        CompiledPlan.compile(config)
+    message = str(error.value)
+    for name in ("`a`", "`b`", "`c`", "`d`", "`__gt__`", "`__in__`", "Circular"):
+        assert name in message
+
+
+def test_compiled_plan_renders_like_config_on_many_inputs(tmp_path):
+    plan = CompiledPlan.compile(CONFIG)
+    for seed in (0, 1):
+        input_file = str(tmp_path / f"input_{seed}.csv")
+        SyntheticADT(500, seed=seed).write_csv(input_file)
+
+        expected = StackHandler(input_file)
+        expected.load(copy.deepcopy(CONFIG))
+        compiled = StackHandler(input_file)
+        compiled.load(plan)
+
+        pd.testing.assert_frame_equal(compiled.df, expected.df)
+        assert compiled.dump() == expected.dump()
+    assert len(plan.plans) == 1
+    assert not any(col.binned for col in plan.stack.columnOptions)
+
+
+def test_argument_dtypes_are_checked_against_function_metadata():
+    config = {
+        "columnOptions": [
+            {"name": "dob", "dtype": "str"},
+            {"name": "lot1", "dtype": "date"},
+            {"name": "age", "create_func": "get_age_float", "create_args": ["lot1", "dob"]},
+            {"name": "parsed", "parse_funcs": ["next_lot_date"], "parse_kwargs": [{}]},
+        ]
+    }
+    with pytest.raises(ValueError) as error:
+        CompiledPlan.compile(config)
+    assert "argument 2 of `get_age_float` must be `date`, got `str`" in str(error.value)
+    assert "`parsed`" in str(error.value)
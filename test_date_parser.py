@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from date_parser import DateParser
+
+
+def test_mixed_formats_and_stats():
+    parser = DateParser(formats=["%Y-%m-%d", "%d/%m/%Y", "%Y.%m.%d"])
+    series = pd.Series(["1984.12.01", "20/12/1988", "1998-11-23", "20/12/1988", np.nan])
+    parsed, rejected = parser.parse(series)
+    assert not rejected.any()
+    assert list(parsed) == list(
+        pd.to_datetime(["1984-12-01", "1988-12-20", "1998-11-23", "1988-12-20", None])
+    )[:4] + [pd.NaT]
+    # values are counted per row, not per distinct string
+    assert parser.report() == {"cached": 0, "%Y-%m-%d": 1, "%d/%m/%Y": 2, "%Y.%m.%d": 1}
+
+
+def test_cache_is_reused_and_bounded():
+    parser = DateParser(formats=["%Y-%m-%d"], cache_size=2)
+    parser.parse(pd.Series(["2001-01-01", "2001-01-02"]))
+    parser.parse(pd.Series(["2001-01-02", "2001-01-03"]))
+    assert parser.stats["cached"] == 1
+    assert list(parser.cache) == [(str, "2001-01-02"), (str, "2001-01-03")]
+
+
+def test_unparsed_values_are_rejected_or_use_fallback():
+    parser = DateParser(formats=["%Y-%m-%d"])
+    series = pd.Series(["2001-01-01", "23-11-1998", "garbage"])
+    _, rejected = parser.parse(series)
+    assert list(rejected) == [False, True, True]
+    parsed, rejected = parser.parse(series, fallback=pd.to_datetime)
+    assert list(rejected) == [False, False, True]
+    assert parsed[1] == pd.Timestamp("1998-11-23")
+
+
+def test_equal_values_of_different_types_are_parsed_apart():
+    def fallback(x):
+        if x is True:
+            raise ValueError("not a date")
+        return pd.Timestamp(int(x * 10 ** 9))
+
+    parser = DateParser(formats=[])
+    parsed, rejected = parser.parse(pd.Series([1, 1.0, True, 1, None], dtype=object), fallback=fallback)
+    assert list(rejected) == [False, False, True, False, False]
+    assert list(parsed) == [pd.Timestamp("1970-01-01 00:00:01")] * 3 + [pd.NaT]
+    assert parser.report() == {"cached": 0, "fallback": 3}
+    assert set(parser.cache) == {(int, 1), (float, 1.0)}
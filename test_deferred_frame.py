@@ -0,0 +1,29 @@
+import copy
+import pandas as pd
+from benchmark import CONFIG
+from column_options import StackHandler
+from synthetic_data import SyntheticADT
+
+
+def test_columns_are_computed_on_access_and_memoized(tmp_path):
+    input_file = str(tmp_path / "input.csv")
+    SyntheticADT(400, seed=2).write_csv(input_file)
+    expected = StackHandler(input_file)
+    expected.load(copy.deepcopy(CONFIG))
+
+    sh = StackHandler(input_file, lazy=True)
+    sh.load(copy.deepcopy(CONFIG))
+    assert not sh.loaded
+
+    location = sh.frame["location_code"]
+    pd.testing.assert_series_equal(location, expected.df["location_code"])
+    # the filtered column is read for the row selection, nothing else is
+    assert sorted(sh.df.columns) == ["country", "location_code"]
+    assert not sh.stack["age_at_lot1"].created
+    assert sh.frame["location_code"] is location
+
+    ages = sh.frame.to_pandas(columns=["age_at_lot1", "pid"])
+    pd.testing.assert_frame_equal(ages, expected.df[["age_at_lot1", "pid"]])
+    assert not sh.stack["next_lot1"].created
+
+    pd.testing.assert_frame_equal(sh.output_df, expected.df[sh.frame.columns])
@@ -0,0 +1,66 @@
+import pytest
+import numpy as np
+import pandas as pd
+from dtype_converter import DtypeConverter
+from type_info import TypeInfo
+
+
+@pytest.mark.parametrize(
+    "dtype, values",
+    [
+        ("int", [83476, 1378, 28]),
+        ("int", ["83476", " 28 ", "+3", "-4"]),
+        ("int", [1.5, 2.0, -3.9]),
+        ("float", ["1.5", "nan", "1e3", np.nan]),
+        ("bool", [0, 1, 2, np.nan]),
+        ("bool", ["", "0", "a", np.nan]),
+        ("date", ["2009-04-16", "28/01/2012", "1984.12.01", np.nan, "2009-04-16"]),
+        ("delta", [1, 2.5, -3]),
+        ("str", [0.1, np.nan, 83476.0]),
+        ("str", ["gb", np.nan, "fr"]),
+        ("cat", ["gb", "fr", "gb"]),
+    ],
+)
+def test_matches_elementwise_apply(dtype, values):
+    series = pd.Series(values, index=range(10, 10 + len(values)))
+    expected = series.apply(TypeInfo.DTYPE_MAP[dtype])
+    result = DtypeConverter.convert(series, dtype)
+    assert list(result.index) == list(expected.index)
+    assert result.tolist() == expected.tolist() or result.equals(expected)
+
+
+def test_common_date_formats_are_parsed_vectorized():
+    from date_parser import DateParser
+
+    DateParser.clear_shared()
+    series = pd.Series(["1984.12.01", "1988/12/20", "23-11-1998", "02/03/2020", "13/03/2020"])
+    result = DtypeConverter.convert(series, "date")
+    assert "fallback" not in DateParser.shared().report()
+    assert result.tolist() == pd.to_datetime(
+        ["1984-12-01", "1988-12-20", "1998-11-23", "2020-02-03", "2020-03-13"]
+    ).tolist()
+
+    day_first = DtypeConverter.convert(series[3:], "date", date_formats=["%d/%m/%Y"])
+    assert day_first.tolist() == pd.to_datetime(["2020-03-02", "2020-03-13"]).tolist()
+
+
+def test_bad_values_policy():
+    series = pd.Series(["1", "x", "3"])
+    with pytest.raises(ValueError):
+        DtypeConverter.convert(series, "int")
+    result = DtypeConverter.convert(series, "int", errors="coerce")
+    assert result[0] == 1 and result[2] == 3
+    assert pd.isnull(result[1])
+
+
+def test_compact_storage():
+    assert DtypeConverter.convert(pd.Series(["gb", "fr", "gb"]), "cat").dtype == "category"
+
+    small = DtypeConverter.compact(pd.Series([1, 5, None], dtype=object), "int")
+    assert small.dtype == "Int8" and pd.isnull(small[2])
+    assert DtypeConverter.compact(pd.Series([0, 40000]), "int").dtype == "Int32"
+    assert DtypeConverter.compact(pd.Series([1.5]), "float").dtype == "float64"
+    assert DtypeConverter.compact(pd.Series([1.5]), "float", float32=True).dtype == "float32"
+
+    # filter values outside the narrow type still compare
+    assert not (small > 1000).any()
@@ -0,0 +1,61 @@
+import copy
+import json
+import pandas as pd
+from column_options import StackHandler
+from dtype_inference import DtypeInference, main
+from synthetic_data import SyntheticADT
+
+
+def test_proposes_dtypes_and_date_formats():
+    df = pd.DataFrame(
+        {
+            "n": [1, 2, 3, 4],
+            "x": [1.5, 2.0, None, 4.0],
+            "flag": [True, False, True, True],
+            "when": ["2020-01-31", "02/03/2020", "13/03/2020", None],
+            "country": ["gb"] * 4,
+            "name": ["a", "b", "c", "d"],
+        }
+    )
+    proposals = DtypeInference(cat_ratio=0.5).infer(df)
+    assert {k: v["dtype"] for k, v in proposals.items()} == {
+        "n": "int", "x": "float", "flag": "bool", "when": "date", "country": "cat", "name": "str",
+    }
+    # ambiguous day/month strings are read month first, as the per-value fallback does
+    assert proposals["when"]["date_formats"] == ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"]
+
+    config = DtypeInference.config(proposals)
+    assert StackHandler.from_frame(df).stack.Schema().load(config).as_dict["when"].dtype == "date"
+    merged = DtypeInference.merge({"columnOptions": [{"name": "n", "dtype": "float"}, {"name": "when"}]}, proposals)
+    assert [x["dtype"] for x in merged["columnOptions"]] == ["float", "date"]
+
+
+def test_hints_type_columns_while_reading(tmp_path, capsys):
+    input_file = str(tmp_path / "adt.csv")
+    SyntheticADT(2000, seed=3).frame().to_csv(input_file, index=False)
+    config = {
+        "columnOptions": [
+            {"name": "dob", "dtype": "date"},
+            {"name": "lot1", "dtype": "date", "filters": {"__ge__": "1990-01-01"}},
+            {"name": "country", "dtype": "cat"},
+            {"name": "age", "create_func": "get_age_float", "create_args": ["lot1", "dob"]},
+        ]
+    }
+    expected = StackHandler(input_file)
+    expected.load(copy.deepcopy(config))
+
+    sh = StackHandler(input_file, infer_dtypes=True)
+    assert sh.dtype_hints["lot1"]["dtype"] == "date" and not sh.loaded
+    sh.load(copy.deepcopy(config))
+    # only columns configured with the proposed dtype are typed while reading
+    read = sh._read(columns=["lot1", "country", "pat_id"])
+    assert str(read["lot1"].dtype).startswith("datetime64") and read["country"].dtype == "category"
+    assert read["pat_id"].dtype != "category"
+
+    pd.testing.assert_frame_equal(sh.df, expected.df, check_categorical=False)
+    chunked = StackHandler(input_file, chunksize=500, dtype_hints=sh.dtype_hints)
+    chunked.load(copy.deepcopy(config))
+    pd.testing.assert_frame_equal(pd.concat(list(chunked.iter_render())), expected.df, check_categorical=False)
+
+    main([input_file])
+    assert {"name": "country", "dtype": "cat"} in json.loads(capsys.readouterr().out)["columnOptions"]
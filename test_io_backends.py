@@ -0,0 +1,71 @@
+import copy
+import os
+import pandas as pd
+import pytest
+import column_options
+from io_backends import CsvBackend, IOBackends
+
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), "inputs", "test-col-ops.csv")
+
+payload = {
+    "columnOptions": [
+        {"name": "pat_id", "dtype": "str"},
+        {"name": "country", "dtype": "str", "filters": {"__eq__": "gb"}},
+        {"name": "location_code", "dtype": "int", "filters": {"__gt__": 1000}},
+        {"name": "aspirin", "dtype": "int"},
+    ],
+}
+
+
+def render(input_file, **kwargs):
+    sh = column_options.StackHandler(input_file, **kwargs)
+    sh.load(copy.deepcopy(payload))
+    return sh.df
+
+
+def test_backend_from_extension():
+    assert IOBackends.get("data.csv") is CsvBackend
+    assert IOBackends.get("data.tsv", "csv") is CsvBackend
+    with pytest.raises(ValueError):
+        IOBackends.get("data.csv", "xlsx")
+
+
+def test_csv_output_has_no_index_column(tmp_path):
+    sh = column_options.StackHandler(INPUT_FILE)
+    sh.load(copy.deepcopy(payload))
+    sh.to_file(str(tmp_path / "out.csv"))
+    assert list(pd.read_csv(tmp_path / "out.csv").columns) == list(sh.df.columns)
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".feather"])
+def test_columnar_input_matches_csv(tmp_path, extension):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"input{extension}")
+    IOBackends.convert(INPUT_FILE, path, **({"row_group_size": 3} if extension == ".parquet" else {}))
+
+    expected = render(INPUT_FILE)
+    pd.testing.assert_frame_equal(render(path), expected)
+    pruned = render(path, prune=True)
+    pd.testing.assert_frame_equal(pruned, expected[pruned.columns])
+
+    sh = column_options.StackHandler(path, chunksize=4)
+    sh.stack = sh.stack.Schema().load(copy.deepcopy(payload))
+    pd.testing.assert_frame_equal(pd.concat(sh.iter_render()), expected)
+
+
+def test_parquet_skips_row_groups(tmp_path):
+    pytest.importorskip("pyarrow")
+    df = pd.read_csv(INPUT_FILE).sort_values("location_code", kind="stable").reset_index(drop=True)
+    df.to_csv(tmp_path / "sorted.csv", index=False)
+    IOBackends.convert(str(tmp_path / "sorted.csv"), str(tmp_path / "sorted.parquet"), row_group_size=2)
+
+    sh = column_options.StackHandler(str(tmp_path / "sorted.parquet"), prune=True)
+    sh.stack = sh.stack.Schema().load(copy.deepcopy(payload))
+    sh.stack["location_code"].filters = {"__gt__": 5000}
+    sh.execution_plan = sh.plan()
+    sh._read_planned()
+    assert list(sh.df.index) == [2, 3]
+
+    sh.render()
+    assert list(sh.df["pat_id"]) == ["p1001", "p1004"]
@@ -0,0 +1,115 @@
+import copy
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pytest
+from batch import main
+from column_options import StackHandler
+from output_writer import OutputWriter
+from synthetic_data import SyntheticADT
+
+
+def frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"n": range(rows), "group": pd.Categorical(["a", "b", None][x % 3] for x in range(rows))})
+
+
+@pytest.mark.parametrize(
+    "name, options",
+    [
+        ("out.csv.gz", {}),
+        ("out.csv", {"compression": "zstd"}),
+        ("out.parquet", {"compression": "gzip"}),
+        ("out.feather", {"compression": "zstd"}),
+    ],
+)
+def test_writes_chunks_in_order(tmp_path, name, options):
+    df = frame(1000)
+    path = str(tmp_path / name)
+    with OutputWriter(path, chunksize=64, workers=3, **options) as writer:
+        writer.write(df.iloc[:500])
+        writer.write(df.iloc[500:])
+    assert writer.paths == [path] and os.listdir(tmp_path) == [name]
+
+    if name.endswith(".parquet"):
+        read = pd.read_parquet(path)
+    elif name.endswith(".feather"):
+        read = pd.read_feather(path)
+    else:
+        read = pd.read_csv(pa.input_stream(path, compression=writer.compression), dtype={"group": "category"})
+    pd.testing.assert_frame_equal(read, df, check_categorical=False)
+
+
+def test_partitions_and_writes_atomically(tmp_path):
+    df = frame(10)
+    with OutputWriter(str(tmp_path / "parts"), partition_by="group", compression="gzip", chunksize=4) as writer:
+        writer.write(df)
+    assert sorted(os.path.relpath(x, tmp_path) for x in writer.paths) == [
+        os.path.join("parts", "group=__null__", "part.csv.gz"),
+        os.path.join("parts", "group=a", "part.csv.gz"),
+        os.path.join("parts", "group=b", "part.csv.gz"),
+    ]
+    assert list(pd.read_csv(tmp_path / "parts" / "group=a" / "part.csv.gz")["n"]) == [0, 3, 6, 9]
+
+    # a later run replaces the partitions of the earlier one
+    with OutputWriter(str(tmp_path / "parts"), partition_by="group", compression="gzip") as writer:
+        writer.write(df[df["group"] == "b"])
+    assert os.listdir(tmp_path / "parts") == ["group=b"] and os.listdir(tmp_path) == ["parts"]
+
+    target = tmp_path / "out.csv"
+    target.write_text("previous\n")
+    with pytest.raises(RuntimeError):
+        with OutputWriter(str(target)) as writer:
+            writer.write(df)
+            raise RuntimeError("render failed")
+    # the previous output is kept and no temp file is left
+    assert target.read_text() == "previous\n" and sorted(os.listdir(tmp_path)) == ["out.csv", "parts"]
+
+
+def test_streams_a_render_to_compressed_partitions(tmp_path):
+    input_file = str(tmp_path / "adt.csv")
+    SyntheticADT(2000, seed=2).frame().to_csv(input_file, index=False)
+    config = {
+        "columnOptions": [
+            {"name": "lot", "dtype": "int", "bins": {"first": "[1]", "later": "[2..9]"}},
+            {"name": "country", "dtype": "cat"},
+        ],
+        "outputColumns": ["lot", "country"],
+    }
+    expected = StackHandler(input_file)
+    expected.load(copy.deepcopy(config))
+
+    sh = StackHandler(input_file, chunksize=300)
+    sh.load(copy.deepcopy(config))
+    paths = sh.render_to_file(str(tmp_path / "out"), "parquet", partition_by="lot", compression="zstd")
+    assert len(paths) == 2
+    read = pd.concat(pd.read_parquet(x) for x in sorted(paths))
+    assert len(read) == len(expected.df)
+    assert read["country"].value_counts().to_dict() == expected.df["country"].value_counts().to_dict()
+
+    (tmp_path / "config.json").write_text(json.dumps(config))
+    code = main([str(tmp_path / "config.json"), input_file, "--output-dir", str(tmp_path / "batch"), "--compression", "gzip"])
+    assert code == 0 and len(pd.read_csv(tmp_path / "batch" / "adt.csv.gz")) == len(expected.df)
+
+
+def test_writes_every_spilled_row(tmp_path):
+    input_file = str(tmp_path / "shuffled.csv")
+    SyntheticADT(3000, seed=1).frame().sample(frac=1, random_state=0).to_csv(input_file, index=False)
+    config = {
+        "nameSpace": {"pid": "pat_id"},
+        "columnOptions": [
+            {"name": "lot1", "dtype": "date"},
+            {"name": "lot", "dtype": "int"},
+            {"name": "next_lot1", "create_func": "next_lot_date", "create_args": ["lot", "lot1", "pid"]},
+        ],
+        "outputColumns": ["pat_id", "lot", "next_lot1"],
+    }
+    expected = StackHandler(input_file)
+    expected.load(copy.deepcopy(config))
+
+    sh = StackHandler(input_file, chunksize=500, memory_budget=50_000, spill_dir=str(tmp_path))
+    sh.load(copy.deepcopy(config))
+    paths = sh.render_to_file(str(tmp_path / "out.parquet"))
+    read = pd.read_parquet(paths[0])
+    assert list(read.columns) == ["pat_id", "lot", "next_lot1"]
+    pd.testing.assert_frame_equal(read, expected.output_df.reset_index(drop=True), check_dtype=False)
@@ -0,0 +1,57 @@
+import copy
+import os
+import pandas as pd
+import column_options
+from parallel import ColumnarFiles, ParallelRenderer
+
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), "inputs", "test-col-ops.csv")
+
+payload = {
+    "nameSpace": {"pid": "pat_id"},
+    "columnOptions": [
+        {"name": "pat_id", "dtype": "str"},
+        {"name": "country", "dtype": "cat", "filters": {"__eq__": "gb"}},
+        {"name": "dob", "dtype": "date"},
+        {"name": "lot1", "dtype": "date"},
+        {
+            "name": "age_at_lot1",
+            "dtype": "float",
+            "create_func": "get_age_float",
+            "create_args": ["lot1", "dob"],
+            "bins": {"<30": "(..30)", "30+": "[30..]"},
+        },
+    ],
+}
+
+
+def test_columnar_files_round_trip(tmp_path):
+    df = pd.DataFrame(
+        {
+            "a": ["x", None, "y"],
+            "b": pd.Categorical(["u", "v", None]),
+            "c": [1.5, None, 2.0],
+            "d": pd.to_datetime(["2020-01-01", None, "2021-01-01"]),
+        },
+        index=[5, 3, 9],
+    )
+    ColumnarFiles(str(tmp_path)).write(df)
+    pd.testing.assert_frame_equal(ColumnarFiles(str(tmp_path)).read(), df)
+    pd.testing.assert_frame_equal(ColumnarFiles(str(tmp_path)).read([2, 0]), df.iloc[[2, 0]])
+
+
+def test_parallel_render_matches_single_process():
+    sh = column_options.StackHandler(INPUT_FILE)
+    sh.load(copy.deepcopy(payload))
+
+    renderer = ParallelRenderer(INPUT_FILE, payload, workers=2, partition_key="pat_id")
+    pd.testing.assert_frame_equal(renderer.render(), sh.df)
+
+
+def test_group_key_is_inferred_from_group_functions():
+    config = copy.deepcopy(payload)
+    config["columnOptions"].append(
+        {"name": "next_lot1", "create_func": "next_lot_date", "create_args": ["lot1", "lot1", "pid"]}
+    )
+    renderer = ParallelRenderer(INPUT_FILE, config, workers=2)
+    assert renderer.group_key(renderer._plan()) == "pat_id"
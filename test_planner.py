@@ -0,0 +1,96 @@
+import os
+import pytest
+import column_options
+from col_creation_library import FunctionsCollection
+from planner import ExecutionPlan
+
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), "inputs", "test-col-ops.csv")
+
+payload = {
+    "nameSpace": {"pid": "pat_id"},
+    "outputColumns": ["pid", "age_at_lot1"],
+    "columnOptions": [
+        {"name": "country", "dtype": "cat", "filters": {"__eq__": "gb"}},
+        {"name": "location_code", "dtype": "int"},
+        {"name": "dob", "dtype": "date"},
+        {"name": "lot1", "dtype": "date"},
+        {
+            "name": "age_at_lot1",
+            "dtype": "float",
+            "create_func": "get_age_float",
+            "create_args": ["lot1", "dob"],
+        },
+    ],
+}
+
+
+def test_plan_prunes_unused_columns():
+    stack = column_options.ColumnStack.Schema().load(payload)
+    plan = ExecutionPlan(stack, ["pat_id", "country", "location_code", "dob", "lot1", "aspirin"])
+    assert plan.read == ["pat_id", "country", "dob", "lot1"]
+    assert "location_code" in plan.pruned and "aspirin" in plan.pruned
+    assert plan.dtype == ["country", "dob", "lot1"]
+    assert plan.create == ["age_at_lot1"]
+    assert "Read:" in plan.explain()
+
+
+def test_pruned_render_reads_only_needed_columns():
+    sh = column_options.StackHandler(INPUT_FILE, prune=True)
+    sh.load(payload)
+    assert "location_code" not in sh.df.columns
+    assert list(sh.output_df.columns) == ["pid", "age_at_lot1"]
+    assert list(sh.output_df["pid"]) == ["p1001", "p1003", "p1004"]
+
+
+def test_plan_rejects_cycles():
+    stack = column_options.ColumnStack.Schema().load(
+        {
+            "columnOptions": [
+                {"name": "a", "create_func": "copy_col", "create_args": ["b"]},
+                {"name": "b", "create_func": "copy_col", "create_args": ["a"]},
+            ]
+        }
+    )
+    with pytest.raises(ValueError):
+        ExecutionPlan(stack, ["pat_id"])
+
+
+def test_filters_on_source_columns_are_pushed_down():
+    stack = column_options.ColumnStack.Schema().load(payload)
+    plan = ExecutionPlan(stack, ["pat_id", "country", "location_code", "dob", "lot1"])
+    assert plan.pushdown == ["country"]
+
+    grouped = dict(payload, columnOptions=payload["columnOptions"] + [
+        {"name": "next_lot", "create_func": "next_lot_date", "create_args": ["lot1", "lot1", "pat_id"]}
+    ])
+    stack = column_options.ColumnStack.Schema().load(grouped)
+    stack.outputColumns = []
+    plan = ExecutionPlan(stack, ["pat_id", "country", "location_code", "dob", "lot1"])
+    assert plan.pushdown == []
+
+
+def test_functions_that_are_not_row_local_block_pushdown_and_chunking(tmp_path):
+    def share(values):
+        return values / values.sum()
+
+    FunctionsCollection.register(share, inputs=("float",), output="float", row_local=False)
+    try:
+        config = {
+            "columnOptions": [
+                {"name": "a", "dtype": "float", "filters": {"__gt__": 1}},
+                {"name": "b", "create_func": "share", "create_args": ["a"]},
+            ]
+        }
+        plan = ExecutionPlan(column_options.ColumnStack.Schema().load(config), ["a"])
+        assert plan.whole_input == ["b"] and plan.pushdown == []
+
+        input_file = tmp_path / "input.csv"
+        input_file.write_text("a\n1\n2\n3\n")
+        sh = column_options.StackHandler(str(input_file), chunksize=2)
+        sh.load(config)
+        with pytest.raises(ValueError):
+            list(sh.iter_render())
+    finally:
+        FunctionsCollection.REGISTRY.pop("share")
+        delattr(FunctionsCollection, "share")
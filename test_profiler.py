@@ -0,0 +1,74 @@
+import copy
+import json
+import os
+import numpy as np
+import column_options
+from profiler import RenderProfiler
+
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), "inputs", "test-col-ops.csv")
+
+payload = {
+    "columnOptions": [
+        {"name": "pat_id", "dtype": "str"},
+        {"name": "country", "dtype": "cat", "filters": {"__eq__": "gb"}},
+        {"name": "lot1", "dtype": "date"},
+        {"name": "dob", "dtype": "date"},
+        {
+            "name": "age_at_lot1",
+            "dtype": "float",
+            "create_func": "get_age_float",
+            "create_args": ["lot1", "dob"],
+            "bins": {"<30": "(..30)", "30+": "[30..]"},
+        },
+    ],
+}
+
+
+def test_records_stages_and_columns(tmp_path):
+    sh = column_options.StackHandler(INPUT_FILE)
+    seen = []
+    profiler = sh.profile()
+    profiler.on_record(seen.append)
+    sh.load(copy.deepcopy(payload))
+    profiler.stop()
+
+    stages = {x["stage"]: x for x in profiler.stages()}
+    assert {"apply_dtypes", "create_cols", "apply_filters", "apply_bins"} <= set(stages)
+    assert stages["apply_filters"]["rows_out"] < stages["apply_filters"]["rows_in"]
+    columns = {(x["stage"], x["column"]) for x in profiler.columns()}
+    assert ("create_cols", "age_at_lot1") in columns and ("apply_dtypes", "country") in columns
+    assert all(x["bytes_allocated"] is not None for x in profiler.records)
+    assert len(seen) == len(profiler.records)
+
+    report = json.loads(profiler.to_json(str(tmp_path / "report.json")))
+    assert report["stages"] == json.loads(open(tmp_path / "report.json").read())["stages"]
+
+
+def test_disabled_by_default():
+    sh = column_options.StackHandler(INPUT_FILE)
+    sh.load(copy.deepcopy(payload))
+    assert sh.profiler is None
+
+    profiler = RenderProfiler(trace_memory=False)
+    sh = column_options.StackHandler(INPUT_FILE)
+    sh.profile(profiler)
+    sh.load(copy.deepcopy(payload))
+    assert profiler.records and all(x["bytes_allocated"] is None for x in profiler.records)
+
+
+def test_nested_span_peaks_reach_the_enclosing_span():
+    profiler = RenderProfiler()
+    profiler.start()
+    try:
+        with profiler.span("stage"):
+            with profiler.span("stage", column="a"):
+                block = np.ones(5_000_000)
+                del block
+            with profiler.span("stage", column="b"):
+                pass
+    finally:
+        profiler.stop()
+    inner, small, outer = profiler.records
+    assert inner["bytes_allocated"] >= 40_000_000
+    assert outer["bytes_allocated"] >= inner["bytes_allocated"] > small["bytes_allocated"]
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sampling import GroupSample
+
+
+def test_whole_groups_are_sampled_the_same_for_any_chunk_size():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"pid": rng.integers(0, 2000, 20000).astype(str), "value": rng.random(20000)})
+
+    samples = []
+    for chunksize in (20000, 3000):
+        sampler = GroupSample(0.1, key="pid", seed=1)
+        samples.append(sampler.sample(df.iloc[x:x + chunksize] for x in range(0, len(df), chunksize)))
+        assert sampler.rows == len(df)
+    pd.testing.assert_frame_equal(samples[0], samples[1])
+
+    sampled = set(samples[0]["pid"])
+    assert 0.07 < len(sampled) / df["pid"].nunique() < 0.13
+    # every row of a sampled group is kept
+    assert len(samples[0]) == df["pid"].isin(sampled).sum()
+    assert set(GroupSample(0.1, key="pid", seed=2).sample([df])["pid"]) != sampled
+
+    with pytest.raises(ValueError):
+        GroupSample(0)
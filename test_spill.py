@@ -0,0 +1,62 @@
+import copy
+import numpy as np
+import pandas as pd
+from column_options import StackHandler
+from spill import HashPartitioner
+from synthetic_data import SyntheticADT
+
+
+def group_sum(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(total=df.groupby("key")["value"].transform("sum"))
+
+
+def chunks(df: pd.DataFrame, chunksize: int):
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def test_partitions_spill_and_merge_back_in_row_order(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"key": rng.integers(0, 300, 5000).astype(str), "value": rng.integers(0, 10, 5000)})
+    expected = group_sum(df)
+
+    in_memory = HashPartitioner(10 ** 9, tmp_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(pd.concat(in_memory.render(chunks(df, 1000), "key", group_sum, 1000)), expected)
+    assert not in_memory.spilled
+
+    partitioner = HashPartitioner(20_000, fanout=4, tmp_dir=str(tmp_path))
+    rendered = list(partitioner.render(chunks(df, 1000), "key", group_sum, 700))
+    assert partitioner.spilled
+    assert all(len(x) <= 700 for x in rendered)
+    pd.testing.assert_frame_equal(pd.concat(rendered), expected)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_group_functions_stream_without_group_key(tmp_path):
+    input_file = str(tmp_path / "shuffled.csv")
+    SyntheticADT(3000, seed=1).frame().sample(frac=1, random_state=0).to_csv(input_file, index=False)
+    config = {
+        "nameSpace": {"pid": "pat_id"},
+        "columnOptions": [
+            {"name": "lot1", "dtype": "date"},
+            {"name": "lot", "dtype": "int"},
+            {"name": "country", "dtype": "cat", "filters": {"__ne__": "es"}},
+            {"name": "next_lot1", "create_func": "next_lot_date", "create_args": ["lot", "lot1", "pid"]},
+        ],
+    }
+    expected = StackHandler(input_file)
+    expected.load(copy.deepcopy(config))
+
+    sh = StackHandler(input_file, chunksize=500, memory_budget=50_000, spill_dir=str(tmp_path))
+    sh.load(copy.deepcopy(config))
+    rendered = pd.concat(list(sh.iter_render()))
+    pd.testing.assert_frame_equal(rendered, expected.df, check_categorical=False)
+    assert len(sh.df) == 0 and list(sh.df.columns) == list(expected.df.columns)
+
+    # every consumer of the stream writes the merged rows
+    sh.render_to_csv(str(tmp_path / "out.csv"))
+    written = pd.read_csv(tmp_path / "out.csv")
+    assert len(written) == len(expected.df) and written["pat_id"].tolist() == expected.df["pat_id"].tolist()
+    paths = sh.render_to_file(str(tmp_path / "out.feather"))
+    written = pd.read_feather(paths[0])
+    pd.testing.assert_frame_equal(written, expected.df.reset_index(drop=True), check_categorical=False)
@@ -0,0 +1,192 @@
+import copy
+import os
+import pandas as pd
+import pytest
+import column_options
+from spill import HashPartitioner
+
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), "inputs", "test-col-ops.csv")
+
+payload = {
+    "nameSpace": {"pid": "pat_id"},
+    "columnOptions": [
+        {"name": "pat_id", "dtype": "str"},
+        {"name": "country", "dtype": "cat", "filters": {"__eq__": "gb"}},
+        {"name": "location_code", "dtype": "int"},
+        {"name": "dob", "dtype": "date"},
+        {"name": "lot1", "dtype": "date"},
+        {
+            "name": "age_at_lot1",
+            "dtype": "float",
+            "create_func": "get_age_float",
+            "create_args": ["lot1", "dob"],
+            "bins": {"<30": "(..30)", "30+": "[30..]"},
+        },
+    ],
+}
+
+
+def render(config):
+    sh = column_options.StackHandler(INPUT_FILE)
+    sh.load(copy.deepcopy(config))
+    return sh.df
+
+
+def test_update_recomputes_only_changes():
+    sh = column_options.StackHandler(INPUT_FILE)
+    sh.update(copy.deepcopy(payload))
+    pd.testing.assert_frame_equal(sh.df, render(payload))
+
+    config = copy.deepcopy(payload)
+    config["columnOptions"][1]["filters"] = {}
+    config["columnOptions"][5]["bins"] = {"<40": "(..40)", "40+": "[40..]"}
+    changes = sh.update(config)
+    assert changes["filters"] == {"country"}
+    assert changes["bins"] == {"age_at_lot1"}
+    assert not changes["values"]
+    assert "fr" in list(sh.df["country"])
+    pd.testing.assert_frame_equal(sh.df, render(config))
+
+    config["columnOptions"][2]["dtype"] = "str"
+    changes = sh.update(config)
+    assert changes["values"] == {"location_code"}
+    assert sh.df["location_code"][0] == "83476"
+
+
+def test_reload_starts_from_the_input():
+    sh = column_options.StackHandler(INPUT_FILE, keep_base=True)
+    sh.load(copy.deepcopy(payload))
+    config = copy.deepcopy(payload)
+    config["columnOptions"][3]["dtype"] = "str"
+    del config["columnOptions"][5]
+    sh.load(copy.deepcopy(config))
+    pd.testing.assert_frame_equal(sh.df, render(config))
+
+
+def test_stage_cache_reuses_columns(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = column_options.StackHandler(INPUT_FILE, cache_dir=cache_dir)
+    first.load(copy.deepcopy(payload))
+    assert first.stage_cache.info()["stages"]["typed"] == 5
+    files = [name for _, _, names in os.walk(cache_dir) for name in names if name != "index.json"]
+    assert files and all(name.endswith(".feather") for name in files)
+
+    second = column_options.StackHandler(INPUT_FILE, cache_dir=cache_dir, prune=True)
+    second.stack = second.stack.Schema().load(copy.deepcopy(payload))
+    second.execution_plan = second.plan()
+    second._refresh_cache_keys()
+    assert set(second._cached_sources()) == {"country", "location_code", "dob", "lot1"}
+    second.render()
+    columns = list(second.df.columns)
+    pd.testing.assert_frame_equal(second.df, first.df[columns])
+
+    config = copy.deepcopy(payload)
+    config["columnOptions"][5]["bins"] = {"<40": "(..40)", "40+": "[40..]"}
+    keys = first.stage_cache.column_keys(
+        config, INPUT_FILE, dtype_errors="raise", compact=False, float32=False, date_formats=None
+    )
+    assert keys[("age_at_lot1", "created")] == first.cache_keys[("age_at_lot1", "created")]
+    assert keys[("age_at_lot1", "binned")] != first.cache_keys[("age_at_lot1", "binned")]
+
+    # a frame has no input file to key the cache on
+    with pytest.raises(ValueError, match="cache_dir"):
+        column_options.StackHandler.from_frame(first.df, cache_dir=cache_dir)
+
+
+def test_chunked_render_skips_stage_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    expected = render(payload)
+    chunked = column_options.StackHandler(INPUT_FILE, chunksize=2, cache_dir=cache_dir)
+    chunked.load(copy.deepcopy(payload))
+    rendered = HashPartitioner.concat(list(chunked.iter_render()))
+    pd.testing.assert_frame_equal(rendered, expected, check_categorical=False)
+    assert chunked.stage_cache.info()["entries"] == 0
+
+    # entries of a whole-input render are not loaded into chunks either
+    cached = column_options.StackHandler(INPUT_FILE, cache_dir=cache_dir)
+    cached.load(copy.deepcopy(payload))
+    rendered = HashPartitioner.concat(list(chunked.iter_render(chunksize=2)))
+    pd.testing.assert_frame_equal(rendered, expected, check_categorical=False)
+
+
+def test_render_to_csv_writes_only_output_columns(tmp_path):
+    output_file = str(tmp_path / "out.csv")
+    config = copy.deepcopy(payload)
+    config["outputColumns"] = ["pid", "country", "age_at_lot1"]
+    sh = column_options.StackHandler(INPUT_FILE, chunksize=2)
+    sh.load(copy.deepcopy(config))
+    assert all(list(chunk.columns) == ["pid", "country", "age_at_lot1"] for chunk in sh.iter_render())
+    sh.render_to_csv(output_file)
+    written = pd.read_csv(output_file)
+    # no row labels and none of the intermediate columns
+    assert list(written.columns) == ["pid", "country", "age_at_lot1"]
+    assert written["pid"].tolist() == render(config)["pid"].tolist()
+
+
+def test_compact_render_keeps_values():
+    sh = column_options.StackHandler(INPUT_FILE, compact=True)
+    sh.load(copy.deepcopy(payload))
+    expected = render(payload)
+    assert sh.df["location_code"].dtype == "Int32"
+    assert sh.df["country"].dtype == "category"
+    pd.testing.assert_frame_equal(sh.df, expected, check_dtype=False)
+    assert sh.memory_per_row(sh.df)["location_code"] < sh.memory_per_row(expected)["location_code"]
+
+
+def test_bin_index_is_cached_until_rebinned(tmp_path):
+    input_file = tmp_path / "input.csv"
+    input_file.write_text("a,b\n1,x\n2,y\n3,x\n4,y\n5,x\n")
+    config = {
+        "columnOptions": [
+            {"name": "a", "dtype": "int", "bins": {"low": "[1..3)", "high": "[3..]"}},
+            {"name": "b", "dtype": "cat", "bins": {"x": "[x]", "y": "[y]"}},
+        ]
+    }
+    sh = column_options.StackHandler(str(input_file))
+    sh.update(copy.deepcopy(config))
+    index = sh.bin_index("a")
+    assert sh.bin_index("a") is index
+    assert sh.bin_counts("a").to_dict() == {"low": 2, "high": 3}
+    assert sh.bin_crosstab("a", "b").to_dict() == {"x": {"low": 1, "high": 2}, "y": {"low": 1, "high": 1}}
+
+    config["columnOptions"][1]["filters"] = {"__eq__": "x"}
+    sh.update(copy.deepcopy(config))
+    assert sh.bin_counts("a").to_dict() == {"low": 1, "high": 2}
+
+    config["columnOptions"][0]["bins"] = {"low": "[1..4)", "high": "[4..]"}
+    sh.update(copy.deepcopy(config))
+    assert sh.bin_counts("a").to_dict() == {"low": 2, "high": 1}
+
+
+def test_preview_scales_sample_counts_to_the_input(tmp_path, monkeypatch):
+    from benchmark import CONFIG
+    from synthetic_data import SyntheticADT
+
+    input_file = str(tmp_path / "input.csv")
+    SyntheticADT(4000, seed=3).write_csv(input_file)
+    full = column_options.StackHandler(input_file)
+    full.load(copy.deepcopy(CONFIG))
+
+    sh = column_options.StackHandler(input_file, prune=True)
+    renders = []
+    render_sample = column_options.StackHandler.render
+    monkeypatch.setattr(column_options.StackHandler, "render", lambda self: renders.append(self) or render_sample(self))
+    preview = sh.preview(copy.deepcopy(CONFIG), fraction=0.25)
+    # one timed and one traced render of the sample
+    assert len(renders) == 2
+    assert preview["rows"] == 4000 and preview["key"] == "pat_id"
+    assert round(preview["sample_rows"] * preview["scale"]) == 4000
+    assert not sh.loaded
+
+    sample = preview["sample"]
+    assert set(sample["pid"]) == set(full.df.loc[sample.index, "pid"])
+    pd.testing.assert_frame_equal(sample, full.df.loc[sample.index])
+    assert abs(preview["rows_out"] - len(full.df)) < 0.1 * len(full.df)
+    high = full.df["location_code"].eq("high").sum()
+    assert abs(preview["bins"]["location_code"]["high"] - high) < 0.2 * high
+    assert preview["filters"]["country"]["__ne__ es"] == preview["rows_out"]
+    # the stages of a plain render, not of an incremental one
+    stages = {x["stage"] for x in preview["stages"]}
+    assert stages >= {"apply_dtypes", "create_cols", "apply_filters", "apply_bins"} and "materialize" not in stages
+    assert all(x["seconds"] >= 0 and x["bytes_allocated"] >= 0 for x in preview["stages"])
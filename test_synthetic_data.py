@@ -0,0 +1,33 @@
+import os
+import pandas as pd
+from dtype_converter import DtypeConverter
+from synthetic_data import SyntheticADT
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "inputs", "test-col-ops.csv")
+
+
+def test_shape_and_groups(monkeypatch):
+    monkeypatch.setattr(SyntheticADT, "BLOCK_ROWS", 400)
+    df = SyntheticADT(1000, seed=3).frame()
+    assert len(df) == 1000 and list(df.index) == list(range(1000))
+    assert set(pd.read_csv(FIXTURE, nrows=0).columns) <= set(df.columns)
+
+    assert df["pat_id"].is_monotonic_increasing
+    lots = df.groupby("pat_id")["lot"]
+    assert (lots.min() == 1).all() and (lots.max() == lots.count()).all()
+    assert (df.groupby("pat_id")["country"].nunique() == 1).all()
+    assert (df.groupby("pat_id")["lot"].count() > 1).any()
+
+    iso = df["lot1"].str.fullmatch(r"\d{4}-\d{2}-\d{2}")
+    assert 0 < (~iso).sum() < len(df) / 2
+    assert DtypeConverter.convert(df["lot1"], "date").notnull().all()
+
+
+def test_seeded(tmp_path):
+    pd.testing.assert_frame_equal(SyntheticADT(500, seed=1).frame(), SyntheticADT(500, seed=1).frame())
+    assert not SyntheticADT(500, seed=1).frame().equals(SyntheticADT(500, seed=2).frame())
+
+    path = str(tmp_path / "adt.csv")
+    SyntheticADT(500, seed=1).write_csv(path)
+    assert len(pd.read_csv(path)) == 500
@@ -0,0 +1,70 @@
+import copy
+import pandas as pd
+import pytest
+from column_options import StackHandler
+from compiled_plan import CompiledPlan
+from table_index import TableIndex
+
+
+@pytest.fixture
+def files(tmp_path):
+    lines = pd.DataFrame(
+        {
+            "pat_id": ["p1", "p1", "p2", "p3", "p3", "p4"],
+            "lot": [1, 2, 1, 1, 2, 1],
+        }
+    )
+    labs = pd.DataFrame(
+        {
+            "pat_id": ["p1", "p2", "p1", "p3", "p1", None],
+            "test": ["hba1c", "hba1c", "ldl", "ldl", "hba1c", "hba1c"],
+            "result": [6.1, 7.2, 3.3, 2.9, 6.4, 9.9],
+            "taken": ["2020-01-01", "2020-02-01", "2020-03-01", "2020-04-01", "2020-05-01", "2020-06-01"],
+        }
+    )
+    paths = {"lines": str(tmp_path / "lines.csv"), "labs": str(tmp_path / "labs.csv")}
+    lines.to_csv(paths["lines"], index=False)
+    labs.to_csv(paths["labs"], index=False)
+    return paths
+
+
+def test_picks_rows_by_key(files):
+    table = TableIndex(files["labs"], "pat_id", dtypes={"taken": "date"})
+    keys = pd.Series(["p3", "p1", "p4", None], index=[10, 11, 12, 13])
+    assert list(table.positions(keys)) == [3, 4, -1, -1]
+    assert list(table.positions(keys, pick="first")) == [3, 0, -1, -1]
+    assert list(table.positions(keys, where=("test", "hba1c"))) == [-1, 4, -1, -1]
+
+    taken = table.take("taken", table.positions(keys), keys.index)
+    assert list(taken.index) == [10, 11, 12, 13]
+    assert taken[11] == pd.Timestamp("2020-05-01") and taken.isnull().sum() == 2
+    # only the key and the columns asked for are read
+    assert set(table._columns) == {"pat_id", "test", "taken"}
+
+
+def test_stack_joins_secondary_tables(files):
+    config = {
+        "tables": {"labs": {"input_file": files["labs"], "key": "pat_id"}},
+        "columnOptions": [
+            {"name": "lot", "dtype": "int"},
+            {"name": "last_result", "create_func": "lookup", "create_args": ["pat_id"],
+             "create_kwargs": {"table": "labs", "column": "result"}},
+            {"name": "hba1c", "create_func": "value_at_key", "create_args": ["pat_id"],
+             "create_kwargs": {"table": "labs", "column": "result", "match_column": "test", "match_value": "hba1c"}},
+        ],
+    }
+    sh = StackHandler(files["lines"])
+    sh.load(CompiledPlan.compile(copy.deepcopy(config)))
+    assert sh.df["last_result"].tolist()[:4] == [6.4, 6.4, 7.2, 2.9]
+    assert sh.df["hba1c"].isnull().tolist() == [False, False, False, True, True, True]
+
+    chunked = StackHandler(files["lines"], chunksize=2)
+    chunked.load(copy.deepcopy(config))
+    pd.testing.assert_frame_equal(pd.concat(list(chunked.iter_render())), sh.df)
+    # one index for every chunk
+    assert list(chunked.table_indexes) == ["labs"]
+
+    config["columnOptions"][1]["create_kwargs"]["table"] = "labz"
+    config["tables"]["labs"]["colour"] = "red"
+    with pytest.raises(ValueError, match="table `labz` is not declared(.|\n)*options \\['colour'\\] are not known"):
+        CompiledPlan.compile(config)
@@ -24,6 +24,21 @@ class TypeInfo:
         "cat": lambda x: x,
     }
 
+    # formats tried vectorized, in this order, before falling back to per-value parsing:
+    # ambiguous day/month strings are read month first, as `pd.to_datetime` reads them in the fallback
+    DATE_FORMATS = [
+        "%Y-%m-%d",
+        "%Y-%m-%d %H:%M:%S",
+        "%Y/%m/%d",
+        "%Y.%m.%d",
+        "%m/%d/%Y",
+        "%d/%m/%Y",
+        "%m.%d.%Y",
+        "%d.%m.%Y",
+        "%m-%d-%Y",
+        "%d-%m-%Y",
+    ]
+
     DTYPE_MAP_REV = {
         type(1): "int",
         type("str"): "str",